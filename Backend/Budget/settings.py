@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from importlib.util import find_spec
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'finance.metrics.collect_metrics',  # outermost so latency covers the whole stack
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # must be as high as possible
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'finance.views.log_activity',
+    'finance.routers.pin_recent_writers',
 ]
 
 ROOT_URLCONF = 'Budget.urls'
@@ -82,10 +85,49 @@ WSGI_APPLICATION = 'Budget.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DB_PATH') or BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Read replicas (comma-separated SQLite paths locally; point at real replicas in production).
+# Summary/report/export and list/retrieve reads go to these via finance.routers.
+DATABASE_REPLICAS = []
+for _i, _path in enumerate(p for p in os.environ.get('DB_REPLICA_PATHS', '').split(',') if p.strip()):
+    _alias = f'replica_{_i}'
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path.strip(),
+    }
+    DATABASE_REPLICAS.append(_alias)
+
+# Per-user shards (comma-separated SQLite paths locally). Each user's finance rows live on
+# one shard; default keeps users, profiles and the shard directory. Keep the order stable:
+# a shard's position sets its id range. Run `manage.py migrate --database shard_N` per shard.
+DATABASE_SHARDS = []
+for _i, _path in enumerate(p for p in os.environ.get('DB_SHARD_PATHS', '').split(',') if p.strip()):
+    _alias = f'shard_{_i}'
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path.strip(),
+    }
+    DATABASE_SHARDS.append(_alias)
+
+DATABASE_ROUTERS = ['finance.routers.ShardRouter', 'finance.routers.ReadReplicaRouter']
+
+# Seconds a user's shard lookup is cached; a move waits this long between its steps.
+SHARD_DIRECTORY_CACHE_SECONDS = int(os.environ.get('SHARD_DIRECTORY_CACHE_SECONDS', '5'))
+
+# Seconds a user stays pinned to the primary after a write (read-your-writes).
+REPLICA_READ_YOUR_WRITES_SECONDS = int(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', '5'))
+
+# Where those pins live; every worker must see them (see finance.routers). With web
+# workers on several hosts use {'BACKEND': 'cache', 'ALIAS': ...} on a shared cache.
+REPLICA_PIN_STORE = {
+    'BACKEND': os.environ.get('REPLICA_PIN_BACKEND', 'sqlite'),
+    'PATH': os.environ.get('REPLICA_PIN_DB_PATH', str(BASE_DIR / 'replica_pins.sqlite3')),
+    'ALIAS': os.environ.get('REPLICA_PIN_CACHE_ALIAS', 'default'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,9 +170,64 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Retention for the append-only log tables (see finance.retention / prune_logs command).
+FINANCE_RETENTION_DAYS = {
+    'UserActivity': int(os.environ.get('ACTIVITY_RETENTION_DAYS', '90')),
+    'AuditLog': int(os.environ.get('AUDIT_RETENTION_DAYS', '365')),
+}
+FINANCE_ARCHIVE_DIR = Path(os.environ.get('FINANCE_ARCHIVE_DIR', BASE_DIR / 'archive'))
+
+# Bulk provisioning hashes passwords in a process pool; tiny batches are hashed inline.
+PROVISIONING_HASH_WORKERS = int(os.environ.get('PROVISIONING_HASH_WORKERS', '0')) or None
+PROVISIONING_INLINE_HASH_MAX = 4
+
+# Worker processes for the nightly statement build (finance.statements); unset uses one per CPU.
+STATEMENT_WORKERS = int(os.environ.get('STATEMENT_WORKERS', '0')) or None
+
 # Mobile API Key (header: X-Mobile-API-Key). Override in production via env var.
 MOBILE_API_KEY = os.environ.get('MOBILE_API_KEY', 'dev-mobile-key-change-me')
 
+# Token for scraping /api/metrics/, sent in X-Metrics-Token (staff users may also read it). Unset disables token access.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Transactions this many local days apart can still be flagged as duplicates (finance.duplicates).
+DUPLICATE_WINDOW_DAYS = int(os.environ.get('DUPLICATE_WINDOW_DAYS', '1'))
+
+# A request repeating one SQL shape this many times is reported as an N+1 suspect.
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '5'))
+
+# Microseconds the metrics middleware may add to a request (finance.benchmark.measure_metrics_overhead).
+METRICS_OVERHEAD_BUDGET_US = int(os.environ.get('METRICS_OVERHEAD_BUDGET_US', '50'))
+
+# Cold-start budget: a fresh worker must answer its first /api/health/ within this (finance.benchmark.measure_startup).
+STARTUP_BUDGET_MS = int(os.environ.get('STARTUP_BUDGET_MS', '1500'))
+
+# Per-user transaction categorizer (see finance.categorizer): models held in an in-process LRU.
+CATEGORIZER_CACHE_SIZE = int(os.environ.get('CATEGORIZER_CACHE_SIZE', '256'))
+CATEGORIZER_REFRESH_SECONDS = float(os.environ.get('CATEGORIZER_REFRESH_SECONDS', '30'))
+CATEGORIZER_MIN_EXAMPLES = 5
+# Newest labeled transactions a model trains on (bounds training on a cache miss).
+CATEGORIZER_MAX_EXAMPLES = int(os.environ.get('CATEGORIZER_MAX_EXAMPLES', '5000'))
+CATEGORIZER_MIN_CONFIDENCE = 0.6
+
+# Background tasks (see finance.taskqueue / run_worker command). Eager mode runs tasks inline.
+FINANCE_TASKS_EAGER = os.environ.get('FINANCE_TASKS_EAGER', '0') == '1'
+FINANCE_TASK_RETENTION_DAYS = int(os.environ.get('FINANCE_TASK_RETENTION_DAYS', '7'))
+# Periodic task interval overrides in seconds, by task name; None disables a schedule.
+FINANCE_TASK_SCHEDULES = {}
+
+# How long a write's Idempotency-Key replays its stored response (see finance.idempotency).
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 3600)))
+
+# Live change events for /api/events/ (see finance.events). 'local' reaches streams in this process only;
+# use 'sqlite' (a shared file, like the throttle store) when several workers serve streams.
+EVENTS_BACKEND = {
+    'BACKEND': os.environ.get('EVENTS_BACKEND', 'local'),
+    'PATH': os.environ.get('EVENTS_DB_PATH', str(BASE_DIR / 'events.sqlite3')),
+}
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE_SECONDS = 15
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -140,8 +237,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'finance.throttling.UserTokenBucketThrottle',
+        'finance.throttling.AnonTokenBucketThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
         'user': '1000/day',
@@ -154,8 +251,31 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
+    # orjson/msgpack are optional; finance.renderers falls back to DRF's JSON encoder.
+    'DEFAULT_RENDERER_CLASSES': (
+        'finance.renderers.FastJSONRenderer',
+        *(('finance.renderers.MessagePackRenderer',) if find_spec('msgpack') else ()),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(('finance.renderers.MessagePackParser',) if find_spec('msgpack') else ()),
+    ),
 }
 
+# Token-bucket state shared by all workers (see finance.throttling). Use
+# {'BACKEND': 'cache', 'ALIAS': ...} to keep buckets in a shared Django cache instead.
+THROTTLE_STORE = {
+    'BACKEND': os.environ.get('THROTTLE_BACKEND', 'sqlite'),
+    'PATH': os.environ.get('THROTTLE_DB_PATH', str(BASE_DIR / 'throttle.sqlite3')),
+    'ALIAS': os.environ.get('THROTTLE_CACHE_ALIAS', 'default'),
+}
+
+# Tests keep throttle buckets and replica pins in the cache instead of the shared stores.
+TEST_RUNNER = 'Budget.test_runner.FinanceTestRunner'
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
@@ -184,7 +304,7 @@ if DEBUG:
 
 CORS_ALLOW_HEADERS = [
     'authorization', 'content-type', 'x-mobile-api-key', 'accept', 'origin',
-    'user-agent', 'dnt', 'cache-control', 'x-requested-with'
+    'user-agent', 'dnt', 'cache-control', 'x-requested-with', 'idempotency-key',
 ]
 
-CORS_EXPOSE_HEADERS = ['content-type']
+CORS_EXPOSE_HEADERS = ['content-type', 'idempotent-replayed']
@@ -0,0 +1,28 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class FinanceTestRunner(DiscoverRunner):
+    """Keep throttle buckets and replica pins in the test process's cache, never in the shared SQLite stores.
+
+    Test user ids repeat across runs, so state written to ``throttle.sqlite3`` or
+    ``replica_pins.sqlite3`` would outlive the run and leak into the dev server
+    (and the next run).
+
+    Replicas and shards configured through ``DB_REPLICA_PATHS``/``DB_SHARD_PATHS``
+    are switched off too, so every user lives on and reads from the test database
+    the case declared. The replica and shard tests build their own SQLite files
+    (``ReplicaTrafficTests``, ``ShardingTests``).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._shared_stores = override_settings(
+            THROTTLE_STORE={'BACKEND': 'cache'}, REPLICA_PIN_STORE={'BACKEND': 'cache'},
+            DATABASE_REPLICAS=[], DATABASE_SHARDS=[],
+        )
+        self._shared_stores.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._shared_stores.disable()
+        super().teardown_test_environment(**kwargs)
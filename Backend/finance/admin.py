@@ -1,6 +1,180 @@
+from datetime import datetime, timedelta
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, models as db_models, router
+from django.utils import timezone
+from django.utils.functional import cached_property
+
 from . import models
 
+CURSOR_VAR = "cursor"
+
+
+def estimate_row_count(model):
+	"""Cheap table row estimate from planner statistics, or None when unavailable."""
+	connection = connections[router.db_for_read(model)]
+	table = model._meta.db_table
+	with connection.cursor() as cursor:
+		if connection.vendor == "postgresql":
+			cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+		elif connection.vendor == "mysql":
+			cursor.execute(
+				"SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+				[table],
+			)
+		elif connection.vendor == "sqlite":
+			# No statistics without ANALYZE; the rowid span is two index probes and an upper bound.
+			quoted = connection.ops.quote_name(table)
+			cursor.execute(f"SELECT (SELECT MAX(rowid) FROM {quoted}) - (SELECT MIN(rowid) FROM {quoted}) + 1")
+		else:
+			return None
+		row = cursor.fetchone()
+	if not row or row[0] is None or row[0] < 0:
+		return None
+	return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+	"""Unfiltered changelists use the table estimate; filtered ones count at most ``count_cap`` rows."""
+
+	exact_below = 10000
+	count_cap = 10000
+	estimated = False
+
+	@cached_property
+	def count(self):
+		queryset = self.object_list
+		if not queryset.query.where:
+			estimate = estimate_row_count(queryset.model)
+			if estimate is not None and estimate >= self.exact_below:
+				self.estimated = True
+				return estimate
+		capped = queryset.order_by()[: self.count_cap + 1].count()
+		if capped > self.count_cap:
+			self.estimated = True
+			return self.count_cap
+		return capped
+
+
+class ProbedDatesQuerySet(db_models.QuerySet):
+	"""``dates()``/``datetimes()`` for the date hierarchy without a ``SELECT DISTINCT`` over the range.
+
+	Reads MIN/MAX of the field, then issues one indexed EXISTS probe per candidate
+	year, month or day between them (at most a few dozen per drill-down level).
+	"""
+
+	def datetimes(self, field_name, kind, order="ASC", tzinfo=None):
+		if kind not in ("year", "month", "day"):
+			return super().datetimes(field_name, kind, order, tzinfo)
+		return self._probe(field_name, kind, order, aware=True)
+
+	def dates(self, field_name, kind, order="ASC"):
+		if kind not in ("year", "month", "day"):
+			return super().dates(field_name, kind, order)
+		return self._probe(field_name, kind, order, aware=False)
+
+	def _probe(self, field_name, kind, order, aware):
+		bounds = self.aggregate(first=db_models.Min(field_name), last=db_models.Max(field_name))
+		first, last = bounds["first"], bounds["last"]
+		if first is None:
+			return []
+		if aware:
+			first, last = timezone.localtime(first), timezone.localtime(last)
+		start = datetime(first.year, first.month if kind != "year" else 1, first.day if kind == "day" else 1)
+		found = []
+		while start.date() <= (last.date() if isinstance(last, datetime) else last):
+			if kind == "year":
+				end = start.replace(year=start.year + 1)
+			elif kind == "month":
+				end = (start + timedelta(days=32)).replace(day=1)
+			else:
+				end = start + timedelta(days=1)
+			lo, hi = (timezone.make_aware(start), timezone.make_aware(end)) if aware else (start.date(), end.date())
+			if self.filter(**{f"{field_name}__gte": lo, f"{field_name}__lt": hi}).exists():
+				found.append(lo)
+			start = end
+		return found[::-1] if order == "DESC" else found
+
+
+class KeysetChangeList(ChangeList):
+	"""Pages newest-first by ``?cursor=<value>|<pk>`` instead of OFFSET; falls back when sorting by a column."""
+
+	def __init__(self, request, *args, **kwargs):
+		self.cursor = request.GET.get(CURSOR_VAR)
+		self.keyset = False
+		super().__init__(request, *args, **kwargs)
+
+	def get_filters_params(self, params=None):
+		lookup_params = super().get_filters_params(params)
+		lookup_params.pop(CURSOR_VAR, None)
+		return lookup_params
+
+	def get_query_string(self, new_params=None, remove=None):
+		# Filters, searches and sorts restart from the first page.
+		return super().get_query_string(new_params, [*(remove or []), CURSOR_VAR])
+
+	def get_results(self, request):
+		field_name = self.model_admin.keyset_field
+		if ORDER_VAR in self.params or self.show_all:
+			return super().get_results(request)
+		field = self.opts.get_field(field_name)
+		queryset = self.queryset.order_by(f"-{field_name}", "-pk")
+		if self.cursor:
+			try:
+				raw_value, raw_pk = self.cursor.rsplit("|", 1)
+				value, pk = field.to_python(raw_value), int(raw_pk)
+			except (ValueError, TypeError, ValidationError):
+				value = pk = None
+			if value is None:
+				raise admin.options.IncorrectLookupParameters("Invalid cursor")
+			if isinstance(value, datetime) and timezone.is_naive(value):
+				value = timezone.make_aware(value)
+			queryset = queryset.filter(
+				db_models.Q(**{f"{field_name}__lt": value}) | db_models.Q(**{field_name: value, "pk__lt": pk})
+			)
+		result_list = queryset[: self.list_per_page]
+		rows = list(result_list)  # fills the sliced queryset's cache for the template
+		has_next = len(rows) == self.list_per_page and queryset[self.list_per_page:self.list_per_page + 1].exists()
+
+		self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+		self.result_count = self.paginator.count
+		self.full_result_count = None
+		self.show_full_result_count = False
+		self.show_admin_actions = True
+		self.result_list = result_list
+		self.can_show_all = False
+		self.multi_page = has_next or bool(self.cursor)
+		self.keyset = True
+		self.first_page_url = self.get_query_string() if self.cursor else None
+		self.next_page_url = None
+		if has_next:
+			last = rows[-1]
+			value = field.value_to_string(last)
+			self.next_page_url = self.get_query_string({CURSOR_VAR: f"{value}|{last.pk}"})
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+	"""Changelist settings for tables with millions of rows.
+
+	Estimated counts, no full-result count or facet counts, keyset pagination on
+	``keyset_field`` (descending) and a probe-based date hierarchy.
+	"""
+
+	keyset_field = None
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+	show_facets = admin.ShowFacets.NEVER
+
+	def get_changelist(self, request, **kwargs):
+		return KeysetChangeList
+
+	def get_queryset(self, request):
+		queryset = super().get_queryset(request)
+		return ProbedDatesQuerySet(model=queryset.model, query=queryset.query.chain(), using=queryset._db, hints=queryset._hints)
+
 
 @admin.register(models.UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -28,11 +202,41 @@ class BudgetAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdmin):
 	list_display = ("user", "account", "direction", "amount", "currency", "txn_time", "is_pending")
 	list_filter = ("direction", "is_pending")
+	list_select_related = ("user", "account")
+	raw_id_fields = ("user", "account", "category", "transfer_peer")
 	search_fields = ("description", "merchant", "external_id")
 	date_hierarchy = "txn_time"
+	keyset_field = "txn_time"
+
+
+@admin.register(models.BalanceSnapshot)
+class BalanceSnapshotAdmin(LargeTableAdmin):
+	list_display = ("date", "user", "account", "balance")
+	list_select_related = ("user", "account")
+	raw_id_fields = ("user", "account")
+	date_hierarchy = "date"
+	keyset_field = "date"
+
+
+@admin.register(models.JobWatermark)
+class JobWatermarkAdmin(admin.ModelAdmin):
+	list_display = ("name", "through")
+
+
+@admin.register(models.Merchant)
+class MerchantAdmin(admin.ModelAdmin):
+	list_display = ("name", "key", "created_at")
+	search_fields = ("name", "key")
+
+
+@admin.register(models.MerchantSpend)
+class MerchantSpendAdmin(admin.ModelAdmin):
+	list_display = ("month", "user", "merchant", "spent", "txn_count")
+	list_select_related = ("user", "merchant")
+	raw_id_fields = ("user", "merchant")
 
 
 @admin.register(models.Goal)
@@ -55,14 +259,37 @@ class InsightAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(LargeTableAdmin):
 	list_display = ("timestamp", "user", "action", "model_name", "object_id")
 	list_filter = ("action", "model_name")
+	list_select_related = ("user",)
+	raw_id_fields = ("user",)
 	search_fields = ("model_name", "object_id")
+	date_hierarchy = "timestamp"
+	keyset_field = "timestamp"
 
 
 @admin.register(models.UserActivity)
-class UserActivityAdmin(admin.ModelAdmin):
+class UserActivityAdmin(LargeTableAdmin):
 	list_display = ("timestamp", "user", "method", "path", "ip")
 	list_filter = ("method",)
+	list_select_related = ("user",)
+	raw_id_fields = ("user",)
+	date_hierarchy = "timestamp"
+	keyset_field = "timestamp"
+
+
+
+@admin.register(models.Task)
+class TaskAdmin(admin.ModelAdmin):
+	list_display = ("id", "name", "status", "run_at", "attempts", "locked_by", "duration", "finished_at")
+	list_filter = ("status", "name")
+	search_fields = ("name", "dedupe_key")
+	readonly_fields = ("started_at", "finished_at", "duration", "last_error", "created_at")
+
 
+@admin.register(models.UserShard)
+class UserShardAdmin(admin.ModelAdmin):
+	list_display = ("user", "alias", "moving", "updated_at")
+	list_filter = ("alias", "moving")
+	raw_id_fields = ("user",)
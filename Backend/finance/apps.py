@@ -6,9 +6,9 @@ class FinanceConfig(AppConfig):
     name = 'finance'
 
     def ready(self):
-        # Import signals to connect them
+        # Import signals and sharding to connect their receivers, and tasks to register them with the queue
         try:
-            from . import signals  # noqa: F401
+            from . import sharding, signals, tasks  # noqa: F401
         except Exception:
             # Avoid crashing on migrations where app registry not fully ready
             pass
@@ -0,0 +1,195 @@
+"""Async variants of the read-heavy dashboard endpoints for ASGI deployments.
+
+DRF's ``APIView`` is sync-only, so these are plain Django async views that mirror
+the DRF request pipeline: JWT authentication (token validation is CPU-only, the
+user lookup uses the async ORM), the same permission classes, the configured
+throttles and replica routing. Independent queries run concurrently, each in its
+own worker thread and database connection, so one dashboard load costs roughly
+the slowest query instead of their sum and the event loop is never blocked.
+Queries go to the user's shard, as in ``UserShardMixin``.
+
+Responses go through ``FastJSONRenderer`` so bodies match the sync views.
+``EventStreamView`` is the Server-Sent Events stream of ``finance.events``.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import events
+from .renderers import FastJSONRenderer
+from .permissions import HasMobileApiKey, IsAuthenticatedOrOptions
+from .reports import (
+    budget_progress_row, budget_spent, budgets_queryset, category_spending_queryset, summary_parts, summary_payload,
+)
+from .routers import db_for_user, has_recent_write, replica_aliases, shard_aliases, use_replica, use_shard
+
+# Upper bound on concurrent per-budget queries for one request.
+MAX_CONCURRENT_QUERIES = 8
+
+
+def _json(data, status=200, headers=None):
+    response = HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+    for key, value in (headers or {}).items():
+        response[key] = value
+    return response
+
+
+def run_query(fn):
+    """Run a blocking ORM callable in its own thread and connection; closes it afterwards."""
+    def call():
+        try:
+            return fn()
+        finally:
+            connections.close_all()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated = self.get_validated_token(raw_token)
+        try:
+            user_id = validated[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise exceptions.InvalidToken('Token contained no recognizable user identification')
+        try:
+            user = await self.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise exceptions.AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+        return user, validated
+
+
+class AsyncAPIView(View):
+    """Minimal async counterpart of the finance ``APIView`` setup."""
+
+    authentication_class = AsyncJWTAuthentication
+    permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
+    replica_reads = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await self.initial(request)
+        except exceptions.APIException as exc:
+            headers = {}
+            if isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+                headers['Retry-After'] = str(int(exc.wait))
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                headers['WWW-Authenticate'] = 'Bearer realm="api"'
+            return _json({'detail': exc.detail}, status=exc.status_code, headers=headers)
+        if request.method == 'OPTIONS':
+            return await super().dispatch(request, *args, **kwargs)
+        shard = await sync_to_async(db_for_user)(request.user.id) if shard_aliases() else None
+        with use_shard(shard):
+            if self.replica_reads and replica_aliases() and not has_recent_write(request.user.id):
+                with use_replica():
+                    return await super().dispatch(request, *args, **kwargs)
+            return await super().dispatch(request, *args, **kwargs)
+
+    async def initial(self, request):
+        auth = await self.authentication_class().aauthenticate(request) if request.method != 'OPTIONS' else None
+        request.user = auth[0] if auth else AnonymousUser()
+        for permission in (cls() for cls in self.permission_classes):
+            if not permission.has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+        await sync_to_async(self.check_throttles)(request)
+
+    def check_throttles(self, request):
+        waits = []
+        throttled = False
+        for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES):
+            if not throttle.allow_request(request, self):
+                throttled = True
+                waits.append(throttle.wait())
+        if throttled:
+            raise exceptions.Throttled(max((w for w in waits if w is not None), default=None))
+
+    async def options(self, request, *args, **kwargs):
+        response = HttpResponse()
+        response['Allow'] = ', '.join(self._allowed_methods())
+        return response
+
+
+class AsyncSummaryView(AsyncAPIView):
+    async def get(self, request):
+        parts = summary_parts(request.user)
+        results = await asyncio.gather(*(run_query(query) for query in parts.values()))
+        return _json(summary_payload(**dict(zip(parts, results))))
+
+
+class AsyncCategorySpendingReportView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            qs = category_spending_queryset(request.user, request.GET.get('start'), request.GET.get('end'))
+        except ValueError:
+            return _json({'detail': 'Dates must be YYYY-MM-DD.'}, status=400)
+        return _json([row async for row in qs])
+
+
+class AsyncBudgetProgressView(AsyncAPIView):
+    async def get(self, request):
+        user = request.user
+        budgets = [b async for b in budgets_queryset(user, request.GET.get('start'), request.GET.get('end'))]
+        gate = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+
+        async def spent(budget):
+            async with gate:
+                return await run_query(lambda: budget_spent(user, budget))
+
+        totals = await asyncio.gather(*(spent(b) for b in budgets))
+        return _json([budget_progress_row(b, total) for b, total in zip(budgets, totals)])
+
+
+class EventStreamView(AsyncAPIView):
+    """``text/event-stream`` of the user's live change events (see ``finance.events``).
+
+    ASGI only: under WSGI Django drains an async stream into a list before sending
+    it, which never finishes here, so WSGI requests get 501.
+    """
+
+    replica_reads = False
+    streaming = True  # never completes; benchmarks skip it
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return _json({'detail': 'The event stream needs an ASGI server.'}, status=501)
+        response = StreamingHttpResponse(self.stream(request.user.pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+        return response
+
+    async def stream(self, user_id):
+        keepalive = getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 15)
+        sub = events.hub.subscribe(user_id)
+        events.get_backend().start()
+        try:
+            yield b'retry: 5000\n\n'
+            seq = 0
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+                    continue
+                seq += 1
+                yield events.format_event(seq, event)
+        finally:
+            events.hub.unsubscribe(sub)
@@ -1,18 +1,35 @@
+import threading
+
 from django.contrib.auth import get_user_model
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
 
-try:
-    import firebase_admin
-    from firebase_admin import auth as fb_auth
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app()
-    _FIREBASE_AVAILABLE = True
-except Exception:
-    _FIREBASE_AVAILABLE = False
-
 User = get_user_model()
 
+_firebase_lock = threading.Lock()
+_firebase_auth = None  # firebase_admin.auth once initialized; False if Firebase is unavailable
+
+
+def firebase_auth():
+    """``firebase_admin.auth``, importing and initializing the SDK on first use; ``None`` if unavailable.
+
+    Deferred so worker startup never pays for the SDK import or the credential
+    lookup; only the first request carrying a bearer token does.
+    """
+    global _firebase_auth
+    if _firebase_auth is None:
+        with _firebase_lock:
+            if _firebase_auth is None:
+                try:
+                    import firebase_admin
+                    from firebase_admin import auth
+                    if not firebase_admin._apps:
+                        firebase_admin.initialize_app()
+                    _firebase_auth = auth
+                except Exception:
+                    _firebase_auth = False
+    return _firebase_auth or None
+
 
 class FirebaseAuthentication(BaseAuthentication):
     """Authenticate requests bearing a Firebase ID token.
@@ -24,14 +41,15 @@ class FirebaseAuthentication(BaseAuthentication):
     www_authenticate_realm = 'api'
 
     def authenticate(self, request):
-        if not _FIREBASE_AVAILABLE:
-            return None
         auth_header = request.META.get('HTTP_AUTHORIZATION') or ''
         if not auth_header.startswith('Bearer '):
             return None
         token = auth_header[7:].strip()
         if not token:
             return None
+        fb_auth = firebase_auth()
+        if fb_auth is None:
+            return None
         try:
             decoded = fb_auth.verify_id_token(token)
         except Exception as e:
@@ -0,0 +1,329 @@
+"""Endpoint benchmark for the finance API.
+
+Drives every GET-able route in ``finance.urls`` through the DRF test client as a
+seeded user and records latency percentiles, SQL query counts and peak Python
+memory per route. ``benchmark_list_serialization`` times the transaction list's
+``values_list()`` path (``RowEncoder``) against ``TransactionSerializer``,
+``measure_metrics_overhead`` prices the ``collect_metrics`` middleware per request,
+and ``measure_startup`` times a cold worker up to its first ``/api/health/`` response.
+Reports are plain JSON so two runs can be diffed with ``compare_reports``.
+"""
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import urls as finance_urls
+from .metrics import MetricsRegistry, collect_metrics
+from .models import MonthlyStatement, Transaction
+from .renderers import FastJSONRenderer
+from .serializers import RowEncoder, TransactionSerializer
+
+
+class _QueryCounter:
+    """``execute_wrapper`` that survives the per-request reconnects CaptureQueriesContext does not."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _iter_patterns(patterns):
+    for p in patterns:
+        if isinstance(p, URLResolver):
+            yield from _iter_patterns(p.url_patterns)
+        elif isinstance(p, URLPattern):
+            yield p
+
+
+def discover_routes():
+    """Return ``[(name, url_kwarg, view_cls, supports_get)]`` for every named finance route.
+
+    ``url_kwarg`` is the route's path parameter (``'pk'``, ``'month'``) or ``None``.
+    """
+    routes = []
+    seen = set()
+    for p in _iter_patterns(finance_urls.urlpatterns):
+        groups = p.pattern.regex.groupindex
+        if not p.name or 'format' in groups or p.name in seen or p.name == 'api-root':
+            continue
+        seen.add(p.name)
+        cls = getattr(p.callback, 'cls', None) or getattr(p.callback, 'view_class', None)
+        actions = getattr(p.callback, 'actions', None)
+        supports_get = 'get' in actions if actions is not None else hasattr(cls, 'get')
+        routes.append((p.name, next(iter(groups), None), cls, supports_get))
+    return routes
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+_BENCH_METRICS_TOKEN = 'benchmark'
+
+
+def _client_for(user):
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}',
+        HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY,
+        HTTP_X_METRICS_TOKEN=_BENCH_METRICS_TOKEN,
+    )
+    return client
+
+
+def _detail_kwargs(url_kwarg, cls, user):
+    """URL kwargs naming one of ``user``'s objects for a detail route, or ``None`` if they have none."""
+    if url_kwarg == 'month':
+        month = MonthlyStatement.objects.filter(user=user).values_list('month', flat=True).first()
+        return {'month': f'{month:%Y-%m}'} if month else None
+    model = cls.serializer_class.Meta.model
+    pk = model.objects.filter(user=user).values_list('pk', flat=True).first()
+    return {'pk': pk} if pk is not None else None
+
+
+def measure_route(client, url, iterations=20, warmup=2):
+    for _ in range(warmup):
+        client.get(url)
+    timings = []
+    status = None
+    counter = _QueryCounter()
+    with connection.execute_wrapper(counter):
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            resp = client.get(url)
+            timings.append((time.perf_counter() - t0) * 1000)
+            status = resp.status_code
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': counter.count / iterations,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def benchmark_routes(user, iterations=20):
+    """Benchmark every finance route as ``user``; non-GET routes are listed as skipped."""
+    results = {}
+    client = _client_for(user)
+    # Benchmarks must not trip the production throttles.
+    # Views bind throttle classes at import time, so switch the rates off instead.
+    rates = {scope: None for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+    unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}
+    with override_settings(REST_FRAMEWORK=unthrottled, METRICS_TOKEN=_BENCH_METRICS_TOKEN):
+        for name, url_kwarg, cls, supports_get in discover_routes():
+            if not supports_get:
+                results[name] = {'skipped': 'no GET handler'}
+                continue
+            if getattr(cls, 'streaming', False):
+                results[name] = {'skipped': 'long-lived stream'}
+                continue
+            kwargs = {}
+            if url_kwarg:
+                kwargs = _detail_kwargs(url_kwarg, cls, user)
+                if kwargs is None:
+                    results[name] = {'skipped': 'no object to retrieve'}
+                    continue
+            results[name] = measure_route(client, reverse(name, kwargs=kwargs), iterations=iterations)
+    return results
+
+
+def benchmark_list_serialization(user, page_sizes=(25, 100, 500), iterations=20):
+    """Median ms to fetch and render ``user``'s newest transactions per page size, both ways.
+
+    Returns ``{page_size: {'rows', 'serializer_ms', 'values_ms', 'speedup'}}``. Both
+    paths go through ``FastJSONRenderer``; differing bytes raise ``AssertionError``.
+    """
+    renderer = FastJSONRenderer()
+    queryset = Transaction.objects.filter(user=user).order_by('-txn_time', '-pk')
+
+    def via_serializer(n):
+        return renderer.render(TransactionSerializer(list(queryset[:n]), many=True).data)
+
+    def via_values(n):
+        encoder = RowEncoder.for_serializer(TransactionSerializer())
+        return renderer.render(encoder.encode(queryset.values_list(*encoder.columns)[:n]))
+
+    results = {}
+    for n in page_sizes:
+        expected = via_serializer(n)
+        if via_values(n) != expected:
+            raise AssertionError(f'RowEncoder output differs from TransactionSerializer at {n} rows')
+        timings = {}
+        for name, run in (('serializer_ms', via_serializer), ('values_ms', via_values)):
+            samples = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                run(n)
+                samples.append((time.perf_counter() - t0) * 1000)
+            timings[name] = round(percentile(samples, 50), 3)
+        results[str(n)] = {
+            'rows': len(json.loads(expected)), **timings,
+            'speedup': round(timings['serializer_ms'] / timings['values_ms'], 2) if timings['values_ms'] else None,
+        }
+    return results
+
+
+def measure_metrics_overhead(requests=2000, queries=1, rounds=7):
+    """Microseconds ``collect_metrics`` adds per request, against the bare handler.
+
+    The handler runs ``queries`` ``SELECT 1`` statements, so the figure covers the
+    execute-wrapper cost per statement as well as the fixed per-request cost. Both
+    sides are timed in alternating rounds and compared by their medians.
+    """
+    request = RequestFactory().get('/api/health/')
+
+    def handler(request):
+        with connection.cursor() as cursor:
+            for _ in range(queries):
+                cursor.execute('SELECT 1')
+        return HttpResponse()
+
+    wrapped = collect_metrics(handler, sink=MetricsRegistry())
+    handler(request)  # open the connection outside the timed loops
+    samples = {'bare_us': [], 'wrapped_us': []}
+    for _ in range(rounds):
+        for name, run in (('bare_us', handler), ('wrapped_us', wrapped)):
+            t0 = time.perf_counter()
+            for _ in range(requests):
+                run(request)
+            samples[name].append((time.perf_counter() - t0) / requests * 1e6)
+    result = {name: round(percentile(values, 50), 3) for name, values in samples.items()}
+    result['overhead_us'] = round(result['wrapped_us'] - result['bare_us'], 3)
+    return {'requests': requests, 'queries': queries, **result}
+
+
+# Runs in a fresh interpreter: boot the WSGI app the way a worker does, then serve one health check.
+_STARTUP_SCRIPT = """
+import io, json, sys, time
+t0 = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from django.core.wsgi import get_wsgi_application
+app = get_wsgi_application()
+t1 = time.perf_counter()
+environ = {'PATH_INFO': '/api/health/', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr}
+setup_testing_defaults(environ)
+status = []
+b''.join(app(environ, lambda s, headers, exc_info=None: status.append(s)))
+t2 = time.perf_counter()
+print(json.dumps({'setup_ms': (t1 - t0) * 1000, 'first_response_ms': (t2 - t0) * 1000,
+                  'status': int(status[0].split()[0]), 'modules': sorted(sys.modules)}))
+"""
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def _startup_run(importtime=False):
+    # A scratch database and in-memory throttle buckets: the health check must not touch real files.
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'Budget.settings'),
+               'DB_PATH': os.path.join(tmp, 'startup.sqlite3'), 'THROTTLE_BACKEND': 'cache'}
+        args = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', _STARTUP_SCRIPT]
+        t0 = time.perf_counter()
+        out = subprocess.run(args, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120)
+        process_ms = (time.perf_counter() - t0) * 1000
+    if out.returncode:
+        raise RuntimeError(f'Startup script failed:\n{out.stderr[-2000:]}')
+    return {**json.loads(out.stdout.strip().splitlines()[-1]), 'process_ms': process_ms}, out.stderr
+
+
+def measure_startup(runs=5, top=15):
+    """Median cold-start timings of a worker process over ``runs`` fresh interpreters.
+
+    ``process_ms`` is interpreter start to exit; ``setup_ms`` and ``first_response_ms``
+    are measured inside the process from the first import. One extra run under
+    ``python -X importtime`` lists the ``top`` slowest top-level imports and the time
+    spent in ``finance`` modules themselves.
+    """
+    samples = [_startup_run()[0] for _ in range(runs)]
+    last, stderr = _startup_run(importtime=True)
+    imports, finance_us = [], 0
+    for line in stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, depth, name = int(m[1]), int(m[2]), len(m[3]) // 2, m[4]
+        if name.split('.')[0] == 'finance':
+            finance_us += self_us
+        if depth == 0:
+            imports.append({'module': name, 'cumulative_ms': round(cumulative_us / 1000, 3)})
+    imports.sort(key=lambda row: -row['cumulative_ms'])
+    return {
+        'runs': runs,
+        'status': samples[-1]['status'],
+        **{key: round(percentile([s[key] for s in samples], 50), 3)
+           for key in ('process_ms', 'setup_ms', 'first_response_ms')},
+        'finance_import_ms': round(finance_us / 1000, 3),
+        'module_count': len(last['modules']),
+        'modules': last['modules'],
+        'slowest_imports': imports[:top],
+    }
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def report_meta(**extra):
+    return {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        **extra,
+    }
+
+
+def compare_reports(old, new, metric='p95_ms', threshold=0.10):
+    """Return ``[(scale, route, old, new, ratio)]`` where ``metric`` regressed by more than ``threshold``.
+
+    Cold start is compared too, as ``('startup', ...)`` on ``first_response_ms``.
+    """
+    regressions = []
+    for scale, data in new.get('scales', {}).items():
+        old_routes = old.get('scales', {}).get(scale, {}).get('routes', {})
+        for route, stats in data.get('routes', {}).items():
+            before = old_routes.get(route, {}).get(metric)
+            after = stats.get(metric)
+            if before and after and after > before * (1 + threshold):
+                regressions.append((scale, route, before, after, after / before))
+    before = old.get('startup', {}).get('first_response_ms')
+    after = new.get('startup', {}).get('first_response_ms')
+    if before and after and after > before * (1 + threshold):
+        regressions.append(('startup', 'first /api/health/ response', before, after, after / before))
+    return regressions
@@ -0,0 +1,290 @@
+"""Per-user transaction auto-categorization.
+
+Each user gets a multinomial naive Bayes model over hashed features:
+- the normalized merchant key;
+- merchant and description tokens;
+- an order-of-magnitude amount bucket.
+
+It trains only on that user's own manually labeled transactions, the newest
+``CATEGORIZER_MAX_EXAMPLES`` of them, so training on a cache miss costs the same for
+a user with years of history as for one with a few months. Predictions are
+restricted to categories whose type matches the direction (expense/income) and
+are kept only above ``CATEGORIZER_MIN_CONFIDENCE``. Predicted rows are flagged
+``auto_categorized`` and never fed back as training data.
+
+Models live in a bounded in-process LRU (``CATEGORIZER_CACHE_SIZE``). A cached
+model is refreshed incrementally, at most every ``CATEGORIZER_REFRESH_SECONDS``:
+- rows changed since its ``updated_at`` watermark are learned or unlearned;
+- rows deleted since then (their ``AuditLog`` delete entries) are unlearned;
+- the oldest examples beyond ``CATEGORIZER_MAX_EXAMPLES`` are unlearned.
+Refreshes and predictions hold the entry's lock, so threaded workers never
+score a model while another thread updates it.
+
+Scoring a transaction is a few dozen dict lookups, in the tens of microseconds.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from zlib import crc32
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .merchants import normalize_merchant
+from .models import AuditLog, Category, Transaction
+
+FEATURE_BITS = 18
+_MASK = (1 << FEATURE_BITS) - 1
+ALPHA = 1.0  # Laplace smoothing
+_TOKEN = re.compile(r'[a-z]{2,}')
+_DIRECTION_TYPES = {'out': 'expense', 'in': 'income'}
+
+
+def features(merchant, description, amount):
+    """Hashed feature buckets for one transaction (a tuple of distinct ints)."""
+    merchant = merchant or ''
+    description = description or ''
+    found = set()
+    key = normalize_merchant(merchant or description)
+    if key:
+        found.add(crc32(b'm:' + key.encode()) & _MASK)
+    for token in _TOKEN.findall(f'{merchant} {description}'.lower()):
+        found.add(crc32(token.encode()) & _MASK)
+    found.add(crc32(b'a:%d' % int(amount or 0).bit_length()) & _MASK)
+    return tuple(found)
+
+
+class NaiveBayes:
+    """Incrementally updatable multinomial naive Bayes keyed by category id."""
+
+    def __init__(self, category_types):
+        self.category_types = category_types   # {category_id: 'expense' | 'income'}
+        self.docs = Counter()                  # category -> labeled transactions
+        self.counts = {}                       # category -> Counter(bucket -> occurrences)
+        self.totals = Counter()                # category -> feature occurrences
+        self.vocab = Counter()                 # bucket -> occurrences across categories
+        self.labels = {}                       # transaction pk -> (category, features)
+
+    def learn(self, pk, category_id, feats):
+        if pk in self.labels:
+            self.unlearn(pk)
+        self.labels[pk] = (category_id, feats)
+        self.docs[category_id] += 1
+        counts = self.counts.setdefault(category_id, Counter())
+        counts.update(feats)
+        self.totals[category_id] += len(feats)
+        self.vocab.update(feats)
+
+    def unlearn(self, pk):
+        label = self.labels.pop(pk, None)
+        if label is None:
+            return
+        category_id, feats = label
+        self.docs[category_id] -= 1
+        counts = self.counts[category_id]
+        counts.subtract(feats)
+        self.totals[category_id] -= len(feats)
+        self.vocab.subtract(feats)
+        for f in feats:
+            if counts[f] <= 0:
+                del counts[f]
+            if self.vocab[f] <= 0:
+                del self.vocab[f]
+
+    def trim(self, limit):
+        """Unlearn the oldest (lowest pk) examples beyond ``limit``."""
+        excess = len(self.labels) - limit
+        if excess > 0:
+            for pk in heapq.nsmallest(excess, self.labels):
+                self.unlearn(pk)
+
+    def predict(self, feats, direction):
+        """``(category_id, probability)`` of the best matching category, or ``(None, 0.0)``."""
+        wanted = _DIRECTION_TYPES.get(direction)
+        candidates = [c for c, n in self.docs.items() if n > 0 and self.category_types.get(c) == wanted]
+        if not candidates:
+            return None, 0.0
+        smoothing = ALPHA * (len(self.vocab) + 1)
+        n_docs = sum(self.docs[c] for c in candidates)
+        log = math.log
+        scores = []
+        for c in candidates:
+            counts = self.counts[c]
+            get = counts.get
+            score = log(self.docs[c] / n_docs) - len(feats) * log(self.totals[c] + smoothing)
+            for f in feats:
+                score += log(get(f, 0) + ALPHA)
+            scores.append(score)
+        best = max(scores)
+        weights = [math.exp(s - best) for s in scores]
+        i = scores.index(best)
+        return candidates[i], weights[i] / sum(weights)
+
+
+class _Entry:
+    __slots__ = ('model', 'watermark', 'checked', 'lock')
+
+    def __init__(self, model, watermark, checked):
+        self.model = model
+        self.watermark = watermark
+        self.checked = checked
+        self.lock = threading.Lock()  # held while the model is refreshed or scored
+
+
+def _labeled(user_id):
+    return Transaction.objects.filter(
+        user_id=user_id, category__isnull=False, auto_categorized=False, direction__in=('in', 'out'),
+    )
+
+
+def _category_types(user_id):
+    return dict(Category.objects.filter(user_id=user_id).values_list('id', 'type'))
+
+
+class Categorizer:
+    def __init__(self, max_models=None, refresh_seconds=None):
+        self.max_models = max_models if max_models is not None else settings.CATEGORIZER_CACHE_SIZE
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None else settings.CATEGORIZER_REFRESH_SECONDS
+        )
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def train(self, user_id):
+        model = NaiveBayes(_category_types(user_id))
+        started = timezone.now()  # rows saved from here on are picked up by the next refresh
+        newest = _labeled(user_id).order_by('-pk')[:settings.CATEGORIZER_MAX_EXAMPLES]
+        for pk, category_id, merchant, description, amount in newest.values_list(
+            'pk', 'category_id', 'merchant', 'description', 'amount'
+        ).iterator(chunk_size=2000):
+            model.learn(pk, category_id, features(merchant, description, amount))
+        return _Entry(model, started, time.monotonic())
+
+    def _refresh(self, user_id, entry):
+        """Fold in rows changed since the watermark. Call with ``entry.lock`` held."""
+        model = entry.model
+        started = timezone.now()
+        changed = Transaction.objects.filter(user_id=user_id, updated_at__gte=entry.watermark)
+        for pk, category_id, auto, direction, merchant, description, amount in changed.values_list(
+            'pk', 'category_id', 'auto_categorized', 'direction', 'merchant', 'description', 'amount'
+        ):
+            if category_id is not None and not auto and direction in _DIRECTION_TYPES:
+                model.learn(pk, category_id, features(merchant, description, amount))
+            else:
+                model.unlearn(pk)
+        for object_id in AuditLog.objects.filter(
+            user_id=user_id, model_name='Transaction', action='delete', timestamp__gte=entry.watermark,
+        ).values_list('object_id', flat=True):
+            model.unlearn(int(object_id))
+        model.trim(settings.CATEGORIZER_MAX_EXAMPLES)
+        entry.watermark = started
+        entry.checked = time.monotonic()
+        return entry
+
+    def _entry_for(self, user_id):
+        with self._lock:
+            entry = self._models.get(user_id)
+            if entry is not None:
+                self._models.move_to_end(user_id)
+        if entry is None:
+            entry = self.train(user_id)
+            with self._lock:
+                entry = self._models.setdefault(user_id, entry)  # a racing thread's model wins
+                self._models.move_to_end(user_id)
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+        elif time.monotonic() - entry.checked >= self.refresh_seconds:
+            with entry.lock:
+                if time.monotonic() - entry.checked >= self.refresh_seconds:  # not refreshed meanwhile
+                    self._refresh(user_id, entry)
+        return entry
+
+    def model_for(self, user_id):
+        return self._entry_for(user_id).model
+
+    def categorize(self, user_id, transactions):
+        """Predicted ``category_id`` (or None) for each transaction-like object, in order."""
+        entry = self._entry_for(user_id)
+        # Fresh per batch, so a deleted category is never predicted.
+        category_types = _category_types(user_id)
+        threshold = settings.CATEGORIZER_MIN_CONFIDENCE
+        out = []
+        with entry.lock:
+            model = entry.model
+            if len(model.labels) < settings.CATEGORIZER_MIN_EXAMPLES:
+                return [None] * len(transactions)
+            model.category_types = category_types
+            for txn in transactions:
+                category_id, confidence = model.predict(
+                    features(txn.merchant, txn.description, txn.amount), txn.direction,
+                )
+                out.append(category_id if confidence >= threshold else None)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+_categorizer = None
+_categorizer_lock = threading.Lock()
+
+
+def get_categorizer():
+    global _categorizer
+    if _categorizer is None:
+        with _categorizer_lock:
+            if _categorizer is None:
+                _categorizer = Categorizer()
+    return _categorizer
+
+
+@receiver(setting_changed)
+def reset_categorizer(*, setting=None, **kwargs):
+    """Drop cached models when categorizer settings change (override_settings in tests)."""
+    global _categorizer
+    if setting is None or setting.startswith('CATEGORIZER_'):
+        with _categorizer_lock:
+            _categorizer = None
+
+
+def categorize_uncategorized(batch_size=1000, user_ids=None, dry_run=False):
+    """Fill ``category`` on uncategorized income/expense rows in pk batches; returns (seen, assigned).
+
+    Rows are written with one ``UPDATE`` per category, so no model signals run: no
+    ``AuditLog`` entries and no ``budget`` events. ``updated_at`` is bumped, so
+    readers keyed on it (the categorizer's own refresh) still see the rows.
+    """
+    rows = Transaction.objects.filter(category__isnull=True, direction__in=('in', 'out')).order_by('pk')
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    rows = rows.only('pk', 'user_id', 'direction', 'merchant', 'description', 'amount')
+    engine = get_categorizer()
+    seen = assigned = 0
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return seen, assigned
+        last_pk = batch[-1].pk
+        seen += len(batch)
+        by_user = {}
+        for txn in batch:
+            by_user.setdefault(txn.user_id, []).append(txn)
+        by_category = {}
+        for user_id, txns in by_user.items():
+            for txn, category_id in zip(txns, engine.categorize(user_id, txns)):
+                if category_id is not None:
+                    by_category.setdefault(category_id, []).append(txn.pk)
+        for category_id, pks in by_category.items():
+            assigned += len(pks)
+            if not dry_run:
+                # category__isnull guards against a user categorizing the row meanwhile.
+                Transaction.objects.filter(pk__in=pks, category__isnull=True).update(
+                    category_id=category_id, auto_categorized=True, updated_at=timezone.now(),
+                )
@@ -0,0 +1,140 @@
+"""Likely-duplicate transactions: double entry by hand and overlapping bank imports.
+
+``Transaction.fingerprint`` hashes what two copies of one real-world payment share:
+account, direction, amount, local day and normalized merchant (``merchants.normalize_merchant``
+of the merchant text). It is set on every save; transfers carry none. Lookups use the
+``(user, fingerprint)`` index and never scan history:
+
+* a single create probes the fingerprints of its day and the ``DUPLICATE_WINDOW_DAYS``
+  either side (a posting date often lags the purchase) in one ``IN`` query;
+* ``import_transactions`` does the same for a whole batch in one ``IN`` query, also
+  matching ``external_id`` on the account, and reports duplicates instead of
+  inserting them. Rows repeated within one import are kept: a statement listing two
+  identical coffees means two coffees.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .merchants import assign_merchants, merchant_text, normalize_merchant
+from .models import Transaction
+
+
+def _window():
+    return getattr(settings, 'DUPLICATE_WINDOW_DAYS', 1)
+
+
+def fingerprint_for_day(account_id, direction, amount, day, merchant):
+    """Fingerprint of a transaction on local ``day``; ``merchant`` is the raw merchant text."""
+    key = f'{account_id}|{direction}|{amount:.2f}|{day:%Y-%m-%d}|{normalize_merchant(merchant)}'
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def fingerprint(txn):
+    """Stored fingerprint for ``txn``; '' for transfer legs and incomplete rows."""
+    if txn.direction == 'transfer' or not txn.account_id or txn.amount is None or txn.txn_time is None:
+        return ''
+    return fingerprint_for_day(txn.account_id, txn.direction, txn.amount, timezone.localdate(txn.txn_time),
+                               merchant_text(txn))
+
+
+def candidate_fingerprints(txn):
+    """Fingerprints a duplicate of ``txn`` could carry: its day and ``DUPLICATE_WINDOW_DAYS`` either side."""
+    if not fingerprint(txn):
+        return []
+    day = timezone.localdate(txn.txn_time)
+    window = _window()
+    return [
+        fingerprint_for_day(txn.account_id, txn.direction, txn.amount, day + timedelta(days=offset), merchant_text(txn))
+        for offset in range(-window, window + 1)
+    ]
+
+
+def find_duplicates(txn):
+    """Ids of the user's stored transactions that look like ``txn`` (one indexed query)."""
+    candidates = candidate_fingerprints(txn)
+    if not candidates:
+        return []
+    rows = Transaction.objects.filter(user_id=txn.user_id, fingerprint__in=candidates)
+    if txn.pk:
+        rows = rows.exclude(pk=txn.pk)
+    return list(rows.order_by('pk').values_list('pk', flat=True))
+
+
+def backfill_fingerprints(batch_size=2000):
+    """Fingerprint stored transactions that have none yet (rows from before the column); returns rows updated."""
+    rows = (
+        Transaction.objects.exclude(direction='transfer').filter(fingerprint='').order_by('pk')
+        .only('pk', 'account_id', 'direction', 'amount', 'txn_time', 'merchant', 'description', 'fingerprint')
+    )
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        for txn in batch:
+            txn.fingerprint = fingerprint(txn)
+        Transaction.objects.bulk_update(batch, ['fingerprint'])
+        updated += len(batch)
+        last_pk = batch[-1].pk
+
+
+@dataclass
+class ImportResult:
+    created: list = field(default_factory=list)     # Transaction objects, in input order
+    duplicates: list = field(default_factory=list)  # (input index, [existing ids])
+
+
+def import_transactions(user, account, rows, batch_size=200):
+    """Insert unsaved ``rows`` (``Transaction`` objects) into ``account``, skipping likely duplicates.
+
+    Each batch costs one duplicate probe and one merchant lookup; inserted rows go
+    through the normal save path, so balances, running balances, merchant spend and events stay current.
+    """
+    result = ImportResult()
+    imported = set()
+    with transaction.atomic(using=router.db_for_write(Transaction, instance=account)):
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            wanted = {}
+            for i, txn in enumerate(batch, start):
+                txn.user, txn.account = user, account
+                for fp in candidate_fingerprints(txn):
+                    wanted.setdefault(fp, []).append(i)
+            external = {txn.external_id for txn in batch if txn.external_id}
+            matches = {}
+            if wanted or external:
+                existing = (
+                    Transaction.objects.filter(user=user)
+                    .filter(Q(fingerprint__in=list(wanted)) | Q(account=account, external_id__in=list(external)))
+                    .values_list('pk', 'fingerprint', 'external_id')
+                )
+                by_external = {}
+                for pk, fp, external_id in existing:
+                    if pk in imported:
+                        continue
+                    for i in wanted.get(fp, ()):
+                        matches.setdefault(i, set()).add(pk)
+                    if external_id in external:
+                        by_external.setdefault(external_id, set()).add(pk)
+                for i, txn in enumerate(batch, start):
+                    if txn.external_id in by_external:
+                        matches.setdefault(i, set()).update(by_external[txn.external_id])
+            fresh = []
+            for i, txn in enumerate(batch, start):
+                if i in matches:
+                    result.duplicates.append((i, sorted(matches[i])))
+                else:
+                    fresh.append(txn)
+            assign_merchants([txn for txn in fresh if txn.direction != 'transfer'])
+            for txn in fresh:
+                txn.save()
+                imported.add(txn.pk)
+                result.created.append(txn)
+    return result
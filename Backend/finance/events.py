@@ -0,0 +1,252 @@
+"""Live change events for connected clients (``/api/events/``, Server-Sent Events).
+
+Writes publish compact events once their transaction commits:
+
+* ``balance`` - ``{account, delta}`` from every balance adjustment in the signals;
+* ``transaction`` - ``{action, id, account, direction, amount, txn_time}``;
+* ``budget`` - ``{budget, spent_delta}`` for budgets covering a changed expense;
+* ``account`` - ``{action, id}`` from the account viewset.
+
+Events go through a backend (``EVENTS_BACKEND`` setting) to the in-process
+``hub``. The hub hands them to each of the user's open streams on that stream's
+event loop. A stream is one small ``asyncio.Queue``: no thread and no database
+connection, so idle connections are cheap. A stream that falls
+``EVENTS_QUEUE_SIZE`` events behind is cut down to a single ``resync`` event,
+telling the client to refetch.
+
+Backends:
+
+* ``{'BACKEND': 'local'}`` - delivers within this process only (single worker,
+  tests). It skips all work for users with no open stream.
+* ``{'BACKEND': 'sqlite', 'PATH': ...}`` - a shared SQLite file in WAL mode, as
+  the throttle store uses. Publishers append rows. Each process with open
+  streams runs one poller thread that fans new rows out to its hub.
+* Any other value is a dotted path to a class taking the settings dict and
+  implementing ``publish(user_id, event)`` and ``start()``.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Budget
+from .routers import db_for_user
+
+RESYNC = {'type': 'resync'}
+
+
+class Subscription:
+    __slots__ = ('user_id', 'loop', 'queue')
+
+    def __init__(self, user_id, loop, maxsize):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event):
+        """Runs on the subscriber's loop."""
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+
+class Hub:
+    def __init__(self):
+        self._subs = {}  # user_id -> set of Subscription
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        sub = Subscription(user_id, asyncio.get_running_loop(), getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subs
+
+    def active(self):
+        return bool(self._subs)
+
+    def dispatch(self, user_id, event):
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.deliver, event)
+            except RuntimeError:  # the stream's loop has closed
+                self.unsubscribe(sub)
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    def __init__(self, conf=None):
+        pass
+
+    def wants(self, user_id):
+        return hub.has_subscribers(user_id)
+
+    def publish(self, user_id, event):
+        hub.dispatch(user_id, event)
+
+    def start(self):
+        pass
+
+
+class SQLiteBackend:
+    poll_interval = 0.2
+    retention = 300  # seconds an event row is kept for pollers that fell behind
+    prune_every = 500  # publishes between prunes
+
+    def __init__(self, conf):
+        self.path = str(conf['PATH'])
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._poller = None
+        self._published = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS live_event '
+                '(id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, payload TEXT NOT NULL, '
+                'created REAL NOT NULL)'
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def wants(self, user_id):
+        return True  # streams may be open in any process
+
+    def publish(self, user_id, event):
+        conn = self._conn()
+        now = time.time()
+        conn.execute('INSERT INTO live_event (user_id, payload, created) VALUES (?, ?, ?)',
+                     (user_id, json.dumps(event), now))
+        self._published += 1
+        if self._published % self.prune_every == 0:
+            conn.execute('DELETE FROM live_event WHERE created < ?', (now - self.retention,))
+
+    def start(self):
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='finance-events', daemon=True)
+                self._poller.start()
+
+    def _poll(self):
+        conn = self._conn()
+        last = conn.execute('SELECT COALESCE(MAX(id), 0) FROM live_event').fetchone()[0]
+        while True:
+            with self._lock:
+                if not hub.active():
+                    self._poller = None  # restarted by the next stream
+                    return
+            rows = conn.execute(
+                'SELECT id, user_id, payload FROM live_event WHERE id > ? ORDER BY id LIMIT 1000', (last,)
+            ).fetchall()
+            for last, user_id, payload in rows:
+                if hub.has_subscribers(user_id):
+                    hub.dispatch(user_id, json.loads(payload))
+            if not rows:
+                time.sleep(self.poll_interval)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                conf = getattr(settings, 'EVENTS_BACKEND', {'BACKEND': 'local'})
+                name = conf.get('BACKEND', 'local')
+                if name == 'local':
+                    _backend = LocalBackend(conf)
+                elif name == 'sqlite':
+                    _backend = SQLiteBackend(conf)
+                else:
+                    try:
+                        _backend = import_string(name)(conf)
+                    except ImportError as exc:
+                        raise ImproperlyConfigured(f'Unknown EVENTS_BACKEND {name!r}') from exc
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting=None, **kwargs):
+    """Drop the cached backend when EVENTS_BACKEND changes (override_settings in tests)."""
+    global _backend
+    if setting in (None, 'EVENTS_BACKEND'):
+        with _backend_lock:
+            _backend = None
+
+
+def publish(user_id, event):
+    """Send ``event`` to ``user_id``'s streams once the current transaction (on their shard) commits."""
+    backend = get_backend()
+    if user_id and backend.wants(user_id):
+        transaction.on_commit(lambda: backend.publish(user_id, event), using=db_for_user(user_id))
+
+
+def _money(value):
+    return str(Decimal(value).quantize(Decimal('0.01')))
+
+
+def balance_changed(account, delta):
+    if delta:
+        publish(account.user_id, {'type': 'balance', 'account': account.pk, 'delta': _money(delta)})
+
+
+def transaction_changed(txn, action):
+    publish(txn.user_id, {
+        'type': 'transaction', 'action': action, 'id': txn.pk, 'account': txn.account_id,
+        'direction': txn.direction, 'amount': _money(txn.amount), 'txn_time': txn.txn_time.isoformat(),
+    })
+
+
+def budget_spent_changed(txn, sign):
+    """``budget`` events for budgets whose spend includes expense ``txn`` (``sign`` -1 removes it)."""
+    if txn.direction != 'out' or not txn.category_id or not get_backend().wants(txn.user_id):
+        return
+    day = timezone.localdate(txn.txn_time)
+    for budget_id in Budget.objects.filter(
+        user_id=txn.user_id, category_id=txn.category_id, start_date__lte=day, end_date__gte=day,
+    ).values_list('id', flat=True):
+        publish(txn.user_id, {'type': 'budget', 'budget': budget_id, 'spent_delta': _money(sign * txn.amount)})
+
+
+def account_changed(account, action):
+    publish(account.user_id, {'type': 'account', 'action': action, 'id': account.pk})
+
+
+def format_event(seq, event):
+    """One SSE frame."""
+    return f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n".encode()
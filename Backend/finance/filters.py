@@ -0,0 +1,38 @@
+"""FilterSets for the finance API.
+
+The ``txn_time__date`` filters keep their names and local-date semantics. They
+compile to ``txn_time`` ranges (``>= day start``, ``< next day start``) rather
+than ``DATE(txn_time)`` comparisons, so the ``(user, ..., txn_time)`` indexes
+can serve them (see ``finance.queryplans``).
+"""
+from datetime import timedelta
+
+import django_filters
+
+from .models import Transaction
+from .snapshots import day_start
+
+
+class TransactionFilter(django_filters.FilterSet):
+    txn_time__date = django_filters.DateFilter(method='filter_day')
+    txn_time__date__gte = django_filters.DateFilter(method='filter_from')
+    txn_time__date__lte = django_filters.DateFilter(method='filter_until')
+
+    class Meta:
+        model = Transaction
+        fields = {
+            'direction': ['exact'],
+            'amount': ['gte', 'lte', 'exact'],
+            'account': ['exact'],
+            'category': ['exact'],
+            'is_pending': ['exact'],
+        }
+
+    def filter_day(self, queryset, name, value):
+        return queryset.filter(txn_time__gte=day_start(value), txn_time__lt=day_start(value + timedelta(days=1)))
+
+    def filter_from(self, queryset, name, value):
+        return queryset.filter(txn_time__gte=day_start(value))
+
+    def filter_until(self, queryset, name, value):
+        return queryset.filter(txn_time__lt=day_start(value + timedelta(days=1)))
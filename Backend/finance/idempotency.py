@@ -0,0 +1,102 @@
+"""``Idempotency-Key`` support for the viewset write endpoints.
+
+A client that retries a write sends the same ``Idempotency-Key`` header each
+time. The first request runs normally. Its row in ``IdempotencyKey`` (unique per
+user and key) is inserted in the same transaction as the write, and the 2xx
+response is stored on it. A repeat within ``IDEMPOTENCY_KEY_TTL_SECONDS`` is
+answered from that row in one indexed lookup, with ``Idempotent-Replayed: true``.
+It never reaches the serializer, the signals or the audit log.
+
+* A concurrent repeat blocks on the unique index until the first request
+  commits, then replays its response. If the first request rolled back, the
+  repeat runs instead.
+* Reusing a key with a different method, path or body is rejected (422).
+* Error responses are not stored, so a corrected retry may reuse the key.
+* With sharding the key row stays on ``default`` while the write goes to the
+  user's shard. Both run in one transaction per database, the shard's nested
+  inside default's: an error anywhere rolls both back, and the only window left
+  is between the two commits.
+
+Expired rows are deleted by the ``finance.prune_idempotency_keys`` task.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .routers import PRIMARY_DB, db_for_user
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'detail': f'{HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(record.response, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def run_once(request, handler):
+    """Run ``handler()`` once per ``Idempotency-Key``; repeats get the stored response."""
+    key = request.headers.get(HEADER)
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response({'detail': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.'}, status=400)
+    fingerprint = request_fingerprint(request)
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+    if record is not None:
+        if record.expires_at > now:
+            return _replay(record, fingerprint)
+        record.delete()
+    with transaction.atomic(using=PRIMARY_DB), transaction.atomic(using=db_for_user(request.user.pk)):
+        try:
+            with transaction.atomic(using=PRIMARY_DB):
+                record = IdempotencyKey.objects.create(
+                    user=request.user, key=key, fingerprint=fingerprint, status_code=0,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+                )
+        except IntegrityError:  # a concurrent request with this key committed first
+            return _replay(IdempotencyKey.objects.get(user=request.user, key=key), fingerprint)
+        response = handler()
+        if status.is_success(response.status_code):
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=['status_code', 'response'])
+        else:
+            record.delete()
+    return response
+
+
+class IdempotentWriteMixin:
+    """Honour ``Idempotency-Key`` on a viewset's create, update, partial_update and destroy."""
+
+    def create(self, request, *args, **kwargs):
+        return run_once(request, lambda: super(IdempotentWriteMixin, self).create(request, *args, **kwargs))
+
+    def update(self, request, *args, **kwargs):
+        return run_once(request, lambda: super(IdempotentWriteMixin, self).update(request, *args, **kwargs))
+
+    def destroy(self, request, *args, **kwargs):
+        return run_once(request, lambda: super(IdempotentWriteMixin, self).destroy(request, *args, **kwargs))
+
+
+def prune_expired(now=None):
+    """Delete expired keys; returns rows deleted."""
+    return IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
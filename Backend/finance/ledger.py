@@ -0,0 +1,154 @@
+"""Per-account ledger bookkeeping: signed amounts, transfers and running balances.
+
+Every transaction stores ``running_balance``, the account's balance right after it
+in ``(txn_time, id)`` order, starting from zero. The signals keep it current:
+
+* insert - one indexed lookup for the predecessor's running balance, plus one
+  ``UPDATE`` that shifts later rows when the insert is backdated;
+* delete - one ``UPDATE`` shifting later rows back;
+* edit   - treated as delete-then-insert.
+
+Each step first locks the account row (``SELECT .. FOR UPDATE`` where the backend
+has it; SQLite serializes writers anyway), so two concurrent inserts into one
+account cannot both read the same predecessor.
+
+Balance-at-date and statements are then a single lookup on ``(account, txn_time)``.
+Changes landing on already-snapshotted days are folded into ``finance.snapshots``.
+
+Transfers are two ``direction='transfer'`` legs linked through ``transfer_peer``:
+the ``transfer_side='out'`` leg debits the source account and the ``'in'`` leg
+credits the destination. They are created and deleted together.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.db.models import F, Q
+
+from . import snapshots
+from .models import Account, Transaction
+
+ZERO = Decimal('0.00')
+
+
+def signed_amount(txn):
+    """Effect of ``txn`` on its account's balance."""
+    if txn.direction == 'in' or (txn.direction == 'transfer' and txn.transfer_side == 'in'):
+        return txn.amount
+    if txn.direction == 'out' or (txn.direction == 'transfer' and txn.transfer_side == 'out'):
+        return -txn.amount
+    return ZERO  # legacy single-leg transfers carry no balance effect
+
+
+def _before(txn):
+    t, pk = txn.txn_time, txn.pk
+    return (
+        Transaction.objects.filter(account_id=txn.account_id)
+        .filter(Q(txn_time__lt=t) | Q(txn_time=t, pk__lt=pk))
+        .order_by('-txn_time', '-pk')
+    )
+
+
+def _after(txn):
+    t, pk = txn.txn_time, txn.pk
+    return Transaction.objects.filter(account_id=txn.account_id).filter(Q(txn_time__gt=t) | Q(txn_time=t, pk__gt=pk))
+
+
+def _lock_account(txn):
+    """Hold ``txn``'s account row until the surrounding transaction ends."""
+    db = txn._state.db or 'default'
+    if connections[db].features.has_select_for_update:
+        list(Account.objects.using(db).select_for_update().filter(pk=txn.account_id).values_list('pk'))
+
+
+def record_insert(txn):
+    """Set ``txn.running_balance`` and shift any later rows (backdated insert). Call inside a transaction."""
+    _lock_account(txn)
+    delta = signed_amount(txn)
+    previous = _before(txn).values_list('running_balance', flat=True).first()
+    running = (previous or ZERO) + delta
+    Transaction.objects.filter(pk=txn.pk).update(running_balance=running)
+    txn.running_balance = running
+    if delta:
+        _after(txn).update(running_balance=F('running_balance') + delta)
+        snapshots.patch_for_change(txn, delta)
+
+
+def record_delete(txn):
+    delta = signed_amount(txn)
+    if delta:
+        _lock_account(txn)
+        _after(txn).update(running_balance=F('running_balance') - delta)
+        snapshots.patch_for_change(txn, -delta)
+
+
+def record_update(old, new):
+    if (old.account_id, old.txn_time, old.amount, old.direction, old.transfer_side) == (
+        new.account_id, new.txn_time, new.amount, new.direction, new.transfer_side
+    ):
+        return
+    record_delete(old)
+    record_insert(new)
+
+
+def rebuild_running_balances(account_id):
+    """Recompute every running balance for one account from scratch (repairs, backfills)."""
+    running = ZERO
+    changed = []
+    rows = Transaction.objects.filter(account_id=account_id).order_by('txn_time', 'pk').only(
+        'pk', 'direction', 'transfer_side', 'amount', 'running_balance'
+    )
+    for txn in rows.iterator(chunk_size=2000):
+        running += signed_amount(txn)
+        if txn.running_balance != running:
+            txn.running_balance = running
+            changed.append(txn)
+    Transaction.objects.bulk_update(changed, ['running_balance'], batch_size=2000)
+    return len(changed)
+
+
+def balance_at(account_id, when):
+    """Account balance as of ``when`` (inclusive): one indexed lookup."""
+    value = (
+        Transaction.objects.filter(account_id=account_id, txn_time__lte=when)
+        .order_by('-txn_time', '-pk')
+        .values_list('running_balance', flat=True)
+        .first()
+    )
+    return value if value is not None else ZERO
+
+
+def statement(account_id, start, end):
+    """Opening balance, rows with running balances, and closing balance for ``start <= txn_time <= end``."""
+    opening = (
+        Transaction.objects.filter(account_id=account_id, txn_time__lt=start)
+        .order_by('-txn_time', '-pk')
+        .values_list('running_balance', flat=True)
+        .first()
+    ) or ZERO
+    rows = list(
+        Transaction.objects.filter(account_id=account_id, txn_time__gte=start, txn_time__lte=end)
+        .order_by('txn_time', 'pk')
+        .values('id', 'txn_time', 'direction', 'transfer_side', 'amount', 'description', 'merchant',
+                'category_id', 'running_balance')
+    )
+    closing = rows[-1]['running_balance'] if rows else opening
+    return {'opening_balance': opening, 'closing_balance': closing, 'transactions': rows}
+
+
+def create_transfer(user, source, destination, amount, txn_time, description='', is_pending=False):
+    """Create the two linked legs of a transfer; returns ``(out_leg, in_leg)``."""
+    if source.pk == destination.pk:
+        raise ValidationError({'to_account': 'Source and destination accounts must differ.'})
+    if source.user_id != user.pk or destination.user_id != user.pk:
+        raise ValidationError({'to_account': 'Both accounts must belong to the same user.'})
+    if source.currency != destination.currency:
+        raise ValidationError({'to_account': 'Transfers between currencies are not supported.'})
+    common = dict(user=user, direction='transfer', amount=amount, currency=source.currency,
+                  txn_time=txn_time, description=description, is_pending=is_pending)
+    with transaction.atomic(using=source._state.db):  # the user's shard
+        out_leg = Transaction.objects.create(account=source, transfer_side='out', **common)
+        in_leg = Transaction.objects.create(account=destination, transfer_side='in', transfer_peer=out_leg, **common)
+        Transaction.objects.filter(pk=out_leg.pk).update(transfer_peer=in_leg)
+    out_leg.transfer_peer = in_leg
+    return out_leg, in_leg
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from finance.queryplans import audit_plans
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every finance endpoint and filter combination as one user, EXPLAIN each SELECT, "
+        "and report full scans of large tables or weak index use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to audit as (default: the user with most transactions).')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every statement plan.')
+
+    def handle(self, *args, **opts):
+        if opts['user']:
+            user = User.objects.filter(username=opts['user']).first()
+        else:
+            user = User.objects.annotate(n=Count('transactions')).order_by('-n').first()
+        if user is None:
+            raise CommandError('No user to audit as.')
+        report = audit_plans(user)
+        if opts['verbose_plans']:
+            for label, plans in report.plans.items():
+                self.stdout.write(label)
+                for sql, plan in plans:
+                    self.stdout.write(f'  {sql[:200]}')
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+        for f in report.findings:
+            self.stdout.write(f'  {f.case}: {f.kind} of {f.table}: {f.detail}')
+        if report.findings:
+            raise CommandError(f'{len(report.findings)} plan findings in {report.statements} statements.')
+        self.stdout.write(self.style.SUCCESS(f'{report.statements} statements audited, no findings.'))
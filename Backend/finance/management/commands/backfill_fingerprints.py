@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.duplicates import backfill_fingerprints
+from finance.tasks import on_each_database
+
+
+class Command(BaseCommand):
+    help = "Compute duplicate-detection fingerprints for transactions stored before the column existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Transactions per update batch.')
+
+    def handle(self, *args, **opts):
+        if opts['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        updated = on_each_database(lambda: backfill_fingerprints(batch_size=opts['batch_size']))
+        self.stdout.write(self.style.SUCCESS(f'Fingerprinted {updated} transactions.'))
@@ -0,0 +1,103 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from finance.benchmark import (
+    benchmark_list_serialization, benchmark_routes, compare_reports, measure_metrics_overhead, measure_startup,
+    report_meta,
+)
+from finance.synthetic import seed_transactions, seed_users
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every finance route at increasing transaction volumes in a throwaway database "
+        "and write p50/p95/p99 latency, query counts and peak memory to a JSON report, along with "
+        "the transaction list's values_list() path timed against its serializer, the metrics middleware's "
+        "per-request overhead and a worker's cold start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='10000,100000',
+                            help='Comma-separated total transaction counts, e.g. 10000,100000,1000000.')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--accounts', type=int, default=3)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--budgets', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per route.')
+        parser.add_argument('--db-file', help='Seed an on-disk SQLite file instead of an in-memory database.')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='Previous report; list routes whose p95 regressed.')
+        parser.add_argument('--threshold', type=float, default=0.10, help='Regression threshold for --compare.')
+
+    def handle(self, *args, **opts):
+        try:
+            scales = sorted(int(s) for s in opts['scales'].split(',') if s.strip())
+        except ValueError:
+            raise CommandError('--scales must be a comma-separated list of integers.')
+        previous = None
+        if opts['compare']:
+            with open(opts['compare']) as fh:
+                previous = json.load(fh)
+        if opts['db_file']:
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = opts['db_file']
+
+        report = {'meta': report_meta(users=opts['users'], iterations=opts['iterations']), 'scales': {}}
+        startup = measure_startup()
+        startup.pop('modules')
+        report['startup'] = startup
+        self.stdout.write(
+            f"Cold start: setup={startup['setup_ms']:.1f}ms first response={startup['first_response_ms']:.1f}ms "
+            f"({startup['module_count']} modules, {startup['finance_import_ms']:.1f}ms in finance)"
+        )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seeded = seed_users(opts['users'], accounts=opts['accounts'], categories=opts['categories'],
+                                budgets=opts['budgets'])
+            bench_user = User.objects.get(pk=seeded[0].user_id)
+            overhead = report['metrics_overhead'] = measure_metrics_overhead()
+            self.stdout.write(
+                f"Metrics middleware: +{overhead['overhead_us']:.1f}us per request "
+                f"({overhead['bare_us']:.1f}us bare, {overhead['wrapped_us']:.1f}us wrapped)"
+            )
+            loaded = 0
+            for scale in scales:
+                self.stdout.write(f'Seeding up to {scale} transactions...')
+                loaded += seed_transactions(seeded, scale - loaded, seed=scale)
+                routes = benchmark_routes(bench_user, iterations=opts['iterations'])
+                lists = benchmark_list_serialization(bench_user, iterations=opts['iterations'])
+                report['scales'][str(scale)] = {'transactions': loaded, 'routes': routes, 'list_serialization': lists}
+                for name, stats in routes.items():
+                    if 'skipped' in stats:
+                        continue
+                    self.stdout.write(
+                        f"  {name:<24} p50={stats['p50_ms']:>8.2f}ms p95={stats['p95_ms']:>8.2f}ms "
+                        f"p99={stats['p99_ms']:>8.2f}ms q={stats['queries']:.0f} peak={stats['peak_kb']}KB"
+                    )
+                for size, stats in lists.items():
+                    self.stdout.write(
+                        f"  transaction list x{size:<5} serializer={stats['serializer_ms']:>8.2f}ms "
+                        f"values_list={stats['values_ms']:>8.2f}ms (x{stats['speedup']})"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(opts['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {opts['output']}"))
+
+        if previous is not None:
+            regressions = compare_reports(previous, report, threshold=opts['threshold'])
+            for scale, route, before, after, ratio in regressions:
+                self.stdout.write(self.style.WARNING(
+                    f'  [{scale}] {route}: p95 {before:.2f}ms -> {after:.2f}ms (x{ratio:.2f})'
+                ))
+            if not regressions:
+                self.stdout.write('No p95 regressions against the previous report.')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.categorizer import categorize_uncategorized
+
+
+class Command(BaseCommand):
+    help = "Predict categories for uncategorized income/expense transactions (e.g. after a bulk import)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Limit to this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Transactions per batch.')
+        parser.add_argument('--dry-run', action='store_true', help='Report how many would be categorized.')
+
+    def handle(self, *args, **opts):
+        if opts['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        seen, assigned = categorize_uncategorized(opts['batch_size'], opts['users'], dry_run=opts['dry_run'])
+        verb = 'Would categorize' if opts['dry_run'] else 'Categorized'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {assigned} of {seen} uncategorized transactions.'))
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.statements import generate_statements, parse_month, previous_month
+
+
+class Command(BaseCommand):
+    help = "Build and store every user's statement for a month, per user range, in parallel. Resumable."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='YYYY-MM (default: last month).')
+        parser.add_argument('--range-size', type=int, default=500, help='Users per range (contiguous id range).')
+        parser.add_argument('--workers', type=int,
+                            help='Worker processes (default: STATEMENT_WORKERS or CPU count, 0 = inline).')
+        parser.add_argument('--rebuild', action='store_true', help='Replace statements already stored.')
+
+    def handle(self, *args, **opts):
+        if opts['range_size'] <= 0:
+            raise CommandError('--range-size must be positive.')
+        try:
+            month = parse_month(opts['month']) if opts['month'] else previous_month()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        workers = opts['workers'] if opts['workers'] is not None else settings.STATEMENT_WORKERS
+        t0 = time.perf_counter()
+        ranges = built = skipped = transactions = 0
+        for result in generate_statements(month, opts['range_size'], workers, rebuild=opts['rebuild']):
+            ranges += 1
+            built += result.built
+            skipped += result.skipped
+            transactions += result.transactions
+            if opts['verbosity'] > 1:
+                self.stdout.write(
+                    f'  {result.alias} users [{result.lo}, {result.hi}): {result.built} built, '
+                    f'{result.skipped} skipped, {result.elapsed:.2f}s'
+                )
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f'{month:%Y-%m}: {ranges} ranges, {built} statements built, {skipped} already stored, '
+            f'{transactions} transactions in {elapsed:.2f}s ({built / elapsed if elapsed else 0:.0f} statements/s).'
+        ))
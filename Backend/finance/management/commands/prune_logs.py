@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.retention import RETAINED_MODELS, apply_retention, archive_dir, retention_days
+
+
+class Command(BaseCommand):
+    help = "Archive expired UserActivity/AuditLog rows to monthly NDJSON.gz files and purge them in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', choices=sorted(RETAINED_MODELS),
+                            help='Limit to this model (repeatable). Default: all log models.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per archive/delete batch.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--no-archive', action='store_true', help='Delete without writing archive files.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be purged.')
+
+    def handle(self, *args, **opts):
+        if opts['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        models = opts['model'] or list(RETAINED_MODELS)
+        for name in models:
+            self.stdout.write(f'{name}: keeping {retention_days(name)} days')
+        if not opts['no_archive'] and not opts['dry_run']:
+            self.stdout.write(f'Archiving to {archive_dir()}')
+
+        total = 0
+        for result in apply_retention(
+            models,
+            batch_size=opts['batch_size'],
+            archive=not opts['no_archive'],
+            pause=opts['pause'],
+            dry_run=opts['dry_run'],
+        ):
+            if opts['dry_run']:
+                self.stdout.write(f'  {result.model_name} {result.month}: {result.archived} rows would be purged')
+                total += result.archived
+            else:
+                self.stdout.write(f'  {result.model_name} {result.month}: archived {result.archived}, deleted {result.deleted}')
+                total += result.deleted
+        verb = 'would purge' if opts['dry_run'] else 'purged'
+        self.stdout.write(self.style.SUCCESS(f'Done: {verb} {total} rows.'))
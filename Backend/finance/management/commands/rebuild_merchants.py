@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.merchants import backfill_merchants, rebuild_spend
+
+
+class Command(BaseCommand):
+    help = "Assign normalized merchants to transactions and rebuild the per-user monthly merchant spend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Transactions per update batch.')
+        parser.add_argument('--renormalize', action='store_true',
+                            help='Re-assign every transaction, e.g. after changing the alias rules.')
+
+    def handle(self, *args, **opts):
+        if opts['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        assigned = backfill_merchants(batch_size=opts['batch_size'], renormalize=opts['renormalize'])
+        rows = rebuild_spend()
+        self.stdout.write(self.style.SUCCESS(f'Assigned {assigned} transactions; wrote {rows} merchant spend rows.'))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.reconciliation import reconcile_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute account balances from transactions per user shard, in parallel, and report drift. "
+        "Drifted balances are rewritten only with --repair."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard-size', type=int, default=1000, help='Users per shard (contiguous id range).')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count, 0 = inline).')
+        parser.add_argument('--repair', action='store_true', help='Rewrite drifted balances (default: report only).')
+        parser.add_argument('--show', type=int, default=20, help='Print at most this many drifted accounts.')
+
+    def handle(self, *args, **opts):
+        if opts['shard_size'] <= 0:
+            raise CommandError('--shard-size must be positive.')
+        repair = opts['repair']
+        t0 = time.perf_counter()
+        accounts = transactions = repaired = shards = 0
+        drifts = []
+        for result in reconcile_all(opts['shard_size'], opts['workers'], repair=repair):
+            shards += 1
+            accounts += result.accounts
+            transactions += result.transactions
+            repaired += result.repaired
+            drifts.extend(result.drifts)
+            if opts['verbosity'] > 1:
+                self.stdout.write(
+                    f'  users [{result.lo}, {result.hi}): {result.accounts} accounts, '
+                    f'{len(result.drifts)} drifted, {result.elapsed:.2f}s'
+                )
+        elapsed = time.perf_counter() - t0
+
+        for d in drifts[:opts['show']]:
+            self.stdout.write(f'  account {d.account_id} (user {d.user_id}): stored {d.stored} '
+                              f'expected {d.expected} (delta {d.delta:+})')
+        if len(drifts) > opts['show']:
+            self.stdout.write(f'  ... and {len(drifts) - opts["show"]} more')
+
+        rate = accounts / elapsed if elapsed else 0
+        summary = (
+            f'{shards} shards, {accounts} accounts, {transactions} transactions in {elapsed:.2f}s '
+            f'({rate:.0f} accounts/s, {transactions / elapsed if elapsed else 0:.0f} txn/s). '
+            f'{len(drifts)} drifted'
+        )
+        if repair:
+            summary += f', {repaired} repaired'
+            if repaired < len(drifts):
+                summary += f' ({len(drifts) - repaired} changed concurrently; rerun to pick them up)'
+        style = self.style.WARNING if drifts and not repair else self.style.SUCCESS
+        self.stdout.write(style(summary + '.'))
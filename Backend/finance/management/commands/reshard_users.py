@@ -0,0 +1,45 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.routers import shard_aliases
+from finance.sharding import move_users, pending_moves
+
+
+class Command(BaseCommand):
+    help = "Move users whose finance rows are not on their hash shard (pre-sharding users, added shards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help='Only this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT when copying.')
+        parser.add_argument('--group-size', type=int, default=100,
+                            help='Users moved per step; each step waits --settle seconds twice.')
+        parser.add_argument('--settle', type=float, default=None,
+                            help='Seconds to wait for cached placements to expire '
+                                 '(default: SHARD_DIRECTORY_CACHE_SECONDS).')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the moves.')
+
+    def handle(self, *args, **opts):
+        if not shard_aliases():
+            raise CommandError('No shards configured (DATABASE_SHARDS / DB_SHARD_PATHS).')
+        if opts['batch_size'] <= 0 or opts['group_size'] <= 0:
+            raise CommandError('--batch-size and --group-size must be positive.')
+        moves = pending_moves(opts['user'])
+        users = rows = 0
+        while True:
+            group = list(islice(moves, opts['group_size']))
+            if not group:
+                break
+            if opts['dry_run']:
+                for user_id, source, target in group:
+                    self.stdout.write(f'  user {user_id}: {source} -> {target}')
+                users += len(group)
+                continue
+            for result in move_users(group, batch_size=opts['batch_size'], settle=opts['settle']):
+                self.stdout.write(f'  user {result.user_id}: {result.source} -> {result.target}, {result.total} rows')
+                users += 1
+                rows += result.total
+        if opts['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Done: {users} users would move.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Done: moved {users} users ({rows} rows).'))
@@ -0,0 +1,62 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from finance import taskqueue
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the finance task table (and enqueue periodic ones) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due.')
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed per round trip.')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--max-tasks', type=int, default=0, help='Exit after running this many tasks (0: no limit).')
+        parser.add_argument('--no-schedule', action='store_true', help='Do not enqueue periodic tasks.')
+        parser.add_argument('--worker-id', help='Name recorded on claimed tasks (default: host:pid).')
+
+    def handle(self, *args, **opts):
+        if opts['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        if opts['max_tasks'] < 0:
+            raise CommandError('--max-tasks must not be negative.')
+        worker_id = opts['worker_id'] or f'{socket.gethostname()}:{os.getpid()}'
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)  # finish the current task, then exit
+
+        previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        ran = 0
+        try:
+            while not stopping:
+                close_old_connections()
+                if not opts['no_schedule']:
+                    taskqueue.enqueue_due_schedules()
+                limit = opts['batch_size']
+                if opts['max_tasks']:
+                    limit = min(limit, opts['max_tasks'] - ran)
+                rows = taskqueue.claim(worker_id, limit)
+                for i, row in enumerate(rows):
+                    if stopping:
+                        taskqueue.release(rows[i:])
+                        break
+                    taskqueue.execute(row)
+                    ran += 1
+                if opts['max_tasks'] and ran >= opts['max_tasks']:
+                    break
+                if not rows:
+                    if opts['once']:
+                        break
+                    time.sleep(opts['poll'])
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        for name, figures in taskqueue.stats.summary().items():
+            self.stdout.write(f"  {name}: {figures['ok']} ok, {figures['failed']} failed, {figures['seconds']:.3f}s")
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} ran {ran} tasks.'))
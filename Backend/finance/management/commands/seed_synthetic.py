@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.synthetic import SYNTHETIC_PASSWORD, seed_transactions, seed_users
+
+
+class Command(BaseCommand):
+    help = "Bulk-create synthetic users with accounts, categories, budgets and transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--accounts', type=int, default=2, help='Accounts per user.')
+        parser.add_argument('--categories', type=int, default=8, help='Categories per user.')
+        parser.add_argument('--budgets', type=int, default=6, help='Budgets per user.')
+        parser.add_argument('--transactions', type=int, default=1000, help='Transactions per user.')
+        parser.add_argument('--days', type=int, default=365, help='Spread transactions over this many days.')
+        parser.add_argument('--prefix', default='bench', help='Username prefix (<prefix>-<n>@example.com).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **opts):
+        if opts['users'] <= 0 or opts['accounts'] <= 0 or opts['categories'] < 2:
+            raise CommandError('Need at least one user, one account and two categories.')
+        t0 = time.perf_counter()
+        seeded = seed_users(
+            opts['users'], accounts=opts['accounts'], categories=opts['categories'],
+            budgets=opts['budgets'], prefix=opts['prefix'],
+        )
+        created = seed_transactions(
+            seeded, opts['users'] * opts['transactions'], days=opts['days'], seed=opts['seed'],
+        )
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(seeded)} users and {created} transactions in {elapsed:.1f}s '
+            f'({created / elapsed if elapsed else 0:.0f} txn/s). Password: {SYNTHETIC_PASSWORD}'
+        ))
@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.snapshots import append_snapshots
+
+
+class Command(BaseCommand):
+    help = "Append daily per-account balance snapshots for days not yet snapshotted (run daily from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', help='Last day to snapshot, YYYY-MM-DD (default: yesterday).')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Snapshot rows per insert.')
+
+    def handle(self, *args, **opts):
+        if opts['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        try:
+            until = date.fromisoformat(opts['until']) if opts['until'] else None
+        except ValueError:
+            raise CommandError('--until must be a YYYY-MM-DD date.')
+        written = append_snapshots(until=until, batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} balance snapshots.'))
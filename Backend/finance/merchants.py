@@ -0,0 +1,276 @@
+"""Merchant dimension: normalization, assignment and per-user monthly spend aggregates.
+
+Free-text merchants ("AMZN Mktp US*2K4LM", "Amazon.com") normalize to one key
+("amazon"). ``Transaction.canonical_merchant`` is set from the merchant text
+(falling back to the description) when a transaction is created and when an edit
+changes that text. Bulk imports use ``assign_merchants``, which costs one lookup
+and one insert per batch. Normalization is a pure function behind an LRU cache,
+and key -> merchant id pairs are kept in a second LRU once committed, so a
+repeat merchant costs two dict hits and no query.
+
+``MerchantSpend`` keeps expense totals per (user, merchant, month), maintained
+incrementally by the transaction signals and ``TransactionViewSet.perform_update``.
+``top_merchants`` answers ranges from whole months of aggregates plus the raw
+rows of the partial months at either edge.
+"""
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Merchant, MerchantSpend, Transaction
+
+ZERO = Decimal('0.00')
+
+# Card-processor prefixes that precede the real merchant ("SQ *BLUE BOTTLE", "PAYPAL *SPOTIFY").
+PROCESSOR_PREFIXES = ('sq', 'tst', 'paypal', 'pp', 'sp', 'py', 'dd', 'ctlp')
+# Words that never identify a merchant.
+NOISE_WORDS = frozenset({
+    'pos', 'purchase', 'debit', 'credit', 'card', 'payment', 'recurring', 'online', 'store', 'inc', 'llc', 'ltd',
+    'co', 'corp', 'the', 'us', 'usa', 'mktp', 'marketplace', 'com', 'www', 'web', 'autopay', 'bill',
+})
+# Normalized prefix -> canonical key; the longest matching prefix wins.
+ALIASES = {
+    'amzn': 'amazon',
+    'amazon': 'amazon',
+    'prime video': 'amazon prime video',
+    'wm supercenter': 'walmart',
+    'wal mart': 'walmart',
+    'walmart': 'walmart',
+    'uber eats': 'uber eats',
+    'uber': 'uber',
+    'google': 'google',
+    'apple com bill': 'apple',
+    'itunes': 'apple',
+    'netflix': 'netflix',
+    'spotify': 'spotify',
+    'starbucks': 'starbucks',
+    'sbux': 'starbucks',
+    'mcdonald s': 'mcdonalds',
+    'mcdonalds': 'mcdonalds',
+}
+_ALIAS_PREFIXES = sorted(ALIASES, key=len, reverse=True)
+
+_REFERENCE = re.compile(r'[*#]\s*\S+')      # "*2K4LM93", "#1234" processor/store references
+_NON_ALPHA = re.compile(r"[^a-z&' ]+")        # digits, punctuation, domains' dots
+
+
+@lru_cache(maxsize=16384)
+def normalize_merchant(raw):
+    """Canonical merchant key for free text, or '' when nothing identifying is left."""
+    text = raw.lower()
+    head, star, tail = text.partition('*')
+    if star and head.strip() in PROCESSOR_PREFIXES:
+        text = tail
+    text = _REFERENCE.sub(' ', text).replace("'", ' ')
+    tokens = [t for t in _NON_ALPHA.sub(' ', text).split() if t not in NOISE_WORDS and len(t) > 1]
+    key = ' '.join(tokens)[:120]
+    for prefix in _ALIAS_PREFIXES:
+        if key == prefix or key.startswith(prefix + ' '):
+            return ALIASES[prefix]
+    return key
+
+
+def merchant_text(txn):
+    return txn.merchant or txn.description or ''
+
+
+def display_name(key):
+    return key.title()
+
+
+class _MerchantIds:
+    """Bounded LRU of key -> merchant id. Filled only after commit, so it never holds a rolled-back id."""
+
+    def __init__(self, maxsize=16384):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            found = {k: self._ids[k] for k in keys if k in self._ids}
+            for k in found:
+                self._ids.move_to_end(k)
+        return found
+
+    def remember(self, pairs):
+        with self._lock:
+            self._ids.update(pairs)
+            for k in pairs:
+                self._ids.move_to_end(k)
+            while len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+merchant_ids = _MerchantIds()
+
+
+@receiver(post_delete, sender=Merchant)
+@receiver(post_migrate)  # also sent after a test flush
+def forget_merchant_ids(**kwargs):
+    merchant_ids.clear()
+
+
+def resolve_merchant_ids(keys):
+    """``{key: merchant_id}`` for non-empty keys, creating missing merchants in one insert."""
+    keys = {k for k in keys if k}
+    if not keys:
+        return {}
+    found = merchant_ids.get_many(keys)
+    lookup = keys - found.keys()
+    if not lookup:
+        return found
+    fetched = dict(Merchant.objects.filter(key__in=lookup).values_list('key', 'id'))
+    missing = lookup - fetched.keys()
+    if missing:
+        Merchant.objects.bulk_create([Merchant(key=k, name=display_name(k)) for k in missing], ignore_conflicts=True)
+        fetched.update(Merchant.objects.filter(key__in=missing).values_list('key', 'id'))
+    transaction.on_commit(lambda: merchant_ids.remember(fetched), using=router.db_for_write(Merchant))
+    return {**found, **fetched}
+
+
+def needs_merchant(txn):
+    """Whether a save must (re)assign ``txn``'s canonical merchant."""
+    if txn._state.adding:
+        # New rows may arrive with the merchant already resolved in bulk (duplicates.import_transactions).
+        return not txn.canonical_merchant_id
+    return getattr(txn, '_loaded_merchant', None) != (txn.merchant, txn.description)
+
+
+def assign_merchant(txn):
+    key = normalize_merchant(merchant_text(txn))
+    txn.canonical_merchant_id = resolve_merchant_ids([key]).get(key)
+
+
+def assign_merchants(transactions):
+    """Set ``canonical_merchant_id`` on unsaved transactions before ``bulk_create``."""
+    keys = [normalize_merchant(merchant_text(txn)) for txn in transactions]
+    ids = resolve_merchant_ids(keys)
+    for txn, key in zip(transactions, keys):
+        txn.canonical_merchant_id = ids.get(key)
+    return transactions
+
+
+def backfill_merchants(batch_size=2000, renormalize=False):
+    """Assign merchants to stored transactions (all of them with ``renormalize``); returns rows updated."""
+    rows = Transaction.objects.exclude(direction='transfer').order_by('pk')
+    if not renormalize:
+        rows = rows.filter(canonical_merchant__isnull=True)
+    rows = rows.only('pk', 'merchant', 'description', 'canonical_merchant')
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        before = [txn.canonical_merchant_id for txn in batch]
+        assign_merchants(batch)
+        changed = [txn for txn, old in zip(batch, before) if txn.canonical_merchant_id != old]
+        Transaction.objects.bulk_update(changed, ['canonical_merchant'])
+        updated += len(changed)
+        last_pk = batch[-1].pk
+
+
+def month_of(txn_time):
+    return timezone.localdate(txn_time).replace(day=1)
+
+
+def record_spend(txn, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) one expense from the monthly aggregate."""
+    if txn.direction != 'out' or not txn.canonical_merchant_id:
+        return
+    lookup = dict(user_id=txn.user_id, merchant_id=txn.canonical_merchant_id, month=month_of(txn.txn_time))
+    amount = txn.amount * sign
+    changes = dict(spent=F('spent') + amount, txn_count=F('txn_count') + sign)
+    if MerchantSpend.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            MerchantSpend.objects.create(spent=amount, txn_count=sign, **lookup)
+    except IntegrityError:  # created concurrently
+        MerchantSpend.objects.filter(**lookup).update(**changes)
+
+
+def rebuild_spend(user_ids=None):
+    """Recompute ``MerchantSpend`` from transactions (backfills, repairs); returns rows written."""
+    expenses = Transaction.objects.filter(direction='out', canonical_merchant__isnull=False)
+    stale = MerchantSpend.objects.all()
+    if user_ids is not None:
+        expenses = expenses.filter(user_id__in=user_ids)
+        stale = stale.filter(user_id__in=user_ids)
+    totals = {}
+    for user_id, merchant_id, txn_time, amount in expenses.values_list(
+        'user_id', 'canonical_merchant_id', 'txn_time', 'amount'
+    ).order_by().iterator(chunk_size=5000):
+        key = (user_id, merchant_id, month_of(txn_time))
+        spent, count = totals.get(key, (ZERO, 0))
+        totals[key] = (spent + amount, count + 1)
+    with transaction.atomic():
+        stale.delete()
+        MerchantSpend.objects.bulk_create([
+            MerchantSpend(user_id=u, merchant_id=m, month=month, spent=spent, txn_count=count)
+            for (u, m, month), (spent, count) in totals.items()
+        ], batch_size=2000)
+    return len(totals)
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _aware(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def top_merchants(user, start, end, limit=10):
+    """Top expense merchants for ``start <= date <= end`` (local dates), largest spend first."""
+    first_full = start if start.day == 1 else _next_month(start)
+    after_end = end + timedelta(days=1)
+    last_full = after_end.replace(day=1)  # exclusive: months strictly before this are whole
+    totals = {}
+
+    def add(rows):
+        for merchant_id, spent, count in rows:
+            old_spent, old_count = totals.get(merchant_id, (ZERO, 0))
+            totals[merchant_id] = (old_spent + Decimal(spent or 0), old_count + count)
+
+    def raw(lo, hi):
+        return (
+            Transaction.objects.filter(user=user, direction='out', canonical_merchant__isnull=False,
+                                       txn_time__gte=_aware(lo), txn_time__lt=_aware(hi))
+            .values('canonical_merchant_id').annotate(s=Sum('amount'), n=Count('id'))
+            .values_list('canonical_merchant_id', 's', 'n').order_by()
+        )
+
+    if first_full < last_full:
+        add(
+            MerchantSpend.objects.filter(user=user, month__gte=first_full, month__lt=last_full)
+            .values('merchant_id').annotate(s=Sum('spent'), n=Sum('txn_count'))
+            .values_list('merchant_id', 's', 'n').order_by()
+        )
+        if start < first_full:
+            add(raw(start, first_full))
+        if last_full < after_end:
+            add(raw(last_full, after_end))
+    else:
+        add(raw(start, after_end))  # range inside a single month
+
+    ranked = sorted(
+        ((m, spent.quantize(ZERO), count) for m, (spent, count) in totals.items() if count > 0),
+        key=lambda row: (-row[1], row[0]),
+    )[:limit]
+    names = dict(Merchant.objects.filter(id__in=[m for m, _, _ in ranked]).values_list('id', 'name'))
+    return [{'merchant_id': m, 'name': names.get(m, ''), 'spent': spent, 'count': count} for m, spent, count in ranked]
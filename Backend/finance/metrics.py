@@ -0,0 +1,152 @@
+"""In-process request/SQL metrics, exposed in Prometheus text format.
+
+``collect_metrics`` middleware times each request, counts SQL statements and SQL
+time through ``connection.execute_wrapper`` and files them under the resolved URL
+name (``summary``, ``transaction-list``, ...). A request that runs the same SQL
+shape ``N_PLUS_ONE_THRESHOLD`` times or more is counted as an N+1 suspect and
+logged. Figures are per worker process; Prometheus sums them across workers.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; the implicit last bucket is +Inf.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'duration', 'queries', 'sql_time', 'n_plus_one')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.n_plus_one = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, method, duration, queries, sql_time, n_plus_one):
+        key = (route, method)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats()
+            stats.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += queries
+            stats.sql_time += sql_time
+            stats.n_plus_one += n_plus_one
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {key: _copy(stats) for key, stats in self._routes.items()}
+
+    def render_prometheus(self):
+        routes = sorted(self.snapshot().items())
+        lines = [
+            '# HELP finance_request_duration_seconds Request latency by route.',
+            '# TYPE finance_request_duration_seconds histogram',
+        ]
+        for (route, method), s in routes:
+            labels = f'route="{route}",method="{method}"'
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, s.buckets):
+                cumulative += n
+                lines.append(f'finance_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'finance_request_duration_seconds_bucket{{{labels},le="+Inf"}} {s.count}')
+            lines.append(f'finance_request_duration_seconds_sum{{{labels}}} {s.duration:.6f}')
+            lines.append(f'finance_request_duration_seconds_count{{{labels}}} {s.count}')
+        for name, help_text, attr, fmt in (
+            ('finance_sql_queries_total', 'SQL statements executed by route.', 'queries', '{}'),
+            ('finance_sql_duration_seconds_total', 'Time spent in SQL by route.', 'sql_time', '{:.6f}'),
+            ('finance_n_plus_one_requests_total', 'Requests that repeated one SQL shape past the threshold.',
+             'n_plus_one', '{}'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (route, method), s in routes:
+                lines.append(f'{name}{{route="{route}",method="{method}"}} {fmt.format(getattr(s, attr))}')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(stats):
+    clone = RouteStats()
+    clone.buckets = list(stats.buckets)
+    for attr in ('count', 'duration', 'queries', 'sql_time', 'n_plus_one'):
+        setattr(clone, attr, getattr(stats, attr))
+    return clone
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """Per-request ``execute_wrapper``: counts statements, SQL time and repeated shapes."""
+
+    __slots__ = ('queries', 'sql_time', 'shapes')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            # Django keeps parameters out of the SQL text, so the text is already the shape.
+            self.shapes[sql] = self.shapes.get(sql, 0) + 1
+
+    def repeated_shapes(self, threshold):
+        return {sql: n for sql, n in self.shapes.items() if n >= threshold}
+
+
+def collect_metrics(get_response, sink=None):
+    """Middleware factory; ``sink`` (default: the module ``registry``) receives the observations."""
+    threshold = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+    def middleware(request):
+        recorder = QueryRecorder()
+        # Same effect as ``with conn.execute_wrapper(recorder)`` for every alias, without
+        # the per-request context-manager overhead.
+        conns = connections.all()
+        for conn in conns:
+            conn.execute_wrappers.append(recorder)
+        start = time.perf_counter()
+        try:
+            response = get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            for conn in conns:
+                conn.execute_wrappers.remove(recorder)
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name if match else None) or 'unresolved'
+        suspects = recorder.repeated_shapes(threshold) if recorder.queries >= threshold else {}
+        if suspects:
+            sql, n = max(suspects.items(), key=lambda item: item[1])
+            logger.warning('Possible N+1 on %s: %d executions of %s', route, n, sql[:200])
+        (sink or registry).observe(
+            route, request.method, duration, recorder.queries, recorder.sql_time, int(bool(suspects)),
+        )
+        return response
+    return middleware
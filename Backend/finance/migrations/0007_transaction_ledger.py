@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:25
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_running_balances(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+    account_ids = Transaction.objects.values_list('account_id', flat=True).distinct().order_by()
+    for account_id in account_ids:
+        running = Decimal('0.00')
+        rows = list(Transaction.objects.filter(account_id=account_id).order_by('txn_time', 'pk'))
+        for txn in rows:
+            # Pre-existing transfers are single legs and never moved a balance.
+            if txn.direction == 'in':
+                running += txn.amount
+            elif txn.direction == 'out':
+                running -= txn.amount
+            txn.running_balance = running
+        Transaction.objects.bulk_update(rows, ['running_balance'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_auditlog_changes_encoder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='running_balance',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_peer',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='finance.transaction'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_side',
+            field=models.CharField(blank=True, choices=[('out', 'Outgoing'), ('in', 'Incoming')], max_length=3),
+        ),
+        migrations.RunPython(backfill_running_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_balancesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['txn_time'], name='finance_tra_txn_tim_7d1b1a_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0009_transaction_txn_time_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Merchant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('key', models.CharField(max_length=120, unique=True)),
+                ('name', models.CharField(max_length=120)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='canonical_merchant',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='finance.merchant'),
+        ),
+        migrations.CreateModel(
+            name='MerchantSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('txn_count', models.IntegerField(default=0)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spend', to='finance.merchant')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='merchant_spend', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'month'], name='finance_mer_user_id_f20633_idx')],
+                'unique_together': {('user', 'merchant', 'month')},
+            },
+        ),
+    ]
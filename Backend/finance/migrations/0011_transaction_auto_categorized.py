@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_merchants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='auto_categorized',
+            field=models.BooleanField(default=False),
+        ),
+    ]
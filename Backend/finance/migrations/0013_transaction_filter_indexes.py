@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_task_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'direction', 'txn_time'], name='finance_tra_user_id_c6657c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'category', 'txn_time'], name='finance_tra_user_id_cdc9f3_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:03
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_snapshot_watermark(apps, schema_editor):
+    # The old job snapshotted every account-day with activity through its last run,
+    # so the newest snapshot is a safe place to resume from.
+    db = schema_editor.connection.alias
+    BalanceSnapshot = apps.get_model('finance', 'BalanceSnapshot')
+    JobWatermark = apps.get_model('finance', 'JobWatermark')
+    last = BalanceSnapshot.objects.using(db).aggregate(last=Max('date'))['last']
+    if last is not None:
+        JobWatermark.objects.using(db).create(name='finance.snapshot_balances', through=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0017_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobWatermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('through', models.DateField()),
+            ],
+        ),
+        migrations.RunPython(seed_snapshot_watermark, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from decimal import Decimal
 
 User = get_user_model()
@@ -37,7 +38,7 @@ class Account(TimeStampedModel):
 		("other", "Other"),
 	]
 
-	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="accounts")
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="accounts", db_constraint=False)
 	name = models.CharField(max_length=100)
 	type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
 	institution = models.CharField(max_length=120, blank=True)
@@ -64,7 +65,7 @@ class Category(TimeStampedModel):
 		("income", "Income"),
 	]
 
-	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="categories")
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="categories", db_constraint=False)
 	name = models.CharField(max_length=100)
 	type = models.CharField(max_length=10, choices=CATEGORY_TYPES, default="expense")
 	icon = models.CharField(max_length=50, blank=True)  # store icon key/name used by frontend
@@ -92,7 +93,7 @@ class Budget(TimeStampedModel):
 		("custom", "Custom"),
 	]
 
-	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="budgets")
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="budgets", db_constraint=False)
 	category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="budgets")
 	period = models.CharField(max_length=10, choices=PERIOD_CHOICES, default="monthly")
 	start_date = models.DateField()
@@ -117,32 +118,69 @@ class Budget(TimeStampedModel):
 			raise models.ValidationError({"limit_amount": "Limit must be non-negative."})
 
 
+class Merchant(TimeStampedModel):
+	"""Normalized merchant shared by all users (see finance.merchants)."""
+	key = models.CharField(max_length=120, unique=True)
+	name = models.CharField(max_length=120)
+
+	class Meta:
+		ordering = ["name"]
+
+	def __str__(self):
+		return self.name
+
+
 class Transaction(TimeStampedModel):
 	DIRECTION = [
 		("out", "Expense"),
 		("in", "Income"),
 		("transfer", "Transfer"),
 	]
+	TRANSFER_SIDE = [
+		("out", "Outgoing"),
+		("in", "Incoming"),
+	]
 
-	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions")
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions", db_constraint=False)
 	account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="transactions")
 	category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions")
+	# Category was predicted (finance.categorizer), not chosen by the user; never used as training data.
+	auto_categorized = models.BooleanField(default=False)
 	direction = models.CharField(max_length=10, choices=DIRECTION, default="out")
 	amount = models.DecimalField(max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
 	currency = models.CharField(max_length=8, default="USD")
 	description = models.CharField(max_length=255, blank=True)
 	txn_time = models.DateTimeField()
 	merchant = models.CharField(max_length=120, blank=True)
+	canonical_merchant = models.ForeignKey(Merchant, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="transactions", db_constraint=False)
 	is_pending = models.BooleanField(default=False)
 	external_id = models.CharField(max_length=128, blank=True, db_index=True)
+	# Transfers are two linked legs (see finance.ledger); blank side for income/expense.
+	transfer_side = models.CharField(max_length=3, choices=TRANSFER_SIDE, blank=True)
+	transfer_peer = models.OneToOneField("self", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+	# Account balance right after this transaction, in (txn_time, id) order.
+	running_balance = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
+	# Hash of account, direction, amount, local day and merchant (finance.duplicates); blank for transfers.
+	fingerprint = models.CharField(max_length=32, blank=True, default="", editable=False)
 
 	class Meta:
 		indexes = [
 			models.Index(fields=["user", "txn_time"]),
+			models.Index(fields=["user", "fingerprint"]),  # duplicate probes
+			models.Index(fields=["user", "direction", "txn_time"]),  # direction filters, income/expense totals
+			models.Index(fields=["user", "category", "txn_time"]),  # category filters, budget progress
 			models.Index(fields=["account", "txn_time"]),
+			models.Index(fields=["txn_time"]),  # admin keyset paging and date hierarchy bounds
 		]
 		ordering = ["-txn_time"]
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Merchant text as loaded; saves that leave it alone keep their canonical merchant (finance.merchants).
+		instance._loaded_merchant = (instance.__dict__.get("merchant"), instance.__dict__.get("description"))
+		return instance
+
 	def __str__(self):
 		return f"{self.get_direction_display()} {self.amount} {self.currency} @ {self.txn_time:%Y-%m-%d}"
 
@@ -159,12 +197,61 @@ class Transaction(TimeStampedModel):
 				errors["category"] = "Expense transactions require an expense category."
 			if self.direction == "in" and self.category.type != "income":
 				errors["category"] = "Income transactions require an income category."
+		if self.direction == "transfer" and self.transfer_side not in ("in", "out"):
+			errors["direction"] = "Transfers are created in pairs; use a transfer request with a destination account."
+		if self.direction != "transfer" and self.transfer_side:
+			errors["direction"] = "Only transfer legs have a transfer side."
 		if self.currency and self.account and self.currency != self.account.currency:
 			errors["currency"] = "Transaction currency must match account currency."
 		if errors:
 			raise ValidationError(errors)
 
 
+class MerchantSpend(models.Model):
+	"""Expense total and count per user, merchant and month, kept current by the transaction signals."""
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="merchant_spend")
+	merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name="spend")
+	month = models.DateField()  # first day of the month, local time
+	spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	txn_count = models.IntegerField(default=0)
+
+	class Meta:
+		unique_together = ("user", "merchant", "month")
+		indexes = [
+			models.Index(fields=["user", "month"]),
+		]
+
+	def __str__(self):
+		return f"{self.user_id}/{self.merchant_id} {self.month:%Y-%m}: {self.spent}"
+
+
+class BalanceSnapshot(models.Model):
+	"""Closing balance of an account on a (local) day it had activity; readers forward-fill the gaps."""
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="balance_snapshots", db_constraint=False)
+	account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="snapshots")
+	date = models.DateField()
+	balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+	class Meta:
+		unique_together = ("account", "date")
+		indexes = [
+			models.Index(fields=["user", "date"]),
+		]
+		ordering = ["date"]
+
+	def __str__(self):
+		return f"{self.account_id} {self.date}: {self.balance}"
+
+
+class JobWatermark(models.Model):
+	"""How far a scheduled job has processed; one row per job in each database it runs on."""
+	name = models.CharField(max_length=100, primary_key=True)
+	through = models.DateField()
+
+	def __str__(self):
+		return f"{self.name} through {self.through}"
+
+
 class Goal(TimeStampedModel):
 	STATUS = [
 		("active", "Active"),
@@ -173,7 +260,7 @@ class Goal(TimeStampedModel):
 		("canceled", "Canceled"),
 	]
 
-	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="goals")
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="goals", db_constraint=False)
 	name = models.CharField(max_length=120)
 	target_amount = models.DecimalField(max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
 	deadline = models.DateField(null=True, blank=True)
@@ -211,7 +298,7 @@ class GoalContribution(TimeStampedModel):
 
 
 class Insight(TimeStampedModel):
-	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="insights")
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="insights", db_constraint=False)
 	title = models.CharField(max_length=200)
 	body = models.TextField()
 	severity = models.CharField(max_length=20, blank=True)  # e.g., info/warn/critical
@@ -223,6 +310,42 @@ class Insight(TimeStampedModel):
 		return self.title
 
 
+class MonthlyStatement(models.Model):
+	"""A user's stored statement for one month, built by the nightly pipeline (see finance.statements)."""
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="statements", db_constraint=False)
+	month = models.DateField()  # first day of the month
+	data = models.JSONField(encoder=DjangoJSONEncoder)  # accounts, categories, budgets, goals, totals
+	transaction_count = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		unique_together = ("user", "month")
+		ordering = ["-month"]
+
+	def __str__(self):
+		return f"Statement<{self.user_id}:{self.month:%Y-%m}>"
+
+
+class IdempotencyKey(models.Model):
+	"""A finished write, replayed for repeats of its ``Idempotency-Key`` header (see finance.idempotency)."""
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys")
+	key = models.CharField(max_length=255)
+	fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+	status_code = models.PositiveSmallIntegerField()
+	response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+	created_at = models.DateTimeField(auto_now_add=True)
+	expires_at = models.DateTimeField()
+
+	class Meta:
+		unique_together = ("user", "key")
+		indexes = [
+			models.Index(fields=["expires_at"]),  # pruning
+		]
+
+	def __str__(self):
+		return f"IdempotencyKey<{self.user_id}:{self.key}>"
+
+
 class AuditLog(models.Model):
 	ACTIONS = [
 		("create", "Create"),
@@ -230,15 +353,18 @@ class AuditLog(models.Model):
 		("delete", "Delete"),
 	]
 
-	user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="audit_logs")
+	user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="audit_logs", db_constraint=False)
 	action = models.CharField(max_length=10, choices=ACTIONS)
 	model_name = models.CharField(max_length=100)
 	object_id = models.CharField(max_length=64)
 	timestamp = models.DateTimeField(auto_now_add=True)
-	changes = models.JSONField(default=dict, blank=True)
+	changes = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)  # holds datetimes/decimals
 
 	class Meta:
-		indexes = [models.Index(fields=["model_name", "object_id"])]
+		indexes = [
+			models.Index(fields=["model_name", "object_id"]),
+			models.Index(fields=["timestamp"]),  # retention range scans
+		]
 		ordering = ["-timestamp"]
 
 	def __str__(self):
@@ -246,7 +372,7 @@ class AuditLog(models.Model):
 
 
 class UserActivity(models.Model):
-	user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='activities')
+	user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='activities', db_constraint=False)
 	path = models.CharField(max_length=255)
 	method = models.CharField(max_length=10)
 	ip = models.GenericIPAddressField(null=True, blank=True)
@@ -254,6 +380,64 @@ class UserActivity(models.Model):
 	timestamp = models.DateTimeField(auto_now_add=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["user", "timestamp"])]
+		indexes = [
+			models.Index(fields=["user", "timestamp"]),
+			models.Index(fields=["timestamp"]),  # retention range scans
+		]
 		ordering = ['-timestamp']
 
+
+
+class Task(models.Model):
+	"""A unit of background work claimed and run by ``manage.py run_worker`` (see finance.taskqueue)."""
+	STATUSES = [
+		("queued", "Queued"),
+		("running", "Running"),
+		("done", "Done"),
+		("failed", "Failed"),
+	]
+
+	name = models.CharField(max_length=100)
+	kwargs = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+	status = models.CharField(max_length=10, choices=STATUSES, default="queued")
+	run_at = models.DateTimeField()
+	attempts = models.PositiveIntegerField(default=0)
+	max_attempts = models.PositiveIntegerField(default=5)
+	locked_by = models.CharField(max_length=100, blank=True)
+	locked_until = models.DateTimeField(null=True, blank=True)  # lease; expired leases are reclaimed
+	last_error = models.TextField(blank=True)
+	dedupe_key = models.CharField(max_length=150, null=True, blank=True, unique=True)  # schedule slots
+	created_at = models.DateTimeField(auto_now_add=True)
+	started_at = models.DateTimeField(null=True, blank=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+	duration = models.FloatField(null=True, blank=True)  # seconds, last attempt
+
+	class Meta:
+		indexes = [
+			models.Index(fields=["status", "run_at"]),  # claim scans
+			models.Index(fields=["finished_at"]),  # pruning
+		]
+		ordering = ["run_at", "id"]
+
+	def __str__(self):
+		return f"Task<{self.name}:{self.status}>"
+
+
+class UserShard(models.Model):
+	"""Directory entry: the database holding a user's finance rows (see finance.sharding).
+
+	Sharded rows reference ``auth.User`` without a database constraint, since the user
+	row stays on the directory database.
+	"""
+	user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="shard")
+	alias = models.CharField(max_length=64)
+	moving = models.BooleanField(default=False)  # writes are refused while rows are copied
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=["alias"]),
+		]
+
+	def __str__(self):
+		return f"UserShard<{self.user_id}:{self.alias}>"
@@ -22,6 +22,18 @@ class HasMobileApiKey(BasePermission):
         return bool(provided and expected and provided == expected)
 
 
+class HasMetricsToken(BasePermission):
+    """Staff users, or scrapers sending the METRICS_TOKEN setting in X-Metrics-Token."""
+    message = "Metrics require a staff user or a valid metrics token."
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        expected = getattr(settings, 'METRICS_TOKEN', None)
+        provided = request.headers.get('X-Metrics-Token')
+        return bool(provided and expected and provided == expected)
+
+
 class IsOwnerOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
         user_id = getattr(obj, 'user_id', None) or getattr(getattr(obj, 'user', None), 'id', None)
@@ -0,0 +1,173 @@
+"""User provisioning: signup and bulk partner onboarding.
+
+Password hashing (PBKDF2 by default) dominates signup cost, so batches are hashed
+in a process pool (``manage.py provision_users``) or, inside web requests, which
+must not fork, a thread pool: PBKDF2 releases the GIL. The database work is a
+fixed handful of ``bulk_create`` calls regardless of batch size: users, profiles, default accounts, default
+categories. Tokens are minted straight from the created users instead of
+re-authenticating through ``TokenObtainPairSerializer``.
+"""
+import os
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Account, Category, UserProfile
+from .sharding import assign_shards, group_by_shard
+
+User = get_user_model()
+
+DEFAULT_ACCOUNT = ('Checking', 'checking')
+DEFAULT_CATEGORIES = [
+    ('Groceries', 'expense'),
+    ('Transport', 'expense'),
+    ('Salary', 'income'),
+]
+
+# Same bounds as ``UserProfile.monthly_income``; rejects NaN, infinities and extra places.
+MONTHLY_INCOME = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+
+
+@dataclass
+class SignupRequest:
+    email: str
+    password: str
+    monthly_income: Decimal = Decimal(0)
+    preferences: dict = field(default_factory=dict)
+
+
+@dataclass
+class ProvisionResult:
+    created: list = field(default_factory=list)  # [(user, profile)]
+    errors: list = field(default_factory=list)   # [{'index': i, 'email': ..., 'detail': ...}]
+
+
+def parse_signup(data):
+    """Validate one signup payload; returns ``(SignupRequest, None)`` or ``(None, detail)``."""
+    email = (data.get('email') or '').strip().lower()
+    password = data.get('password') or ''
+    if not email or '@' not in email:
+        return None, 'Valid email required.'
+    if len(password) < 6:
+        return None, 'Password must be at least 6 chars.'
+    try:
+        income = MONTHLY_INCOME.run_validation(data.get('monthly_income') or 0)
+    except serializers.ValidationError as exc:
+        return None, f'monthly_income: {exc.detail[0]}'
+    preferences = data.get('preferences')
+    return SignupRequest(email, password, income, preferences if isinstance(preferences, dict) else {}), None
+
+
+def _init_hash_worker():
+    import django
+    if not settings.configured:  # spawn/forkserver children start without settings
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Budget.settings')
+    django.setup()
+
+
+def hash_passwords(passwords, workers=None, threads=False):
+    """Hash ``passwords`` with the configured hasher; larger batches use a process pool, or threads with ``threads``."""
+    inline_max = getattr(settings, 'PROVISIONING_INLINE_HASH_MAX', 4)
+    if len(passwords) <= inline_max:
+        return [make_password(p) for p in passwords]
+    workers = workers or getattr(settings, 'PROVISIONING_HASH_WORKERS', None) or os.cpu_count() or 1
+    workers = min(workers, len(passwords))
+    if threads:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(make_password, passwords))
+    chunksize = max(1, len(passwords) // (workers * 4))
+    from concurrent.futures import ProcessPoolExecutor  # multiprocessing is only needed for large batches
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_hash_worker) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def seed_defaults(users):
+    """Create the default account and categories for freshly created ``users`` (two INSERTs per shard)."""
+    name, acc_type = DEFAULT_ACCOUNT
+    for alias, group in group_by_shard(users).items():
+        Account.objects.using(alias).bulk_create([Account(user=u, name=name, type=acc_type, balance=0) for u in group])
+        Category.objects.using(alias).bulk_create([
+            Category(user=u, name=cname, type=ctype, is_custom=False)
+            for u in group for cname, ctype in DEFAULT_CATEGORIES
+        ])
+
+
+def provision_users(signups, *, workers=None, threads=False):
+    """Create users, profiles and defaults for a list of ``SignupRequest``.
+
+    Emails that already exist (or repeat within the batch) are reported in
+    ``errors`` and skipped; everything else is created in one transaction. If a
+    concurrent signup takes an email between the check and the insert, that
+    entry becomes an error and the rest are inserted again.
+    """
+    result = ProvisionResult()
+    seen = set()
+    pending = []
+    for i, req in enumerate(signups):
+        if req.email in seen:
+            result.errors.append({'index': i, 'email': req.email, 'detail': 'Duplicate email in batch.'})
+            continue
+        seen.add(req.email)
+        pending.append((i, req))
+    pending = _drop_existing(pending, result)
+    if not pending:
+        return result
+
+    hashes = hash_passwords([req.password for _, req in pending], workers=workers, threads=threads)
+    rows = [(i, req, pw_hash) for (i, req), pw_hash in zip(pending, hashes)]
+    while rows:
+        try:
+            result.created = _insert(rows)
+            break
+        except IntegrityError:
+            before = len(rows)
+            kept = {i for i, _ in _drop_existing([(i, req) for i, req, _ in rows], result)}
+            rows = [row for row in rows if row[0] in kept]
+            if len(rows) == before:  # not a taken email
+                raise
+    result.errors.sort(key=lambda e: e['index'])
+    return result
+
+
+def _drop_existing(pending, result):
+    """``pending`` without emails that already have a user; those become errors in ``result``."""
+    emails = [req.email for _, req in pending]
+    existing = set(User.objects.filter(username__in=emails).values_list('username', flat=True))
+    for i, req in pending:
+        if req.email in existing:
+            result.errors.append({'index': i, 'email': req.email, 'detail': 'User already exists.'})
+    return [(i, req) for i, req in pending if req.email not in existing]
+
+
+def _insert(rows):
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=req.email, email=req.email, password=pw_hash) for _, req, pw_hash in rows
+        ])
+        profiles = UserProfile.objects.bulk_create([
+            UserProfile(user=u, monthly_income=req.monthly_income, preferences=req.preferences)
+            for u, (_, req, _) in zip(users, rows)
+        ])
+        assign_shards(users)
+        seed_defaults(users)
+    return list(zip(users, profiles))
+
+
+def register_user(signup):
+    """Single-user signup on the bulk path. Raises ``IntegrityError`` if the email is taken."""
+    result = provision_users([signup])
+    if result.errors:
+        raise IntegrityError(result.errors[0]['detail'])
+    return result.created[0]
+
+
+def token_pair(user):
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -0,0 +1,203 @@
+"""Query-plan audit for the finance API.
+
+``audit_plans`` drives each endpoint and filter combination in ``PLAN_CASES``
+through the DRF test client as a seeded user. It records every ``SELECT`` the
+request runs and asks the database how it would execute it: ``EXPLAIN QUERY
+PLAN`` on SQLite, ``EXPLAIN`` on PostgreSQL. Two kinds of finding are reported:
+
+* a full scan of one of the ``LARGE_TABLES``;
+* on SQLite, a transaction-table index search that constrains fewer columns than
+  the case expects, e.g. ``(user_id=?)`` for a direction filter that the
+  ``(user, direction, txn_time)`` index could narrow further.
+
+The test suite fails on findings (``QueryPlanTests``); the ``audit_query_plans``
+command prints them for a real database.
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmark import _client_for
+from .models import (
+    Account, AuditLog, BalanceSnapshot, Category, MerchantSpend, Task, Transaction, UserActivity,
+)
+
+# Tables that grow with usage; small per-user tables (accounts, categories, budgets) may be scanned.
+LARGE_TABLES = frozenset(m._meta.db_table for m in (
+    Transaction, AuditLog, UserActivity, BalanceSnapshot, MerchantSpend, Task,
+))
+
+# (label, url name, needs account pk, query string, expected columns). ``{account}``,
+# ``{category}``, ``{day}``, ``{start}`` and ``{end}`` are filled from the audited
+# user's data. On SQLite, every index search of the transaction table a case runs
+# must constrain at least the expected columns.
+PLAN_CASES = [
+    ('transactions', 'transaction-list', False, '', ('user_id',)),
+    ('transactions by direction', 'transaction-list', False, 'direction=out', ('user_id', 'direction')),
+    ('transactions by category', 'transaction-list', False, 'category={category}', ('user_id', 'category_id')),
+    ('transactions by account', 'transaction-list', False, 'account={account}', ('account_id',)),
+    ('transactions on a day', 'transaction-list', False, 'txn_time__date={day}', ('user_id', 'txn_time')),
+    ('transactions in a range', 'transaction-list', False,
+     'txn_time__date__gte={start}&txn_time__date__lte={end}', ('user_id', 'txn_time')),
+    ('expenses in a range', 'transaction-list', False,
+     'direction=out&txn_time__date__gte={start}&txn_time__date__lte={end}', ('user_id', 'direction', 'txn_time')),
+    ('category in a range', 'transaction-list', False,
+     'category={category}&txn_time__date__gte={start}&txn_time__date__lte={end}',
+     ('user_id', 'category_id', 'txn_time')),
+    ('transactions by amount', 'transaction-list', False, 'amount__gte=10&amount__lte=500', ('user_id',)),
+    ('pending transactions', 'transaction-list', False, 'is_pending=true', ('user_id',)),
+    ('transaction search', 'transaction-list', False, 'search=coffee', ('user_id',)),
+    ('transactions by amount order', 'transaction-list', False, 'ordering=-amount', ('user_id',)),
+    ('accounts', 'account-list', False, '', ()),
+    ('categories', 'category-list', False, '', ()),
+    ('budgets', 'budget-list', False, '', ()),
+    ('account balance', 'account-balance', True, 'at={end}', ('account_id', 'txn_time')),
+    ('account statement', 'account-statement', True, 'start={start}&end={end}', ('account_id', 'txn_time')),
+    ('summary', 'summary', False, '', ('user_id', 'direction')),
+    ('dashboard', 'dashboard', False, '', ('user_id',)),
+    ('category spending', 'category-spending', False, '', ('user_id',)),  # either composite serves the GROUP BY
+    ('category spending in a range', 'category-spending', False, 'start={start}&end={end}',
+     ('user_id', 'direction', 'txn_time')),
+    ('budget progress', 'budget-progress', False, '', ('user_id', 'txn_time')),
+    ('net worth', 'net-worth', False, 'start={start}&end={end}', ('account_id', 'txn_time')),
+    ('top merchants', 'merchant-report', False, 'start={start}&end={end}', ('user_id', 'txn_time')),
+    ('export', 'export-data', False, '', ('user_id',)),
+]
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)')
+_SQLITE_SEARCH = re.compile(r'^SEARCH (\w+) USING .*?\((.*)\)$')
+_CONSTRAINED = re.compile(r'(\w+)[=<>]')
+_PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+_ALIAS = re.compile(r'"(\w+)" (U\d+|T\d+)\b')
+
+
+@dataclass
+class Finding:
+    case: str
+    kind: str  # 'full scan' or 'weak index'
+    table: str
+    detail: str
+    sql: str
+
+
+@dataclass
+class PlanReport:
+    statements: int = 0
+    findings: list = field(default_factory=list)
+    plans: dict = field(default_factory=dict)  # case label -> [(sql, [plan lines])]
+
+
+class _StatementRecorder:
+    """``execute_wrapper`` keeping each ``SELECT`` with its parameters."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params=()):
+    """Plan lines for one statement on the default connection."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN ' + sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(sql, plan, tables=LARGE_TABLES):
+    """``(table, plan line)`` for every full scan of ``tables`` in ``plan``."""
+    aliases = dict((alias, table) for table, alias in _ALIAS.findall(sql))
+    pattern = _SQLITE_SCAN if connection.vendor == 'sqlite' else _PG_SEQ_SCAN
+    found = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in tables:
+                found.append((table, line.strip()))
+    return found
+
+
+def weak_searches(sql, plan, expected, table=Transaction._meta.db_table):
+    """SQLite plan lines searching ``table`` on fewer than the ``expected`` columns."""
+    if connection.vendor != 'sqlite' or not expected:
+        return []
+    aliases = dict((alias, name) for name, alias in _ALIAS.findall(sql))
+    found = []
+    for line in plan:
+        match = _SQLITE_SEARCH.match(line.strip())
+        if match and aliases.get(match.group(1), match.group(1)) == table:
+            if not set(expected) <= set(_CONSTRAINED.findall(match.group(2))):
+                found.append(line.strip())
+    return found
+
+
+def case_values(user):
+    """Placeholder values for ``PLAN_CASES`` from ``user``'s data."""
+    latest = Transaction.objects.filter(user=user).order_by('-txn_time').values_list('txn_time', flat=True).first()
+    end = timezone.localdate(latest) if latest else timezone.localdate()
+    return {
+        'account': Account.objects.filter(user=user).values_list('pk', flat=True).first(),
+        'category': Category.objects.filter(user=user, type='expense').values_list('pk', flat=True).first(),
+        'day': end.isoformat(),
+        'start': (end - timedelta(days=30)).isoformat(),
+        'end': end.isoformat(),
+    }
+
+
+def _populated(tables, min_rows):
+    with connection.cursor() as cursor:
+        found = set()
+        for table in tables:
+            cursor.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {connection.ops.quote_name(table)} LIMIT %s) t', [min_rows])
+            if cursor.fetchone()[0] >= min_rows:
+                found.add(table)
+        return found
+
+
+def audit_plans(user, cases=PLAN_CASES, tables=LARGE_TABLES, min_rows=1000):
+    """Run every case as ``user`` and explain its ``SELECT`` statements; returns a ``PlanReport``.
+
+    Tables holding fewer than ``min_rows`` rows are not judged: scanning them is the right plan.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')  # plan with statistics, as a long-lived database would
+    tables = _populated(tables, min_rows)
+    judge_searches = Transaction._meta.db_table in tables
+    values = case_values(user)
+    client = _client_for(user)
+    report = PlanReport()
+    rates = {scope: None for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+    unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}
+    with override_settings(REST_FRAMEWORK=unthrottled):
+        for label, name, needs_pk, query, expected in cases:
+            url = reverse(name, kwargs={'pk': values['account']} if needs_pk else {})
+            if query:
+                url += '?' + query.format(**values)
+            recorder = _StatementRecorder()
+            with connection.execute_wrapper(recorder):
+                response = client.get(url)
+            if response.status_code != 200:
+                raise AssertionError(f'{label}: GET {url} returned {response.status_code}')
+            report.plans[label] = []
+            for sql, params in recorder.statements:
+                plan = explain(sql, params)
+                report.statements += 1
+                report.plans[label].append((sql, plan))
+                for table, detail in full_scans(sql, plan, tables):
+                    report.findings.append(Finding(label, 'full scan', table, detail, sql))
+                for detail in weak_searches(sql, plan, expected if judge_searches else ()):
+                    report.findings.append(Finding(label, 'weak index', Transaction._meta.db_table, detail, sql))
+    return report
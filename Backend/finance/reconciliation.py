@@ -0,0 +1,136 @@
+"""Recompute stored ``Account.balance`` from the transaction ledger.
+
+Users are split into contiguous id ranges ("shards"). For each shard a single
+grouped aggregate over ``Transaction`` yields every account's expected balance
+(income and incoming transfer legs minus expenses and outgoing legs; the ledger starts at zero, as accounts are created with
+a zero balance). Shards run in a process pool and are independent, so the job
+scales with cores and can be resumed from any shard.
+
+The scan reads totals and balances in separate statements, so a write landing
+between them looks like drift. Repairs therefore lock each drifted account row
+(``SELECT .. FOR UPDATE``) and recompute its ledger total under the lock; only an
+account whose locked balance still disagrees is rewritten.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .models import Account, Transaction
+
+ZERO = Decimal('0.00')
+
+
+@dataclass
+class Drift:
+    account_id: int
+    user_id: int
+    stored: Decimal
+    expected: Decimal
+
+    @property
+    def delta(self):
+        return self.expected - self.stored
+
+
+@dataclass
+class ShardResult:
+    lo: int
+    hi: int
+    accounts: int = 0
+    transactions: int = 0
+    repaired: int = 0
+    elapsed: float = 0.0
+    drifts: list = field(default_factory=list)
+
+
+def expected_balances(lo, hi):
+    """``{account_id: (expected_balance, txn_count)}`` for users with ``lo <= id < hi``."""
+    return _ledger_totals(Transaction.objects.filter(user_id__gte=lo, user_id__lt=hi))
+
+
+def _ledger_totals(transactions):
+    rows = (
+        transactions
+        .values('account_id')
+        .annotate(
+            inflow=Sum('amount', filter=Q(direction='in') | Q(direction='transfer', transfer_side='in')),
+            outflow=Sum('amount', filter=Q(direction='out') | Q(direction='transfer', transfer_side='out')),
+            n=Count('id'),
+        )
+        .order_by()
+    )
+    # SQLite sums DECIMAL columns as floats; quantize back to cents before comparing.
+    return {
+        r['account_id']: (((r['inflow'] or ZERO) - (r['outflow'] or ZERO)).quantize(ZERO), r['n'])
+        for r in rows
+    }
+
+
+def reconcile_shard(lo, hi, repair=False):
+    t0 = time.perf_counter()
+    result = ShardResult(lo, hi)
+    expected = expected_balances(lo, hi)
+    for account_id, user_id, stored in Account.objects.filter(user_id__gte=lo, user_id__lt=hi).values_list(
+        'id', 'user_id', 'balance'
+    ).order_by():
+        result.accounts += 1
+        want, n = expected.get(account_id, (ZERO, 0))
+        result.transactions += n
+        if (stored or ZERO) != want:
+            result.drifts.append(Drift(account_id, user_id, stored or ZERO, want))
+    if repair and result.drifts:
+        with transaction.atomic(using=router.db_for_write(Account)):
+            for d in result.drifts:
+                result.repaired += _repair(d.account_id)
+    result.elapsed = time.perf_counter() - t0
+    return result
+
+
+def _repair(account_id):
+    """Rewrite one account's balance from the ledger under its row lock; returns 1 if it changed."""
+    stored = Account.objects.select_for_update().filter(pk=account_id).values_list('balance', flat=True).first()
+    if stored is None:
+        return 0
+    want, _ = _ledger_totals(Transaction.objects.filter(account_id=account_id)).get(account_id, (ZERO, 0))
+    if stored == want:
+        return 0
+    return Account.objects.filter(pk=account_id).update(balance=want)
+
+
+def user_shards(shard_size):
+    bounds = Account.objects.aggregate(lo=Min('user_id'), hi=Max('user_id'))
+    if bounds['lo'] is None:
+        return []
+    return [(lo, lo + shard_size) for lo in range(bounds['lo'], bounds['hi'] + 1, shard_size)]
+
+
+def _init_worker():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Budget.settings')
+    django.setup()
+
+
+def _run_shard(args):
+    lo, hi, repair = args
+    try:
+        return reconcile_shard(lo, hi, repair)
+    finally:
+        connections.close_all()
+
+
+def reconcile_all(shard_size=1000, workers=None, repair=False):
+    """Yield a ``ShardResult`` per shard as they finish; ``workers=0`` runs inline."""
+    shards = user_shards(shard_size)
+    if workers == 0 or len(shards) <= 1:
+        for lo, hi in shards:
+            yield reconcile_shard(lo, hi, repair)
+        return
+    from concurrent.futures import ProcessPoolExecutor  # keeps multiprocessing out of web workers
+    # Children must open their own connections rather than share the parent's.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker) as pool:
+        yield from pool.map(_run_shard, [(lo, hi, repair) for lo, hi in shards])
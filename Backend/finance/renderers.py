@@ -0,0 +1,77 @@
+"""Fast renderers/parsers selected through DRF content negotiation.
+
+* ``FastJSONRenderer`` - serves ``application/json`` with orjson when it is
+  installed, producing the same document as DRF's ``JSONRenderer`` (Decimals as
+  numbers, UTC datetimes with a ``Z`` suffix); falls back to ``JSONRenderer``
+  when orjson is missing or an indented response is requested.
+* ``MessagePackRenderer`` / ``MessagePackParser`` - ``application/msgpack``, only
+  enabled in settings when the ``msgpack`` package is importable.
+
+Both libraries are optional.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+# DRF's encoder knows how to turn Decimals, lazy strings, querysets, timedeltas,
+# etc. into JSON-native values; reuse it for anything the fast encoders reject.
+_fallback_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    if orjson is not None:
+        _options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_fallback_default, option=self._options)
+        except TypeError:
+            # e.g. integers beyond 64 bits; let the stdlib path handle the odd case.
+            return super().render(data, accepted_media_type, renderer_context)
+        # Match JSONRenderer: escape U+2028/U+2029 so the output is valid JavaScript.
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # datetime=False hands dates to the DRF encoder, so they match the JSON strings.
+        return msgpack.packb(data, default=_fallback_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+def to_columnar(rows, fields):
+    """``[{'a': 1, 'b': 2}, ...]`` -> ``{'a': [1, ...], 'b': [2, ...]}`` (keys in ``fields`` order)."""
+    return {name: [row.get(name) for row in rows] for name in fields}
@@ -0,0 +1,121 @@
+"""Query builders shared by the sync report views and their async variants.
+
+Each ``*_parts`` function returns independent zero-argument callables, one per
+query, so the sync views can run them in sequence and the async views can run
+them concurrently; the matching ``*_payload`` turns their results into the
+response body.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import models
+from django.db.models.functions import Coalesce
+
+from .models import Account, Budget, Transaction
+from .snapshots import day_start
+
+
+def summary_parts(user):
+    return {
+        'balances': lambda: list(Account.objects.filter(user=user).values_list('balance', flat=True)),
+        'income': lambda: Transaction.objects.filter(user=user, direction='in').aggregate(total=models.Sum('amount'))['total'] or 0,
+        'expense': lambda: Transaction.objects.filter(user=user, direction='out').aggregate(total=models.Sum('amount'))['total'] or 0,
+    }
+
+
+def summary_payload(balances, income, expense):
+    return {
+        'total_balance': sum(balances) if balances else 0,
+        'income_total': income,
+        'expense_total': expense,
+        'net_cashflow': income - expense,
+    }
+
+
+def in_local_dates(qs, start=None, end=None):
+    """Restrict ``qs`` to ``start <= local date of txn_time <= end`` as an indexable ``txn_time`` range."""
+    if start:
+        start = start if isinstance(start, date) else date.fromisoformat(start)
+        qs = qs.filter(txn_time__gte=day_start(start))
+    if end:
+        end = end if isinstance(end, date) else date.fromisoformat(end)
+        qs = qs.filter(txn_time__lt=day_start(end + timedelta(days=1)))
+    return qs
+
+
+def category_spending_queryset(user, start=None, end=None):
+    qs = in_local_dates(Transaction.objects.filter(user=user, direction='out'), start, end)
+    return qs.values('category__id', 'category__name').annotate(total=models.Sum('amount')).order_by('-total')
+
+
+def budgets_queryset(user, start=None, end=None):
+    budgets = Budget.objects.filter(user=user)
+    if start and end:
+        budgets = budgets.filter(start_date__lte=end, end_date__gte=start)
+    return budgets.select_related('category')
+
+
+def budget_spent(user, budget):
+    qs = Transaction.objects.filter(user=user, direction='out', category=budget.category)
+    return in_local_dates(qs, budget.start_date, budget.end_date).aggregate(total=models.Sum('amount'))['total'] or 0
+
+
+def budget_progress_row(budget, spent):
+    return {
+        'budget_id': budget.id,
+        'category_id': budget.category_id,
+        'category': budget.category.name,
+        'period': budget.period,
+        'start_date': budget.start_date,
+        'end_date': budget.end_date,
+        'limit_amount': budget.limit_amount,
+        'spent': spent,
+        'remaining': budget.limit_amount - spent,
+        'variance': budget.limit_amount - spent,
+    }
+
+
+DASHBOARD_SECTIONS = ('summary', 'accounts', 'budgets', 'category_spending', 'recent_transactions')
+
+
+def budgets_with_spent(user, day):
+    """Budgets active on ``day`` annotated with ``spent``, in one query (same rule as ``budget_spent``)."""
+    spent = (
+        Transaction.objects.filter(
+            user=user, direction='out', category=models.OuterRef('category'),
+            txn_time__date__gte=models.OuterRef('start_date'), txn_time__date__lte=models.OuterRef('end_date'),
+        )
+        .values('category').annotate(total=models.Sum('amount')).values('total')
+    )
+    return (
+        Budget.objects.filter(user=user, start_date__lte=day, end_date__gte=day)
+        .select_related('category')
+        .annotate(spent=Coalesce(models.Subquery(spent), models.Value(Decimal(0)), output_field=models.DecimalField()))
+    )
+
+
+def dashboard_parts(user, sections, today, recent=10, top_budgets=5):
+    """One query per part; the accounts part is shared by the summary and accounts sections."""
+    first = today.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    parts = {}
+    if 'summary' in sections or 'accounts' in sections:
+        parts['accounts'] = lambda: list(Account.objects.filter(user=user).order_by('id'))
+    if 'summary' in sections:
+        parts['totals'] = lambda: Transaction.objects.filter(user=user, direction__in=('in', 'out')).aggregate(
+            income=models.Sum('amount', filter=models.Q(direction='in')),
+            expense=models.Sum('amount', filter=models.Q(direction='out')),
+        )
+    if 'budgets' in sections:
+        def budgets():
+            rows = list(budgets_with_spent(user, today))
+            rows.sort(key=lambda b: (-(b.spent / b.limit_amount if b.limit_amount else 0), b.id))
+            return rows[:top_budgets]
+        parts['budgets'] = budgets
+    if 'category_spending' in sections:
+        parts['category_spending'] = lambda: list(category_spending_queryset(user, first, last))
+    if 'recent_transactions' in sections:
+        parts['recent_transactions'] = lambda: list(
+            Transaction.objects.filter(user=user).order_by('-txn_time', '-id')[:recent]
+        )
+    return parts
@@ -0,0 +1,143 @@
+"""Retention for the append-only log tables (UserActivity, AuditLog).
+
+Expired rows are processed one calendar month at a time. Each month is read in
+primary-key batches, appended to ``<archive_dir>/<table>/<YYYY-MM>.ndjson.gz`` and
+then deleted by primary key in its own short transaction, so no statement holds a
+lock for longer than one batch. A batch is flushed to the archive before its delete
+commits, so a crash in between never loses rows; the restarted run appends those
+rows again and ``read_archive`` keeps only the first copy of each primary key.
+"""
+import gzip
+import json
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import AuditLog, UserActivity
+
+DEFAULT_RETENTION_DAYS = {
+    'UserActivity': 90,
+    'AuditLog': 365,
+}
+
+RETAINED_MODELS = {
+    'UserActivity': UserActivity,
+    'AuditLog': AuditLog,
+}
+
+
+@dataclass
+class MonthResult:
+    model_name: str
+    month: str
+    archived: int = 0
+    deleted: int = 0
+
+
+def retention_days(model_name):
+    configured = getattr(settings, 'FINANCE_RETENTION_DAYS', {}) or {}
+    return configured.get(model_name, DEFAULT_RETENTION_DAYS[model_name])
+
+
+def archive_dir():
+    return Path(getattr(settings, 'FINANCE_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+
+
+def _month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(dt):
+    return _month_start(dt + timedelta(days=32))
+
+
+def expired_months(model, cutoff):
+    """Yield ``(start, end)`` month ranges that contain rows older than ``cutoff``.
+
+    Empty months are skipped with one indexed MIN() probe per populated month.
+    """
+    floor = None
+    while True:
+        qs = model.objects.filter(timestamp__lt=cutoff)
+        if floor is not None:
+            qs = qs.filter(timestamp__gte=floor)
+        oldest = qs.aggregate(oldest=Min('timestamp'))['oldest']
+        if oldest is None:
+            return
+        start = _month_start(oldest)
+        end = min(_next_month(start), cutoff)
+        yield start, end
+        floor = end
+
+
+def purge_range(model, start, end, *, batch_size=1000, archive_to=None, pause=0.0, dry_run=False):
+    """Archive (optionally) and delete rows of ``model`` with ``start <= timestamp < end``.
+
+    Returns ``(archived, deleted)``.
+    """
+    base = model.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by('pk')
+    if dry_run:
+        return base.count(), 0
+    archived = deleted = 0
+    out = None
+    try:
+        last_pk = 0
+        while True:
+            rows = list(base.filter(pk__gt=last_pk).values()[:batch_size])
+            if not rows:
+                break
+            if archive_to is not None:
+                if out is None:
+                    archive_to.parent.mkdir(parents=True, exist_ok=True)
+                    out = gzip.open(archive_to, 'at', encoding='utf-8')
+                out.writelines(json.dumps(row, default=str) + '\n' for row in rows)
+                out.flush()
+                archived += len(rows)
+            ids = [row['id'] for row in rows]
+            with transaction.atomic(using=router.db_for_write(model)):
+                deleted += model.objects.filter(pk__in=ids).delete()[0]
+            last_pk = ids[-1]
+            if pause:
+                time.sleep(pause)
+    finally:
+        if out is not None:
+            out.close()
+    return archived, deleted
+
+
+def apply_retention(model_names=None, *, now=None, batch_size=1000, archive=True, pause=0.0, dry_run=False):
+    """Run retention for the given log models and yield a ``MonthResult`` per month touched."""
+    now = now or timezone.now()
+    for name in model_names or RETAINED_MODELS:
+        model = RETAINED_MODELS[name]
+        cutoff = now - timedelta(days=retention_days(name))
+        for start, end in expired_months(model, cutoff):
+            label = f'{start:%Y-%m}'
+            target = archive_dir() / model._meta.db_table / f'{label}.ndjson.gz' if archive else None
+            archived, deleted = purge_range(
+                model, start, end,
+                batch_size=batch_size, archive_to=target, pause=pause, dry_run=dry_run,
+            )
+            yield MonthResult(name, label, archived, deleted)
+
+
+def read_archive(path):
+    """Iterate rows of an archived month (handy for restores and audits).
+
+    Rows archived twice by an interrupted and restarted run are yielded once.
+    """
+    seen = set()
+    with gzip.open(path, 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            row = json.loads(line)
+            if row['id'] in seen:
+                continue
+            seen.add(row['id'])
+            yield row
+
@@ -0,0 +1,367 @@
+"""Database routing for the finance app.
+
+Read-heavy endpoints (summary, reports, export and viewset list/retrieve) opt in to
+replica reads through ``ReplicaReadMixin``. Everything else, including all writes,
+stays on ``default``. A user who has just written is pinned to the primary for
+``REPLICA_READ_YOUR_WRITES_SECONDS`` so they never read their own stale data. The pin
+must be visible to every worker, so it lives in ``REPLICA_PIN_STORE``: by default a
+small SQLite file in WAL mode shared by the workers on the host (as the throttle
+buckets), or ``{'BACKEND': 'cache', 'ALIAS': ...}`` for a cache every host shares.
+
+With ``DATABASE_SHARDS`` configured, ``ShardRouter`` sends each user's finance
+rows (``SHARDED_MODELS``) to the shard named by their ``UserShard`` directory
+entry; ``auth.User``, profiles and everything else stay on ``default``, the
+directory. Saves and related-object lookups find the shard from their instance.
+Manager calls (``filter``, ``objects.create``, ``bulk_create``) carry none and go
+to the user bound to the request (``UserShardMixin``) or block
+(``use_user_shard``, ``use_shard``), so code outside a request binds one first.
+Users without a directory entry live on ``default``, which is where all rows
+were before sharding; ``manage.py reshard_users`` moves them.
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_DB = 'default'
+
+# Rows that live with their user. Children come after their parents (the copy order when moving a user).
+SHARDED_MODELS = (
+    'finance.Category', 'finance.Account', 'finance.Budget', 'finance.Goal', 'finance.GoalContribution',
+    'finance.Transaction', 'finance.BalanceSnapshot', 'finance.Insight', 'finance.AuditLog', 'finance.UserActivity',
+    'finance.MonthlyStatement',
+)
+# Job bookkeeping kept in each database holding finance rows, beside the rows it describes.
+PER_DATABASE_MODELS = ('finance.JobWatermark',)
+
+# True while the current request/task may serve reads from a replica.
+_replica_reads = ContextVar('finance_replica_reads', default=False)
+# Shard alias for sharded-model queries that carry no instance (set per request, task or block).
+_bound_shard = ContextVar('finance_bound_shard', default=None)
+_replica_cycle = None
+_replica_cycle_key = None
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []) or [])
+
+
+def _next_replica():
+    global _replica_cycle, _replica_cycle_key
+    aliases = tuple(replica_aliases())
+    if not aliases:
+        return PRIMARY_DB
+    if aliases != _replica_cycle_key:
+        _replica_cycle_key = aliases
+        _replica_cycle = itertools.cycle(aliases)
+    return next(_replica_cycle)
+
+
+class SQLitePinStore:
+    # Expired pins are deleted every this many marks per process.
+    prune_every = 1000
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS recent_write (user_id INTEGER PRIMARY KEY, until REAL NOT NULL)')
+            self._local.conn, self._local.pid, self._local.marks = conn, os.getpid(), 0
+        return conn
+
+    def mark(self, user_id, until):
+        conn = self._conn()
+        conn.execute(
+            'INSERT INTO recent_write (user_id, until) VALUES (?1, ?2) '
+            'ON CONFLICT(user_id) DO UPDATE SET until = max(until, ?2)', (user_id, until),
+        )
+        self._local.marks += 1
+        if self._local.marks % self.prune_every == 0:
+            conn.execute('DELETE FROM recent_write WHERE until <= ?', (time.time(),))
+
+    def pinned(self, user_id, now):
+        return self._conn().execute(
+            'SELECT 1 FROM recent_write WHERE user_id = ? AND until > ?', (user_id, now),
+        ).fetchone() is not None
+
+
+class CachePinStore:
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def mark(self, user_id, until):
+        self.cache.set(f'finance:recent-write:{user_id}', until, timeout=max(1, int(until - time.time()) + 1))
+
+    def pinned(self, user_id, now):
+        return (self.cache.get(f'finance:recent-write:{user_id}') or 0) > now
+
+
+_pin_store = None
+_pin_store_lock = threading.Lock()
+
+
+def get_pin_store():
+    global _pin_store
+    if _pin_store is None:
+        with _pin_store_lock:
+            if _pin_store is None:
+                conf = getattr(settings, 'REPLICA_PIN_STORE', {'BACKEND': 'cache'})
+                backend = conf.get('BACKEND', 'cache')
+                if backend == 'sqlite':
+                    _pin_store = SQLitePinStore(conf['PATH'])
+                elif backend == 'cache':
+                    _pin_store = CachePinStore(conf.get('ALIAS', 'default'))
+                else:
+                    raise ImproperlyConfigured(f'Unknown REPLICA_PIN_STORE backend {backend!r}')
+    return _pin_store
+
+
+@receiver(setting_changed)
+def reset_pin_store(*, setting=None, **kwargs):
+    """Drop the cached store when REPLICA_PIN_STORE changes (override_settings in tests)."""
+    global _pin_store
+    if setting in (None, 'REPLICA_PIN_STORE'):
+        with _pin_store_lock:
+            _pin_store = None
+
+
+def mark_recent_write(user_id):
+    """Pin ``user_id`` to the primary for the read-your-writes window, in every worker."""
+    window = getattr(settings, 'REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+    if user_id and window > 0:
+        get_pin_store().mark(user_id, time.time() + window)
+
+
+def has_recent_write(user_id):
+    return bool(user_id) and get_pin_store().pinned(user_id, time.time())
+
+
+@contextmanager
+def use_primary():
+    """Force reads inside the block onto the primary (e.g. check-then-create seeding)."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def use_replica():
+    """Allow reads inside the block to go to a replica (jobs, management commands)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    """Send opted-in reads to ``settings.DATABASE_REPLICAS``, everything else to ``default``."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return _next_replica()
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY_DB, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas normally receive schema through replication; allowing migrate lets
+        # a plain SQLite file stand in for one locally (manage.py migrate --database replica_0).
+        return None
+
+
+class ReplicaReadMixin:
+    """Let safe requests on this view read from a replica.
+
+    ``replica_actions`` limits replica reads to those viewset actions; ``None`` means
+    every safe request on the view. Authentication and permission checks always run
+    on the primary; only the handler body is routed.
+    """
+
+    replica_actions = None
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _replica_reads.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self._reads_from_replica(request):
+            _replica_reads.set(True)
+
+    def _reads_from_replica(self, request):
+        if request.method not in SAFE_METHODS or not replica_aliases():
+            return False
+        if self.replica_actions is not None and getattr(self, 'action', None) not in self.replica_actions:
+            return False
+        return not has_recent_write(getattr(request.user, 'id', None))
+
+
+def shard_aliases():
+    return list(getattr(settings, 'DATABASE_SHARDS', []) or [])
+
+
+def data_aliases():
+    """Every database that may hold finance rows: ``default`` (unmoved users) and the shards."""
+    return [PRIMARY_DB, *(a for a in shard_aliases() if a != PRIMARY_DB)]
+
+
+def home_shard(user_id, shards=None):
+    """Hash placement: the shard a user is assigned to on signup and moved to by resharding."""
+    shards = shards if shards is not None else shard_aliases()
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def _placement_key(user_id):
+    return f'finance:shard:{user_id}'
+
+
+def placement(user_id):
+    """``(alias, moving)`` for ``user_id`` from the directory, cached ``SHARD_DIRECTORY_CACHE_SECONDS``."""
+    if not user_id or not shard_aliases():
+        return PRIMARY_DB, False
+    key = _placement_key(user_id)
+    found = cache.get(key)
+    if found is None:
+        from .models import UserShard
+        row = UserShard.objects.using(PRIMARY_DB).filter(user_id=user_id).values_list('alias', 'moving').first()
+        found = tuple(row) if row else (PRIMARY_DB, False)
+        cache.set(key, found, timeout=getattr(settings, 'SHARD_DIRECTORY_CACHE_SECONDS', 5))
+    return found
+
+
+def db_for_user(user_id):
+    return placement(user_id)[0]
+
+
+def forget_placement(user_id):
+    cache.delete(_placement_key(user_id))
+
+
+@contextmanager
+def use_shard(alias):
+    """Route sharded-model queries without an instance to ``alias`` (per-shard maintenance jobs)."""
+    token = _bound_shard.set(alias)
+    try:
+        yield
+    finally:
+        _bound_shard.reset(token)
+
+
+def use_user_shard(user_id):
+    """Route sharded-model queries without an instance to ``user_id``'s shard."""
+    return use_shard(db_for_user(user_id))
+
+
+class ShardRouter:
+    """Send ``SHARDED_MODELS`` to their user's shard; defers to the next router for everything else."""
+
+    def _db(self, model, hints):
+        if model._meta.label not in SHARDED_MODELS + PER_DATABASE_MODELS or not shard_aliases():
+            return None
+        instance = hints.get('instance')
+        if instance is not None:
+            label = instance._meta.label
+            if label == settings.AUTH_USER_MODEL:  # user.accounts and friends
+                alias = db_for_user(instance.pk)
+            elif label in SHARDED_MODELS + PER_DATABASE_MODELS and instance._state.db:
+                alias = instance._state.db
+            elif getattr(instance, 'user_id', None):
+                alias = db_for_user(instance.user_id)
+            else:
+                alias = _bound_shard.get()
+        else:
+            alias = _bound_shard.get()
+        # Unmoved users (and unbound queries) stay on default, where the replica router applies.
+        return alias if alias and alias != PRIMARY_DB else None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows point at users (and merchants) on the directory; the FKs carry no constraint.
+        pool = {*data_aliases(), *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class UserMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved; try again shortly.'
+    default_code = 'user_moving'
+
+
+class UserShardMixin:
+    """Route this view's finance queries to the requesting user's shard.
+
+    Writes are refused with 503 while ``reshard_users`` is moving the user.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _bound_shard.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _bound_shard.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user_id = getattr(request.user, 'id', None)
+        if user_id and shard_aliases():
+            alias, moving = placement(user_id)
+            if moving and request.method not in SAFE_METHODS:
+                raise UserMoving()
+            _bound_shard.set(alias)
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if isinstance(exc, UserMoving):
+            response['Retry-After'] = str(getattr(settings, 'SHARD_DIRECTORY_CACHE_SECONDS', 5) or 1)
+        return response
+
+
+def pin_recent_writers(get_response):
+    """Middleware: after a successful unsafe request, pin the user to the primary."""
+    def middleware(request):
+        response = get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_aliases():
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                mark_recent_write(user.id)
+        return response
+    return middleware
@@ -1,7 +1,111 @@
-from rest_framework import serializers
+import decimal
+
+from rest_framework import fields as drf_fields, relations, serializers
+from rest_framework.settings import api_settings
 from .models import UserProfile, Account, Category, Transaction, Budget
 
 
+class SparseFieldsMixin:
+    """Accept ``fields=`` / ``exclude=`` kwargs and drop every other declared field."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        exclude = kwargs.pop('exclude', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or ():
+            self.fields.pop(name, None)
+
+
+class RowEncoder:
+    """Encode ``values_list()`` rows into the dicts ``serializer.data`` would produce for the instances.
+
+    One converter per field is compiled up front from the serializer's own field
+    settings: decimals are quantized and formatted, datetimes moved to the field's
+    timezone and ISO-formatted, related keys read from their ``<name>_id`` column,
+    and plain values pass through. ``for_serializer`` returns ``None`` when any
+    readable field is not one of those exact types, so callers fall back to the
+    serializer and the output never differs.
+    """
+    _passthrough = (
+        drf_fields.IntegerField, drf_fields.CharField, drf_fields.ChoiceField, drf_fields.BooleanField,
+    )
+
+    def __init__(self, names, columns, converters):
+        self.names = names
+        self.columns = columns
+        self._fields = list(zip(names, converters))
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        model = serializer.Meta.model
+        concrete = {f.name: f for f in model._meta.concrete_fields}
+        names, columns, converters = [], [], []
+        for field in serializer._readable_fields:
+            model_field = concrete.get(field.source)
+            if model_field is None:
+                return None
+            if type(field) is relations.PrimaryKeyRelatedField and field.pk_field is None:
+                converter = None
+            elif type(field) in cls._passthrough and not model_field.is_relation:
+                converter = None
+            elif type(field) is drf_fields.BigIntegerField:
+                converter = str if getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING) else None
+            elif type(field) is drf_fields.DecimalField:
+                converter = cls._decimal(field)
+            elif type(field) is drf_fields.DateTimeField:
+                converter = cls._datetime(field)
+            else:
+                return None
+            if converter is False:
+                return None
+            names.append(field.field_name)
+            columns.append(model_field.attname)
+            converters.append(converter)
+        return cls(names, columns, converters)
+
+    @staticmethod
+    def _decimal(field):
+        if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            return False
+        if field.localize or field.normalize_output:
+            return False
+        if field.decimal_places is None:
+            return lambda value: f'{value:f}'
+        exp = decimal.Decimal('.1') ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        rounding = field.rounding
+        return lambda value: f'{value.quantize(exp, rounding=rounding, context=context):f}'
+
+    @staticmethod
+    def _datetime(field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if output_format is None:
+            return None
+        tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if tz is None:
+            return False
+        if output_format.lower() != drf_fields.ISO_8601:
+            return lambda value: value.astimezone(tz).strftime(output_format)
+
+        def iso(value):
+            text = value.astimezone(tz).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return iso
+
+    def encode(self, rows):
+        fields = self._fields
+        return [
+            {name: value if convert is None or value is None else convert(value)
+             for (name, convert), value in zip(fields, row)}
+            for row in rows
+        ]
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
@@ -14,41 +118,120 @@ class PreferencesSerializer(serializers.Serializer):
     preferences = serializers.JSONField()
 
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Account
         fields = ['id', 'name', 'type', 'institution', 'balance', 'currency', 'is_active', 'created_at', 'updated_at']
         read_only_fields = ['balance', 'created_at', 'updated_at']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'type', 'icon', 'color', 'default_budget_limit', 'is_custom', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Allow omitting account; backend will assign a default if available
     account = serializers.PrimaryKeyRelatedField(queryset=Account.objects.all(), required=False, allow_null=True)
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
+    # Destination account; only for direction='transfer', which creates both legs.
+    to_account = serializers.PrimaryKeyRelatedField(queryset=Account.objects.all(), required=False, write_only=True)
     class Meta:
         model = Transaction
         fields = [
-            'id','direction','amount','currency','description','txn_time','merchant','is_pending','external_id','account','category','created_at','updated_at'
+            'id','direction','amount','currency','description','txn_time','merchant','is_pending','external_id','account','category',
+            'to_account','transfer_side','transfer_peer','running_balance','auto_categorized','created_at','updated_at'
         ]
-        read_only_fields = ['created_at','updated_at']
+        read_only_fields = ['transfer_side','transfer_peer','running_balance','auto_categorized','created_at','updated_at']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         request = self.context.get('request') if hasattr(self, 'context') else None
         user = getattr(request, 'user', None)
+        if user and getattr(user, 'is_authenticated', False):
+            if 'account' in self.fields:
+                self.fields['account'].queryset = Account.objects.filter(user=user)
+            if 'category' in self.fields:
+                self.fields['category'].queryset = Category.objects.filter(user=user)
+            if 'to_account' in self.fields:
+                self.fields['to_account'].queryset = Account.objects.filter(user=user)
+
+    def validate(self, attrs):
+        direction = attrs.get('direction', getattr(self.instance, 'direction', None))
+        if self.instance is None:
+            if direction == 'transfer' and not attrs.get('to_account'):
+                raise serializers.ValidationError({'to_account': 'Transfers require a destination account.'})
+            if direction != 'transfer' and attrs.get('to_account'):
+                raise serializers.ValidationError({'to_account': 'Only transfers take a destination account.'})
+            if direction == 'transfer':
+                self._reject_transfer_fields(attrs, ('category', 'merchant', 'external_id'))
+            return attrs
+        if 'to_account' in attrs:
+            raise serializers.ValidationError({'to_account': 'The destination of an existing transfer cannot be changed.'})
+        # Transfer legs move money between two accounts; re-shaping one leg would unbalance the pair.
+        was_transfer = self.instance.direction == 'transfer'
+        if was_transfer != (direction == 'transfer'):
+            raise serializers.ValidationError({'direction': 'Cannot convert between transfers and income/expense.'})
+        if was_transfer:
+            for name in ('amount', 'account', 'txn_time', 'currency'):
+                if name in attrs and attrs[name] != getattr(self.instance, name):
+                    raise serializers.ValidationError({name: 'Delete and recreate the transfer to change this.'})
+            self._reject_transfer_fields(attrs, ('category',))
+        return attrs
+
+    @staticmethod
+    def _reject_transfer_fields(attrs, names):
+        # Transfers move money between the user's own accounts: no category, merchant or bank id.
+        for name in names:
+            if attrs.get(name):
+                raise serializers.ValidationError({name: 'Transfers do not take this field.'})
+
+
+class TransactionImportRowSerializer(serializers.ModelSerializer):
+    category = serializers.IntegerField(required=False, allow_null=True)
+    direction = serializers.ChoiceField(choices=[('in', 'Incoming'), ('out', 'Outgoing')], default='out')
+
+    class Meta:
+        model = Transaction
+        fields = ['direction', 'amount', 'txn_time', 'description', 'merchant', 'is_pending', 'external_id', 'category']
+
+
+class TransactionImportSerializer(serializers.Serializer):
+    """A statement's rows for one account; categories are checked in one query for the whole batch."""
+    account = serializers.PrimaryKeyRelatedField(queryset=Account.objects.all())
+    transactions = TransactionImportRowSerializer(many=True, allow_empty=False, max_length=500)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        user = getattr(self.context.get('request'), 'user', None)
         if user and getattr(user, 'is_authenticated', False):
             self.fields['account'].queryset = Account.objects.filter(user=user)
-            self.fields['category'].queryset = Category.objects.filter(user=user)
+
+    def validate(self, attrs):
+        rows = attrs['transactions']
+        wanted = {row['category'] for row in rows if row.get('category') is not None}
+        types = dict(
+            Category.objects.filter(user=self.context['request'].user, pk__in=wanted).values_list('pk', 'type')
+        ) if wanted else {}
+        errors = {}
+        for i, row in enumerate(rows):
+            category = row.get('category')
+            if category is None:
+                continue
+            expected = 'income' if row['direction'] == 'in' else 'expense'
+            if category not in types:
+                errors[i] = {'category': f'Invalid pk "{category}" - object does not exist.'}
+            elif types[category] != expected:
+                errors[i] = {'category': f'{"Income" if expected == "income" else "Expense"} transactions require '
+                                         f'an {expected} category.'}
+        if errors:
+            raise serializers.ValidationError({'transactions': errors})
+        return attrs
 
 
-class BudgetSerializer(serializers.ModelSerializer):
+class BudgetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Budget
         fields = ['id','category','period','start_date','end_date','limit_amount','created_at','updated_at']
@@ -0,0 +1,200 @@
+"""Placing users on shards and moving them between shards (see ``finance.routers.ShardRouter``).
+
+* New users get a ``UserShard`` entry for their hash shard (``home_shard``) on signup.
+* Each shard allocates ids for sharded tables from its own range
+  (``SHARD_ID_SPAN`` per position in ``DATABASE_SHARDS``, reserved after
+  ``migrate --database``). A moved row keeps its id, so it never collides with
+  rows the target created itself.
+* ``move_users`` streams a group of users' rows to their target shard in batches:
+  mark them moving (writes get 503), wait for cached placements to expire, copy
+  each user in one transaction on the target (snapshotting the days the target's
+  snapshot job has passed but the source's had not), point the directory at the
+  target, wait again for readers to follow, then delete the source rows.
+* ``manage.py reshard_users`` moves every user whose entry differs from their
+  hash shard: users from before sharding (on ``default``) and users left behind
+  when shards are added.
+"""
+import time
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models.signals import post_migrate, post_save
+from django.dispatch import receiver
+
+from . import snapshots
+from .models import GoalContribution, UserShard
+from .routers import PRIMARY_DB, SHARDED_MODELS, forget_placement, home_shard, shard_aliases
+
+User = get_user_model()
+
+SHARD_ID_SPAN = 10 ** 12
+
+
+def id_floor(alias):
+    return (shard_aliases().index(alias) + 1) * SHARD_ID_SPAN
+
+
+def reserve_id_range(alias):
+    """Make ``alias`` allocate sharded-table ids from its range (no-op once it has)."""
+    floor = id_floor(alias)
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for label in SHARDED_MODELS:
+            table = apps.get_model(label)._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s',
+                               [floor, table, floor])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)', [table, floor, table],
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                    [table, floor],
+                )
+            else:
+                raise NotImplementedError(f'Id ranges are not implemented for {connection.vendor}')
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using=PRIMARY_DB, **kwargs):
+    if sender.label == 'finance' and using in shard_aliases():
+        reserve_id_range(using)
+
+
+def assign_shards(users):
+    """Directory entries on their hash shard for freshly created ``users``; returns ``{user_id: alias}``."""
+    shards = shard_aliases()
+    if not shards:
+        return {}
+    placed = {u.pk: home_shard(u.pk, shards) for u in users}
+    UserShard.objects.using(PRIMARY_DB).bulk_create(
+        [UserShard(user_id=user_id, alias=alias) for user_id, alias in placed.items()], ignore_conflicts=True,
+    )
+    for user_id in placed:
+        forget_placement(user_id)
+    return placed
+
+
+@receiver(post_save, sender=User)
+def place_new_user(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        assign_shards([instance])
+
+
+def group_by_shard(users):
+    """``{alias: [user, ...]}`` for freshly created ``users`` (their hash shard, or default unsharded)."""
+    shards = shard_aliases()
+    groups = {}
+    for user in users:
+        groups.setdefault(home_shard(user.pk, shards) if shards else PRIMARY_DB, []).append(user)
+    return groups
+
+
+@dataclass
+class MoveResult:
+    user_id: int
+    source: str
+    target: str
+    rows: dict = field(default_factory=dict)  # model label -> rows copied
+
+    @property
+    def total(self):
+        return sum(self.rows.values())
+
+
+def pending_moves(user_ids=None, batch_size=1000):
+    """Yield ``(user_id, source, target)`` for users not on their hash shard, streaming the directory."""
+    shards = shard_aliases()
+    users = User.objects.using(PRIMARY_DB).order_by('pk')
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    last = 0
+    while True:
+        page = list(users.filter(pk__gt=last).values_list('pk', flat=True)[:batch_size])
+        if not page:
+            return
+        placed = dict(UserShard.objects.using(PRIMARY_DB).filter(user_id__in=page).values_list('user_id', 'alias'))
+        for user_id in page:
+            source, target = placed.get(user_id, PRIMARY_DB), home_shard(user_id, shards)
+            if source != target:
+                yield user_id, source, target
+        last = page[-1]
+
+
+def _user_rows(model, alias, user_id):
+    rows = model._base_manager.using(alias)
+    if model is GoalContribution:
+        return rows.filter(goal__user_id=user_id)
+    return rows.filter(user_id=user_id)
+
+
+def _set_entries(moves, moving, to_target):
+    for user_id, source, target in moves:
+        UserShard.objects.using(PRIMARY_DB).update_or_create(
+            user_id=user_id, defaults={'alias': target if to_target else source, 'moving': moving},
+        )
+        forget_placement(user_id)
+
+
+def copy_user(user_id, source, target, batch_size=1000):
+    """Copy ``user_id``'s sharded rows from ``source`` to ``target`` in one transaction on the target."""
+    result = MoveResult(user_id, source, target)
+    ops = connections[target].ops
+    with transaction.atomic(using=target):
+        for label in SHARDED_MODELS:
+            model = apps.get_model(label)
+            fields = model._meta.concrete_fields
+            size = max(1, min(batch_size, ops.bulk_batch_size(fields, [None] * batch_size)))
+            copied, batch = 0, []
+            for obj in _user_rows(model, source, user_id).order_by('pk').iterator(chunk_size=size):
+                batch.append(obj)
+                if len(batch) == size:
+                    # raw=True inserts stored values as-is: ids and auto_now timestamps survive, no signals run.
+                    model._base_manager._insert(batch, fields=fields, using=target, raw=True)
+                    copied, batch = copied + len(batch), []
+            if batch:
+                model._base_manager._insert(batch, fields=fields, using=target, raw=True)
+                copied += len(batch)
+            result.rows[label] = copied
+        snapshots.catch_up_moved_user(user_id, source, target)
+    return result
+
+
+def delete_user_rows(user_id, alias):
+    """Delete ``user_id``'s sharded rows from ``alias`` without signals (the rows live on elsewhere)."""
+    with transaction.atomic(using=alias):
+        for label in reversed(SHARDED_MODELS):
+            rows = _user_rows(apps.get_model(label), alias, user_id)
+            rows._raw_delete(alias)
+
+
+def move_users(moves, *, batch_size=1000, settle=None):
+    """Move each ``(user_id, source, target)``; returns a ``MoveResult`` per user.
+
+    ``settle`` (default ``SHARD_DIRECTORY_CACHE_SECONDS``) is how long other
+    processes may keep serving a cached placement.
+    """
+    moves = list(moves)
+    if not moves:
+        return []
+    settle = settings.SHARD_DIRECTORY_CACHE_SECONDS if settle is None else settle
+    _set_entries(moves, moving=True, to_target=False)
+    time.sleep(settle)  # writers have seen the flag
+    results = []
+    try:
+        for user_id, source, target in moves:
+            results.append(copy_user(user_id, source, target, batch_size))
+            _set_entries([(user_id, source, target)], moving=False, to_target=True)
+    finally:
+        copied = {r.user_id for r in results}
+        _set_entries([m for m in moves if m[0] not in copied], moving=False, to_target=False)
+        time.sleep(settle)  # readers have left the source
+        for result in results:
+            delete_user_rows(result.user_id, result.source)
+    return results
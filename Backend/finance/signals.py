@@ -1,44 +1,72 @@
 from decimal import Decimal
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.forms import model_to_dict
+from django.utils import timezone
 from .models import Transaction, Account, AuditLog
+from .routers import use_shard
+from . import duplicates, events, ledger, merchants
 
 
 def _apply_transaction_to_account(account: Account, txn: Transaction, sign: int):
-    if txn.direction == "in":
-        delta = Decimal(sign) * txn.amount
-    elif txn.direction == "out":
-        delta = Decimal(-sign) * txn.amount
-    else:  # transfer: don't adjust here (could be modeled as two txns)
-        delta = Decimal(0)
+    delta = Decimal(sign) * ledger.signed_amount(txn)
     account.balance = (account.balance or Decimal(0)) + delta
-    # Skip full_clean to allow negative balances; rely on explicit validation elsewhere.
-    account.save(update_fields=["balance", "updated_at"])
+    # Relative UPDATE so concurrent writers to the same account don't lose each other's deltas;
+    # skips full_clean to allow negative balances.
+    Account.objects.filter(pk=account.pk).update(
+        balance=Coalesce(F("balance"), Decimal(0)) + delta, updated_at=timezone.now()
+    )
+    events.balance_changed(account, delta)
+
+
+@receiver(pre_save, sender=Transaction)
+def on_transaction_saving(sender, instance: Transaction, raw=False, **kwargs):
+    if not raw and instance.direction != "transfer" and merchants.needs_merchant(instance):
+        merchants.assign_merchant(instance)
+    if not raw:
+        instance.fingerprint = duplicates.fingerprint(instance)
 
 
 @receiver(post_save, sender=Transaction)
 def on_transaction_saved(sender, instance: Transaction, created, **kwargs):
-    # adjust account balance for create only; updates are complex, recommend immutable amount/direction or custom logic
-    if created and instance.account:
-        _apply_transaction_to_account(instance.account, instance, sign=1)
-    AuditLog.objects.create(
-        user=instance.user,
-        action="create" if created else "update",
-        model_name="Transaction",
-        object_id=str(instance.pk),
-        changes={k: v for k, v in model_to_dict(instance).items() if k not in {"id"}},
-    )
+    # adjust account balance for create only; TransactionViewSet.perform_update reconciles edits
+    with use_shard(instance._state.db), transaction.atomic(using=instance._state.db):
+        if created and instance.account:
+            _apply_transaction_to_account(instance.account, instance, sign=1)
+            ledger.record_insert(instance)
+            merchants.record_spend(instance, sign=1)
+            events.transaction_changed(instance, "created")
+            events.budget_spent_changed(instance, sign=1)
+        AuditLog.objects.create(
+            user=instance.user,
+            action="create" if created else "update",
+            model_name="Transaction",
+            object_id=str(instance.pk),
+            changes={k: v for k, v in model_to_dict(instance).items() if k not in {"id"}},
+        )
 
 
 @receiver(post_delete, sender=Transaction)
 def on_transaction_deleted(sender, instance: Transaction, **kwargs):
-    if instance.account:
-        _apply_transaction_to_account(instance.account, instance, sign=-1)
-    AuditLog.objects.create(
-        user=instance.user,
-        action="delete",
-        model_name="Transaction",
-        object_id=str(instance.pk),
-        changes={},
-    )
+    with use_shard(instance._state.db), transaction.atomic(using=instance._state.db):
+        if instance.account:
+            _apply_transaction_to_account(instance.account, instance, sign=-1)
+            ledger.record_delete(instance)
+            merchants.record_spend(instance, sign=-1)
+            events.transaction_changed(instance, "deleted")
+            events.budget_spent_changed(instance, sign=-1)
+        AuditLog.objects.create(
+            user=instance.user,
+            action="delete",
+            model_name="Transaction",
+            object_id=str(instance.pk),
+            changes={},
+        )
+        # A transfer leg never outlives its peer (the FK to this row was already nulled).
+        if instance.transfer_peer_id:
+            peer = Transaction.objects.filter(pk=instance.transfer_peer_id).first()
+            if peer is not None:
+                peer.delete()
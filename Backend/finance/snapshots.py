@@ -0,0 +1,215 @@
+"""Daily per-account balance snapshots backing the net-worth history.
+
+``BalanceSnapshot`` holds an account's closing balance for each (local) day on
+which it had activity. Quiet days carry the previous value, so the table stays
+compact and readers forward-fill. Closing balances are read straight off
+``Transaction.running_balance`` (see ``finance.ledger``), never re-summed.
+
+* ``append_snapshots`` - the scheduled job (``snapshot_balances`` command). It
+  keeps a job-level watermark (``JobWatermark``, the last day snapshotted) and
+  each run scans only the transactions dated after it, up to ``until``. Quiet
+  accounts get no rows and never hold the watermark back.
+* ``patch_for_change`` - called by the ledger for a transaction dated on or
+  before the watermark (backdated insert, edit or delete). It rewrites that
+  day's row and shifts the account's later rows with one relative ``UPDATE``.
+* ``net_worth_series`` - per-account and per-currency total daily series for a
+  range. It reads snapshots plus the not-yet-snapshotted tail, then forward-fills.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Account, BalanceSnapshot, JobWatermark, Transaction
+
+ZERO = Decimal('0.00')
+WATERMARK = 'finance.snapshot_balances'
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _closing_balance(account_id, day):
+    value = (
+        Transaction.objects.filter(account_id=account_id, txn_time__lt=day_start(day + timedelta(days=1)))
+        .order_by('-txn_time', '-pk')
+        .values_list('running_balance', flat=True)
+        .first()
+    )
+    return value if value is not None else ZERO
+
+
+def daily_closings(queryset):
+    """Yield ``(account_id, user_id, day, balance)`` for the last transaction of each account-day."""
+    rows = queryset.order_by('account_id', 'txn_time', 'pk').values_list(
+        'account_id', 'user_id', 'txn_time', 'running_balance'
+    )
+    current = None
+    for account_id, user_id, txn_time, balance in rows.iterator(chunk_size=5000):
+        key = (account_id, timezone.localdate(txn_time))
+        if current is not None and current[0] != key:
+            yield current[1]
+        current = (key, (account_id, user_id, key[1], balance if balance is not None else ZERO))
+    if current is not None:
+        yield current[1]
+
+
+def _latest_snapshot_dates(account_ids=None):
+    qs = BalanceSnapshot.objects.all()
+    if account_ids is not None:
+        qs = qs.filter(account_id__in=account_ids)
+    return dict(qs.values('account_id').annotate(last=Max('date')).values_list('account_id', 'last').order_by())
+
+
+def snapshotted_through():
+    """Last day ``append_snapshots`` has covered in this database, or ``None`` before its first run."""
+    return JobWatermark.objects.filter(name=WATERMARK).values_list('through', flat=True).first()
+
+
+def append_snapshots(until=None, batch_size=2000):
+    """Snapshot the account-days after the watermark, through ``until`` (default yesterday).
+
+    The first run has no watermark and scans the whole history once.
+    """
+    until = until or timezone.localdate() - timedelta(days=1)
+    through = snapshotted_through()
+    if through is not None and through >= until:
+        return 0
+    qs = Transaction.objects.filter(txn_time__lt=day_start(until + timedelta(days=1)))
+    if through is not None:
+        qs = qs.filter(txn_time__gte=day_start(through + timedelta(days=1)))
+
+    written = 0
+    batch = []
+    for account_id, user_id, day, balance in daily_closings(qs):
+        batch.append(BalanceSnapshot(user_id=user_id, account_id=account_id, date=day, balance=balance))
+        if len(batch) >= batch_size:
+            written += _upsert(batch)
+            batch = []
+    if batch:
+        written += _upsert(batch)
+    JobWatermark.objects.update_or_create(name=WATERMARK, defaults={'through': until})
+    return written
+
+
+def _upsert(rows, using=None):
+    BalanceSnapshot.objects.db_manager(using).bulk_create(
+        rows, update_conflicts=True, unique_fields=['account', 'date'], update_fields=['balance']
+    )
+    return len(rows)
+
+
+def catch_up_moved_user(user_id, source, target):
+    """Snapshot a user just copied to ``target`` up to its watermark, when ``source``'s lags behind.
+
+    Days the source job had not reached yet would otherwise fall behind ``target``'s
+    watermark without ever being scanned.
+    """
+    until = JobWatermark.objects.using(target).filter(name=WATERMARK).values_list('through', flat=True).first()
+    after = JobWatermark.objects.using(source).filter(name=WATERMARK).values_list('through', flat=True).first()
+    if until is None or (after is not None and after >= until):
+        return 0
+    qs = Transaction.objects.using(target).filter(user_id=user_id, txn_time__lt=day_start(until + timedelta(days=1)))
+    if after is not None:
+        qs = qs.filter(txn_time__gte=day_start(after + timedelta(days=1)))
+    rows = [BalanceSnapshot(user_id=user_id, account_id=account_id, date=day, balance=balance)
+            for account_id, _, day, balance in daily_closings(qs)]
+    return _upsert(rows, using=target) if rows else 0
+
+
+def patch_for_change(txn, delta):
+    """Fold a ``delta`` applied at ``txn.txn_time`` into already-written snapshots."""
+    if not delta:
+        return
+    through = snapshotted_through()
+    day = timezone.localdate(txn.txn_time)
+    if through is None or day > through:
+        return  # not snapshotted yet; the next append picks it up
+    BalanceSnapshot.objects.filter(account_id=txn.account_id, date__gt=day).update(balance=F('balance') + delta)
+    _upsert([BalanceSnapshot(
+        user_id=txn.user_id, account_id=txn.account_id, date=day, balance=_closing_balance(txn.account_id, day),
+    )])
+
+
+def forward_fill(values, seed):
+    """Replace each ``None`` with the last known value (``seed`` before the first one), in one pass."""
+    return list(accumulate(values, lambda prev, cur: prev if cur is None else cur, initial=seed))[1:]
+
+
+def net_worth_series(user, start, end, account_ids=None):
+    accounts = Account.objects.filter(user=user).order_by('id')
+    if account_ids is not None:
+        accounts = accounts.filter(id__in=account_ids)
+    accounts = list(accounts.values('id', 'name', 'currency'))
+    ids = [a['id'] for a in accounts]
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    position = {day: i for i, day in enumerate(days)}
+    opening = {account_id: ZERO for account_id in ids}
+    points = {account_id: [None] * len(days) for account_id in ids}
+
+    # Opening value: each account's last snapshot before the range (one indexed probe per account).
+    before = BalanceSnapshot.objects.filter(account_id=OuterRef('account_id'), date__lt=start).order_by('-date')
+    for account_id, balance in BalanceSnapshot.objects.filter(
+        account_id__in=ids, date=Subquery(before.values('date')[:1])
+    ).values_list('account_id', 'balance'):
+        opening[account_id] = balance
+    for account_id, day, balance in BalanceSnapshot.objects.filter(
+        account_id__in=ids, date__gte=start, date__lte=end
+    ).values_list('account_id', 'date', 'balance'):
+        points[account_id][position[day]] = balance
+
+    # Days after an account's latest snapshot are read from the running balances directly,
+    # each account from its own floor: the day after its latest snapshot, or the range start.
+    latest = _latest_snapshot_dates(ids)
+    stale = [i for i in ids if latest.get(i) is None or latest[i] < end]
+    if stale:
+        never = [i for i in stale if latest.get(i) is None]
+        if never:
+            # No snapshot to open from: the last running balance before the range (one indexed probe each).
+            last = (
+                Transaction.objects.filter(account_id=OuterRef('pk'), txn_time__lt=day_start(start))
+                .order_by('-txn_time', '-pk').values('running_balance')[:1]
+            )
+            for account_id, balance in Account.objects.filter(id__in=never).annotate(
+                last=Subquery(last)
+            ).values_list('id', 'last'):
+                if balance is not None:
+                    opening[account_id] = Decimal(balance).quantize(ZERO)  # SQLite returns subquery decimals unscaled
+        floors = {}
+        for i in stale:
+            floors.setdefault(latest[i] + timedelta(days=1) if latest.get(i) else start, []).append(i)
+        bounded = Q()
+        for floor, group in floors.items():
+            bounded |= Q(account_id__in=group, txn_time__gte=day_start(floor))
+        qs = Transaction.objects.filter(bounded, txn_time__lt=day_start(end + timedelta(days=1)))
+        for account_id, _, day, balance in daily_closings(qs):
+            last = latest.get(account_id)
+            if last is not None and day <= last:
+                continue
+            if day < start:
+                opening[account_id] = balance
+            else:
+                points[account_id][position[day]] = balance
+
+    series = [forward_fill(points[a['id']], opening[a['id']]) for a in accounts]
+    by_currency = {}
+    for a, balances in zip(accounts, series):
+        by_currency.setdefault(a['currency'], []).append(balances)
+    totals = {currency: [sum(column, ZERO) for column in zip(*rows)] for currency, rows in by_currency.items()}
+    if not totals:
+        total = [ZERO] * len(days)
+    elif len(totals) == 1:
+        total, = totals.values()
+    else:
+        total = None  # balances in different currencies do not add up; see ``totals``
+    return {
+        'start': start,
+        'end': end,
+        'dates': days,
+        'total': total,
+        'totals': totals,
+        'accounts': [{**a, 'balances': balances} for a, balances in zip(accounts, series)],
+    }
@@ -0,0 +1,248 @@
+"""Monthly statements, built in bulk and stored (``MonthlyStatement``).
+
+A statement holds, for one user and month: each account's opening and closing
+balance (ledger running balances, as ``/accounts/<id>/statement/``), inflow,
+outflow and count; income and expense per category; the budgets overlapping the
+month with what was spent inside both the budget period and the month; goal
+contributions; and totals.
+
+Users are split into contiguous id ranges on each database that holds finance
+rows (default and every shard). A range costs a fixed handful of queries,
+whatever its size:
+
+* accounts, with their opening balance from one indexed subquery each;
+* statements already stored (those users are skipped, so a rerun resumes);
+* the month's transactions, streamed in chunks in one ordered pass;
+* categories, budgets and grouped goal contributions;
+* one bulk insert, committed per range.
+
+Ranges run in a process pool and are independent (``workers=0`` runs inline).
+The ``finance.monthly_statements`` task builds last month's statements nightly.
+"""
+import os
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .ledger import ZERO, signed_amount
+from .models import Account, Budget, Category, GoalContribution, MonthlyStatement, Transaction
+from .routers import data_aliases, use_shard
+from .snapshots import day_start
+
+
+@dataclass
+class RangeResult:
+    alias: str
+    lo: int
+    hi: int
+    built: int = 0
+    skipped: int = 0
+    transactions: int = 0
+    elapsed: float = 0.0
+
+
+def parse_month(value):
+    """``date`` for the first day of a ``YYYY-MM`` string; raises ``ValueError``."""
+    year, _, month = value.partition('-')
+    if len(year) != 4 or len(month) != 2:
+        raise ValueError(f'Invalid month: {value!r}')
+    return date(int(year), int(month), 1)
+
+
+def month_bounds(first):
+    """``(first day, last day)`` of the month starting ``first``."""
+    return first, (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def previous_month(today=None):
+    return ((today or timezone.localdate()).replace(day=1) - timedelta(days=1)).replace(day=1)
+
+
+def user_ranges(range_size):
+    bounds = Account.objects.aggregate(lo=Min('user_id'), hi=Max('user_id'))
+    if bounds['lo'] is None:
+        return []
+    return [(lo, lo + range_size) for lo in range(bounds['lo'], bounds['hi'] + 1, range_size)]
+
+
+class _Builder:
+    """Accumulates one user's statement from the streamed transactions."""
+
+    def __init__(self, accounts, categories):
+        self.accounts = {}
+        for a in accounts:
+            opening = Decimal(a['opening'] or ZERO).quantize(ZERO)  # SQLite returns subquery/aggregate decimals unscaled
+            self.accounts[a['id']] = {
+                'id': a['id'], 'name': a['name'], 'currency': a['currency'],
+                'opening_balance': opening, 'closing_balance': opening,
+                'inflow': ZERO, 'outflow': ZERO, 'transactions': 0,
+            }
+        self.categories = categories
+        self.by_category = {}
+        self.spent_by_category = {}  # category id -> [(local date, amount)] for budget checks
+        self.income = self.expense = ZERO
+        self.count = 0
+
+    def add(self, txn):
+        account = self.accounts.get(txn.account_id)
+        if account is None:
+            return
+        delta = signed_amount(txn)
+        if delta > 0:
+            account['inflow'] += delta
+        else:
+            account['outflow'] -= delta
+        account['closing_balance'] = txn.running_balance
+        account['transactions'] += 1
+        self.count += 1
+        if txn.direction not in ('in', 'out'):
+            return
+        row = self.by_category.setdefault(txn.category_id, {'income': ZERO, 'expense': ZERO})
+        if txn.direction == 'in':
+            row['income'] += txn.amount
+            self.income += txn.amount
+        else:
+            row['expense'] += txn.amount
+            self.expense += txn.amount
+            if txn.category_id:
+                self.spent_by_category.setdefault(txn.category_id, []).append(
+                    (timezone.localdate(txn.txn_time), txn.amount)
+                )
+
+    def budget_rows(self, budgets, first, last):
+        rows = []
+        for b in budgets:
+            start, end = max(b['start_date'], first), min(b['end_date'], last)
+            spent = sum((amount for day, amount in self.spent_by_category.get(b['category_id'], ())
+                         if start <= day <= end), ZERO)
+            rows.append({
+                'budget_id': b['id'], 'category_id': b['category_id'],
+                'category': self.categories.get(b['category_id'], {}).get('name'), 'period': b['period'],
+                'start_date': b['start_date'], 'end_date': b['end_date'],
+                'limit_amount': b['limit_amount'], 'spent': spent, 'remaining': b['limit_amount'] - spent,
+            })
+        return rows
+
+    def data(self, budgets, goals, first, last):
+        categories = [
+            {'category_id': cid, 'category': self.categories.get(cid, {}).get('name'), **totals}
+            for cid, totals in self.by_category.items()
+        ]
+        categories.sort(key=lambda r: (-r['expense'], -r['income'], r['category_id'] or 0))
+        return {
+            'accounts': sorted(self.accounts.values(), key=lambda a: a['id']),
+            'categories': categories,
+            'budgets': self.budget_rows(budgets, first, last),
+            'goals': goals,
+            'totals': {'income': self.income, 'expense': self.expense, 'net': self.income - self.expense},
+        }
+
+
+def build_range(alias, lo, hi, first, rebuild=False, chunk_size=2000):
+    """Build ``first``'s statements for users with ``lo <= id < hi`` on ``alias``; returns a ``RangeResult``."""
+    with use_shard(alias):
+        return _build_range(alias, lo, hi, first, rebuild, chunk_size)
+
+
+def _build_range(alias, lo, hi, first, rebuild, chunk_size):
+    t0 = time.perf_counter()
+    first, last = month_bounds(first)
+    start, end = day_start(first), day_start(last + timedelta(days=1))
+    result = RangeResult(alias, lo, hi)
+    in_range = {'user_id__gte': lo, 'user_id__lt': hi}
+
+    opening = (
+        Transaction.objects.filter(account_id=OuterRef('pk'), txn_time__lt=start)
+        .order_by('-txn_time', '-pk').values('running_balance')[:1]
+    )
+    accounts = {}
+    for row in (Account.objects.filter(**in_range).annotate(opening=Subquery(opening))
+                .values('id', 'user_id', 'name', 'currency', 'opening').order_by('id')):
+        accounts.setdefault(row['user_id'], []).append(row)
+    done = set() if rebuild else set(
+        MonthlyStatement.objects.filter(month=first, **in_range).values_list('user_id', flat=True)
+    )
+    users = [u for u in accounts if u not in done]
+    result.skipped = len(accounts) - len(users)
+    if not users:
+        result.elapsed = time.perf_counter() - t0
+        return result
+
+    categories = {}
+    for row in Category.objects.filter(**in_range).values('id', 'user_id', 'name'):
+        categories.setdefault(row['user_id'], {})[row['id']] = row
+    budgets = {}
+    for row in (Budget.objects.filter(start_date__lte=last, end_date__gte=first, **in_range)
+                .values('id', 'user_id', 'category_id', 'period', 'start_date', 'end_date', 'limit_amount')
+                .order_by('start_date', 'id')):
+        budgets.setdefault(row['user_id'], []).append(row)
+    goals = {}
+    for row in (GoalContribution.objects.filter(goal__user_id__gte=lo, goal__user_id__lt=hi,
+                                                contributed_at__gte=start, contributed_at__lt=end)
+                .values('goal_id', 'goal__user_id', 'goal__name')
+                .annotate(contributed=Sum('amount'), contributions=Count('id')).order_by('goal_id')):
+        goals.setdefault(row['goal__user_id'], []).append({
+            'goal_id': row['goal_id'], 'name': row['goal__name'],
+            'contributed': Decimal(row['contributed']).quantize(ZERO), 'contributions': row['contributions'],
+        })
+
+    builders = {u: _Builder(accounts[u], categories.get(u, {})) for u in users}
+    rows = (
+        Transaction.objects.filter(txn_time__gte=start, txn_time__lt=end, **in_range)
+        .order_by('account_id', 'txn_time', 'pk')
+        .only('user_id', 'account_id', 'category_id', 'direction', 'transfer_side', 'amount', 'txn_time',
+              'running_balance')
+    )
+    for txn in rows.iterator(chunk_size=chunk_size):
+        builder = builders.get(txn.user_id)
+        if builder is not None:
+            builder.add(txn)
+            result.transactions += 1
+
+    statements = [
+        MonthlyStatement(user_id=u, month=first, transaction_count=b.count,
+                         data=b.data(budgets.get(u, []), goals.get(u, []), first, last))
+        for u, b in builders.items()
+    ]
+    with transaction.atomic(using=router.db_for_write(MonthlyStatement)):
+        if rebuild:
+            MonthlyStatement.objects.filter(month=first, user_id__in=users).delete()
+        MonthlyStatement.objects.bulk_create(statements, batch_size=500)
+    result.built = len(statements)
+    result.elapsed = time.perf_counter() - t0
+    return result
+
+
+def _init_worker():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Budget.settings')
+    django.setup()
+
+
+def _run_range(args):
+    try:
+        return build_range(*args)
+    finally:
+        connections.close_all()
+
+
+def generate_statements(first, range_size=500, workers=None, rebuild=False):
+    """Yield a ``RangeResult`` per user range as they finish; ``workers=0`` runs inline."""
+    work = []
+    for alias in data_aliases():
+        with use_shard(alias):
+            work.extend((alias, lo, hi, first, rebuild) for lo, hi in user_ranges(range_size))
+    if workers == 0 or len(work) <= 1:
+        for args in work:
+            yield build_range(*args)
+        return
+    from concurrent.futures import ProcessPoolExecutor  # keeps multiprocessing out of web workers
+    # Children must open their own connections rather than share the parent's.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker) as pool:
+        yield from pool.map(_run_range, work)
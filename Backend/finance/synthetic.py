@@ -0,0 +1,144 @@
+"""Synthetic data for load tests and benchmarks.
+
+Everything is written with ``bulk_create`` so signals do not fire; account balances
+are accumulated while generating and written back once with ``bulk_update``.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Account, Budget, Category, Transaction, UserProfile
+from .ledger import rebuild_running_balances
+from .duplicates import fingerprint
+from .merchants import assign_merchants, rebuild_spend
+
+User = get_user_model()
+
+SYNTHETIC_PASSWORD = 'bench-password'
+
+MERCHANTS = [
+    'Amazon', 'Walmart', 'Target', 'Starbucks', 'Uber', 'Lyft', 'Shell', 'Costco',
+    'Netflix', 'Spotify', 'Whole Foods', 'Trader Joes', 'CVS', 'Apple', 'Airbnb', 'Chipotle',
+]
+EXPENSE_NAMES = ['Groceries', 'Transport', 'Dining', 'Rent', 'Utilities', 'Shopping', 'Health', 'Travel',
+                 'Entertainment', 'Subscriptions', 'Insurance', 'Education']
+INCOME_NAMES = ['Salary', 'Freelance', 'Interest', 'Dividends']
+
+
+@dataclass
+class SeededUser:
+    user_id: int
+    account_ids: list = field(default_factory=list)
+    expense_ids: list = field(default_factory=list)
+    income_ids: list = field(default_factory=list)
+
+
+def _category_names(count):
+    n_income = max(1, count // 5)
+    n_expense = max(1, count - n_income)
+    expense = [EXPENSE_NAMES[i] if i < len(EXPENSE_NAMES) else f'Expense {i}' for i in range(n_expense)]
+    income = [INCOME_NAMES[i] if i < len(INCOME_NAMES) else f'Income {i}' for i in range(n_income)]
+    return expense, income
+
+
+@transaction.atomic
+def seed_users(n_users, *, accounts=2, categories=8, budgets=6, prefix='bench', batch_size=2000):
+    """Create users with profiles, accounts, categories and monthly budgets.
+
+    Returns a list of ``SeededUser``. Every user gets ``SYNTHETIC_PASSWORD``; the hash is
+    computed once and shared so seeding is not dominated by PBKDF2.
+    """
+    password = make_password(SYNTHETIC_PASSWORD)
+    users = User.objects.bulk_create(
+        [User(username=f'{prefix}-{i}@example.com', email=f'{prefix}-{i}@example.com', password=password)
+         for i in range(n_users)],
+        batch_size=batch_size,
+    )
+    UserProfile.objects.bulk_create([UserProfile(user=u) for u in users], batch_size=batch_size)
+
+    account_types = [t for t, _ in Account.ACCOUNT_TYPES]
+    Account.objects.bulk_create(
+        [Account(user=u, name=f'Account {j}', type=account_types[j % len(account_types)])
+         for u in users for j in range(accounts)],
+        batch_size=batch_size,
+    )
+    expense_names, income_names = _category_names(categories)
+    Category.objects.bulk_create(
+        [Category(user=u, name=name, type='expense', is_custom=False) for u in users for name in expense_names]
+        + [Category(user=u, name=name, type='income', is_custom=False) for u in users for name in income_names],
+        batch_size=batch_size,
+    )
+
+    seeded = {u.id: SeededUser(u.id) for u in users}
+    for acc_id, user_id in Account.objects.filter(user__in=users).values_list('id', 'user_id'):
+        seeded[user_id].account_ids.append(acc_id)
+    for cat_id, user_id, ctype in Category.objects.filter(user__in=users).values_list('id', 'user_id', 'type'):
+        (seeded[user_id].expense_ids if ctype == 'expense' else seeded[user_id].income_ids).append(cat_id)
+
+    # Monthly budgets, newest month first, cycling through expense categories.
+    month = date.today().replace(day=1)
+    rows = []
+    for s in seeded.values():
+        for k in range(budgets):
+            start = month
+            for _ in range(k // len(s.expense_ids)):
+                start = (start - timedelta(days=1)).replace(day=1)
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            rows.append(Budget(user_id=s.user_id, category_id=s.expense_ids[k % len(s.expense_ids)],
+                               period='monthly', start_date=start, end_date=end,
+                               limit_amount=Decimal(200 + 50 * (k % 5))))
+    Budget.objects.bulk_create(rows, batch_size=batch_size)
+    return list(seeded.values())
+
+
+def seed_transactions(seeded_users, count, *, days=365, batch_size=5000, seed=0):
+    """Spread ``count`` transactions evenly over ``seeded_users`` and the last ``days`` days."""
+    if not seeded_users or count <= 0:
+        return 0
+    rng = random.Random(seed)
+    now = timezone.now()
+    span = days * 86400
+    deltas = {}
+    created = 0
+    batch = []
+    for i in range(count):
+        s = seeded_users[i % len(seeded_users)]
+        account_id = rng.choice(s.account_ids)
+        if rng.random() < 0.15:
+            direction, category_id = 'in', rng.choice(s.income_ids)
+            amount = Decimal(rng.randrange(50000, 500000)) / 100
+        else:
+            direction, category_id = 'out', rng.choice(s.expense_ids)
+            amount = Decimal(rng.randrange(100, 20000)) / 100
+        deltas[account_id] = deltas.get(account_id, Decimal(0)) + (amount if direction == 'in' else -amount)
+        merchant = rng.choice(MERCHANTS)
+        txn = Transaction(
+            user_id=s.user_id, account_id=account_id, category_id=category_id, direction=direction,
+            amount=amount, description=f'{merchant} purchase', merchant=merchant,
+            txn_time=now - timedelta(seconds=rng.randrange(span)),
+        )
+        txn.fingerprint = fingerprint(txn)
+        batch.append(txn)
+        if len(batch) >= batch_size:
+            Transaction.objects.bulk_create(assign_merchants(batch))
+            created += len(batch)
+            batch = []
+    if batch:
+        Transaction.objects.bulk_create(assign_merchants(batch))
+        created += len(batch)
+
+    accounts = list(Account.objects.filter(id__in=deltas))
+    for acc in accounts:
+        acc.balance = (acc.balance or Decimal(0)) + deltas[acc.id]
+    Account.objects.bulk_update(accounts, ['balance'], batch_size=batch_size)
+    # bulk_create skips the ledger signals; fill in running balances and merchant spend afterwards.
+    for account_id in deltas:
+        rebuild_running_balances(account_id)
+    rebuild_spend([s.user_id for s in seeded_users])
+    return created
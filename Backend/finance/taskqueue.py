@@ -0,0 +1,270 @@
+"""Database-backed background tasks.
+
+``enqueue`` inserts a ``Task`` row inside the caller's transaction, so work is
+only queued if the request commits. ``manage.py run_worker`` claims due rows,
+runs the registered function and records the outcome:
+
+* Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` where the backend has it.
+  Elsewhere (SQLite) it uses a conditional ``UPDATE ... WHERE status=<seen>``
+  per row; only one worker's update matches, so a row never runs twice at once.
+* A claim is a lease (``locked_until``). Rows whose worker died are reclaimed
+  once the lease expires.
+* Failures are retried with exponential backoff and jitter, up to
+  ``max_attempts``; the traceback is kept in ``last_error``.
+* ``periodic`` tasks are enqueued once per interval slot. The slot is
+  deduplicated through the unique ``dedupe_key``, so any number of workers can
+  run the scheduler.
+* Each run's duration is stored on the row and summed in-process. The
+  ``/api/metrics/`` view renders per-task counts and timings from the table,
+  which is kept small by the ``finance.prune_tasks`` schedule.
+"""
+import logging
+import random
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 6 * 3600  # seconds
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    name: str
+    func: object
+    max_attempts: int = 5
+    backoff: float = 30.0   # seconds before the first retry; doubles per attempt
+    lease: float = 300.0    # seconds a claim is held before other workers may reclaim it
+
+
+_registry = {}
+_schedules = {}  # name -> default interval in seconds
+
+
+def task(name=None, *, max_attempts=5, backoff=30.0, lease=300.0):
+    """Register ``func`` as a task; ``func.delay(**kwargs)`` enqueues it."""
+    def decorate(func):
+        spec = TaskSpec(name or f'{func.__module__}.{func.__name__}', func, max_attempts, backoff, lease)
+        _registry[spec.name] = spec
+        func.task_name = spec.name
+        func.delay = lambda **kwargs: enqueue(spec.name, **kwargs)
+        return func
+    return decorate
+
+
+def periodic(every, name=None, **options):
+    """Register a task that the worker enqueues every ``every`` seconds.
+
+    ``FINANCE_TASK_SCHEDULES`` may override the interval per task name, or disable
+    it with ``None``.
+    """
+    def decorate(func):
+        func = task(name, **options)(func)
+        _schedules[func.task_name] = every
+        return func
+    return decorate
+
+
+def get_spec(name):
+    return _registry.get(name)
+
+
+def schedules():
+    """``{name: seconds}`` of enabled periodic tasks, with settings overrides applied."""
+    overrides = getattr(settings, 'FINANCE_TASK_SCHEDULES', {})
+    merged = {**_schedules, **{k: v for k, v in overrides.items() if k in _registry}}
+    return {name: every for name, every in merged.items() if every}
+
+
+def enqueue(name, *, run_at=None, dedupe_key=None, **kwargs):
+    """Queue ``name(**kwargs)``; returns the ``Task`` (``None`` if ``dedupe_key`` already exists).
+
+    With ``FINANCE_TASKS_EAGER`` the task runs inline and the returned row holds its outcome.
+    """
+    spec = _registry.get(name)
+    if spec is None:
+        raise LookupError(f'Unknown task {name!r}')
+    now = timezone.now()
+    row = Task(name=name, kwargs=kwargs, run_at=run_at or now, max_attempts=spec.max_attempts, dedupe_key=dedupe_key)
+    try:
+        with transaction.atomic():
+            row.save()
+    except IntegrityError:  # dedupe_key already queued
+        return None
+    if getattr(settings, 'FINANCE_TASKS_EAGER', False):
+        Task.objects.filter(pk=row.pk).update(status='running', attempts=1, locked_by='eager', started_at=now)
+        row.refresh_from_db()
+        execute(row)
+        row.refresh_from_db()
+    return row
+
+
+def enqueue_due_schedules(now=None):
+    """Enqueue the current slot of every periodic task (one INSERT); returns rows created."""
+    now = now or timezone.now()
+    epoch = now.timestamp()
+    rows = []
+    for name, every in schedules().items():
+        slot = int(epoch // every)
+        rows.append(Task(
+            name=name, run_at=now, max_attempts=_registry[name].max_attempts, dedupe_key=f'{name}@{slot}',
+        ))
+    if not rows:
+        return 0
+    before = Task.objects.filter(dedupe_key__in=[r.dedupe_key for r in rows]).count()
+    Task.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows) - before
+
+
+def _due(now):
+    return Task.objects.filter(
+        Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lt=now)
+    ).order_by('run_at', 'id')
+
+
+def _lease_until(name, now):
+    spec = _registry.get(name)
+    return now + timedelta(seconds=spec.lease if spec else TaskSpec.lease)
+
+
+def claim(worker_id, limit=1, now=None):
+    """Lease up to ``limit`` due tasks to ``worker_id``; returns the claimed rows."""
+    now = now or timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            rows = list(_due(now).select_for_update(skip_locked=True)[:limit])
+            for row in rows:
+                row.status = 'running'
+                row.locked_by = worker_id
+                row.locked_until = _lease_until(row.name, now)
+                row.attempts += 1
+                row.started_at = now
+            Task.objects.bulk_update(rows, ['status', 'locked_by', 'locked_until', 'attempts', 'started_at'])
+        return rows
+    claimed = []
+    for pk, name, status, locked_until in _due(now).values_list('pk', 'name', 'status', 'locked_until')[:limit * 4]:
+        # Matches only if no other worker changed the row since we read it.
+        won = Task.objects.filter(pk=pk, status=status, locked_until=locked_until).update(
+            status='running', locked_by=worker_id, locked_until=_lease_until(name, now),
+            attempts=F('attempts') + 1, started_at=now,
+        )
+        if won:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_at', 'id'))
+
+
+def release(rows):
+    """Hand claimed-but-unstarted tasks back to the queue (worker shutdown)."""
+    for row in rows:
+        Task.objects.filter(pk=row.pk, locked_by=row.locked_by).update(
+            status='queued', locked_by='', locked_until=None, attempts=F('attempts') - 1,
+        )
+
+
+def backoff_delay(spec, attempts):
+    """Seconds before retry number ``attempts``: exponential with +/-20% jitter."""
+    base = spec.backoff if spec else TaskSpec.backoff
+    return min(base * 2 ** (attempts - 1), MAX_BACKOFF) * random.uniform(0.8, 1.2)
+
+
+class TaskStats:
+    """In-process per-task timings of the runs this worker executed."""
+
+    def __init__(self):
+        self.runs = {}  # name -> [ok, failed, seconds]
+
+    def observe(self, name, duration, ok):
+        stats = self.runs.setdefault(name, [0, 0, 0.0])
+        stats[0 if ok else 1] += 1
+        stats[2] += duration
+
+    def summary(self):
+        return {
+            name: {'ok': ok, 'failed': failed, 'seconds': round(seconds, 6)}
+            for name, (ok, failed, seconds) in sorted(self.runs.items())
+        }
+
+
+stats = TaskStats()
+
+
+def execute(row):
+    """Run one claimed task and record success, retry or failure; returns True on success."""
+    spec = _registry.get(row.name)
+    start = time.perf_counter()
+    try:
+        if spec is None:
+            raise LookupError(f'Unknown task {row.name!r}')
+        spec.func(**row.kwargs)
+    except Exception:
+        duration = time.perf_counter() - start
+        stats.observe(row.name, duration, ok=False)
+        now = timezone.now()
+        changes = dict(locked_by='', locked_until=None, last_error=traceback.format_exc()[-4000:], duration=duration)
+        if row.attempts >= row.max_attempts:
+            changes.update(status='failed', finished_at=now)
+            logger.error('Task %s #%s failed after %s attempts', row.name, row.pk, row.attempts)
+        else:
+            changes.update(status='queued', run_at=now + timedelta(seconds=backoff_delay(spec, row.attempts)))
+            logger.warning('Task %s #%s failed (attempt %s), retrying', row.name, row.pk, row.attempts)
+        # A worker whose lease was taken over no longer owns the row.
+        Task.objects.filter(pk=row.pk, locked_by=row.locked_by).update(**changes)
+        return False
+    duration = time.perf_counter() - start
+    stats.observe(row.name, duration, ok=True)
+    Task.objects.filter(pk=row.pk, locked_by=row.locked_by).update(
+        status='done', locked_by='', locked_until=None, finished_at=timezone.now(), duration=duration,
+    )
+    return True
+
+
+def run_pending(worker_id, batch_size=10, now=None):
+    """Claim and run one batch; returns the number of tasks run."""
+    rows = claim(worker_id, batch_size, now)
+    for row in rows:
+        execute(row)
+    return len(rows)
+
+
+def prune(older_than_days=None):
+    """Delete finished tasks older than ``FINANCE_TASK_RETENTION_DAYS``; returns rows deleted."""
+    days = older_than_days if older_than_days is not None else getattr(settings, 'FINANCE_TASK_RETENTION_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=days)
+    return Task.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff).delete()[0]
+
+
+def render_prometheus():
+    """Per-task status counts and run timings from the task table, in Prometheus text format."""
+    rows = (
+        Task.objects.values('name', 'status')
+        .annotate(n=Count('id'), seconds=Sum('duration'))
+        .values_list('name', 'status', 'n', 'seconds')
+        .order_by('name', 'status')
+    )
+    lines = [
+        '# HELP finance_tasks Background tasks by name and status (retained rows).',
+        '# TYPE finance_tasks gauge',
+    ]
+    timings = {}
+    for name, status, n, seconds in rows:
+        lines.append(f'finance_tasks{{name="{name}",status="{status}"}} {n}')
+        if status in ('done', 'failed'):
+            total, count = timings.get(name, (0.0, 0))
+            timings[name] = (total + (seconds or 0.0), count + n)
+    lines.append('# HELP finance_task_duration_seconds Run time of finished background tasks.')
+    lines.append('# TYPE finance_task_duration_seconds summary')
+    for name, (total, count) in sorted(timings.items()):
+        lines.append(f'finance_task_duration_seconds_sum{{name="{name}"}} {total:.6f}')
+        lines.append(f'finance_task_duration_seconds_count{{name="{name}"}} {count}')
+    return '\n'.join(lines) + '\n'
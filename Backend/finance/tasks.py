@@ -0,0 +1,86 @@
+"""Built-in background tasks (registered on app start; run by ``manage.py run_worker``).
+
+Heavy modules are imported inside each task so registering them stays cheap.
+Jobs over everyone's finance rows run once per database holding them (default and each shard).
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .routers import data_aliases, db_for_user, use_shard
+from .taskqueue import periodic, prune, task
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+
+def on_each_database(run):
+    """Sum of ``run()`` on each database holding finance rows."""
+    total = 0
+    for alias in data_aliases():
+        with use_shard(alias):
+            total += run()
+    return total
+
+
+@periodic(every=DAY, name='finance.snapshot_balances')
+def snapshot_balances():
+    from .snapshots import append_snapshots
+    return on_each_database(append_snapshots)
+
+
+@periodic(every=DAY, name='finance.reconcile_balances', lease=3600)
+def reconcile_balances(repair=False):
+    from .reconciliation import reconcile_all
+    drifts = on_each_database(lambda: sum(len(result.drifts) for result in reconcile_all(workers=0, repair=repair)))
+    if drifts:
+        logger.warning('Balance reconciliation found %s drifted accounts (repair=%s)', drifts, repair)
+    return drifts
+
+
+@periodic(every=DAY, name='finance.prune_logs', lease=3600)
+def prune_logs():
+    from .retention import apply_retention
+    return on_each_database(lambda: sum(result.deleted for result in apply_retention()))
+
+
+@periodic(every=3600, name='finance.categorize_uncategorized')
+def categorize_uncategorized():
+    from .categorizer import categorize_uncategorized as run
+    return on_each_database(lambda: run()[1])
+
+
+@periodic(every=DAY, name='finance.monthly_statements', lease=6 * 3600)
+def monthly_statements():
+    """Build last month's statements; users already built are skipped, so a retry resumes."""
+    from .statements import generate_statements, previous_month
+    return sum(r.built for r in generate_statements(previous_month(), workers=settings.STATEMENT_WORKERS))
+
+
+@periodic(every=DAY, name='finance.prune_tasks')
+def prune_tasks():
+    return prune()
+
+
+@periodic(every=3600, name='finance.prune_idempotency_keys')
+def prune_idempotency_keys():
+    from .idempotency import prune_expired
+    return prune_expired()
+
+
+@task(name='finance.purge_user_data')
+def purge_user_data(user_id):
+    """Hard-delete a user's app data; the user record remains (Firebase auth)."""
+    from .models import Account, Budget, Category, Goal, Insight, MonthlyStatement, Transaction, UserProfile
+    UserProfile.objects.filter(user_id=user_id).delete()
+    alias = db_for_user(user_id)
+    with use_shard(alias), transaction.atomic(using=alias):
+        Account.objects.filter(user_id=user_id).delete()
+        Category.objects.filter(user_id=user_id).delete()
+        Budget.objects.filter(user_id=user_id).delete()
+        Transaction.objects.filter(user_id=user_id).delete()
+        Goal.objects.filter(user_id=user_id).delete()
+        Insight.objects.filter(user_id=user_id).delete()
+        MonthlyStatement.objects.filter(user_id=user_id).delete()
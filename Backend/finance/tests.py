@@ -1,3 +1,1625 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.apps import apps
+from django.db import connection, connections
+from django.db.models import F, Q, Sum
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .admin import EstimatedCountPaginator, TransactionAdmin
+from .merchants import merchant_ids, normalize_merchant, top_merchants
+from .metrics import registry as metrics_registry
+from .models import (
+    Account, AuditLog, BalanceSnapshot, Budget, Category, Goal, GoalContribution, IdempotencyKey, JobWatermark,
+    Merchant, MerchantSpend, MonthlyStatement, Task, Transaction, UserActivity, UserShard,
+)
+from .benchmark import (
+    benchmark_list_serialization, benchmark_routes, compare_reports, measure_metrics_overhead, measure_startup,
+)
+from .categorizer import Categorizer, features, get_categorizer
+from . import duplicates, events, ledger, provisioning, reconciliation, snapshots
+from .renderers import FastJSONRenderer, msgpack, orjson
+from .provisioning import parse_signup, provision_users
+from .queryplans import audit_plans, explain, full_scans, weak_searches
+from .reconciliation import reconcile_all
+from .retention import purge_range, read_archive
+from .serializers import RowEncoder, TransactionSerializer, UserProfileSerializer
+from .snapshots import append_snapshots, day_start, forward_fill
+from .statements import generate_statements
+from . import taskqueue
+from .throttling import SQLiteBucketStore, parse_rate
+from .synthetic import seed_transactions, seed_users
+from .routers import (
+    ReadReplicaRouter, SQLitePinStore, home_shard, mark_recent_write, use_primary, use_replica, use_user_shard,
+)
+from .sharding import id_floor, pending_moves
+
+User = get_user_model()
+
+
+class FinanceAPITestCase(TestCase):
+    """Base case: an authenticated client carrying the mobile API key."""
+
+    def setUp(self):
+        cache.clear()
+        get_categorizer().clear()
+        self.user = User.objects.create_user(username='u@example.com', email='u@example.com', password='secret123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.credentials(HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+class ReadReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReadReplicaRouter()
+
+    def test_reads_default_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Account), 'default')
+
+    def test_replica_block_round_robins(self):
+        with use_replica():
+            seen = {self.router.db_for_read(Account) for _ in range(4)}
+            with use_primary():
+                self.assertEqual(self.router.db_for_read(Account), 'default')
+        self.assertEqual(seen, {'replica_0', 'replica_1'})
+
+    def test_writes_always_primary(self):
+        with use_replica():
+            self.assertEqual(self.router.db_for_write(Account), 'default')
+
+    def test_recent_writer_is_pinned(self):
+        from .views import SummaryView
+        view = SummaryView()
+        request = type('R', (), {'method': 'GET', 'user': type('U', (), {'id': 42})()})()
+        self.assertTrue(view._reads_from_replica(request))
+        mark_recent_write(42)
+        self.assertFalse(view._reads_from_replica(request))
+
+    def test_pin_is_seen_by_other_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'pins.sqlite3'
+            with override_settings(REPLICA_PIN_STORE={'BACKEND': 'sqlite', 'PATH': path}):
+                mark_recent_write(7)
+            other = SQLitePinStore(path)  # another worker process's store
+            now = time.time()
+            self.assertTrue(other.pinned(7, now))
+            self.assertFalse(other.pinned(8, now))
+            self.assertFalse(other.pinned(7, now + settings.REPLICA_READ_YOUR_WRITES_SECONDS + 1))
+
+
+class ReplicaTrafficTests(FinanceAPITestCase):
+    """The replica is a separate SQLite file beside the test database, seeded with different data than the primary."""
+
+    replica = 'test_replica'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        connections.settings[cls.replica] = {
+            **connections['default'].settings_dict, 'NAME': str(Path(cls.tmp.name) / 'replica.sqlite3'),
+        }
+        call_command('migrate', database=cls.replica, verbosity=0)
+        cls.databases = {*cls.databases, cls.replica}
+        cls.replicated = override_settings(DATABASE_REPLICAS=[cls.replica])
+        cls.replicated.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.replicated.disable()
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.settings[cls.replica]
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        Account.objects.create(user=self.user, name='Checking', type='checking', balance=10)
+        replica_user = User(id=self.user.id, username=self.user.username)
+        replica_user.save(using=self.replica)
+        Account(user=replica_user, name='Checking', type='checking', balance=99).save(using=self.replica)
+
+    def test_summary_reads_from_replica(self):
+        resp = self.client.get('/api/summary/')
+        self.assertEqual(float(resp.data['total_balance']), 99)
+
+    def test_reads_after_write_stay_on_primary(self):
+        self.client.put('/api/preferences/', {'preferences': {'theme': 'dark'}}, format='json')
+        resp = self.client.get('/api/summary/')
+        self.assertEqual(float(resp.data['total_balance']), 10)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ShardingTests(TransactionTestCase):
+    """Two SQLite shard files beside the test database; ``default`` is the directory.
+
+    Their aliases are distinct from any ``DB_SHARD_PATHS`` shards, which the test runner switches off.
+    """
+
+    shards = ['test_shard_0', 'test_shard_1']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        for alias in cls.shards:
+            connections.settings[alias] = {
+                **connections['default'].settings_dict, 'NAME': str(Path(cls.tmp.name) / f'{alias}.sqlite3'),
+            }
+        cls.databases = {*cls.databases, *cls.shards}  # flushed after each test like default
+        cls.sharded = override_settings(DATABASE_SHARDS=cls.shards, SHARD_DIRECTORY_CACHE_SECONDS=60)
+        cls.sharded.enable()
+        for alias in cls.shards:
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sharded.disable()
+        for alias in cls.shards:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY)
+
+    def add_activity(self, user):
+        self.client.force_authenticate(user)
+        account = self.client.get('/api/accounts/').data['results'][0]
+        for direction, amount in (('in', '100.00'), ('out', '30.00'), ('out', '12.50')):
+            res = self.client.post('/api/transactions/', {
+                'account': account['id'], 'direction': direction, 'amount': amount,
+                'txn_time': '2025-03-01T10:00:00Z', 'description': 'Lunch',
+            }, format='json')
+            self.assertEqual(res.status_code, 201, res.content)
+        return self.client.get('/api/summary/').data
+
+    def rows_on(self, alias, user):
+        return {label: list(apps.get_model(label)._base_manager.using(alias).filter(user=user)
+                            .order_by('pk').values_list('pk', flat=True))
+                for label in ('finance.Account', 'finance.Category', 'finance.Transaction', 'finance.AuditLog',
+                              'finance.UserActivity')}
+
+    def test_new_users_live_on_their_hash_shard(self):
+        res = self.client.post('/api/auth/register/', {'email': 'a@example.com', 'password': 'secret123'},
+                               format='json')
+        self.assertEqual(res.status_code, 201)
+        user = User.objects.get(username='a@example.com')
+        home = home_shard(user.pk)
+        self.assertEqual(UserShard.objects.get(user=user).alias, home)
+        summary = self.add_activity(user)
+        self.assertEqual((summary['income_total'], summary['expense_total']), (Decimal('100'), Decimal('42.50')))
+        self.assertEqual(summary['total_balance'], Decimal('57.50'))
+        rows = self.rows_on(home, user)
+        self.assertEqual({k: len(v) for k, v in rows.items()}, {
+            'finance.Account': 1, 'finance.Category': 3, 'finance.Transaction': 3, 'finance.AuditLog': 3,
+            'finance.UserActivity': 5})
+        self.assertTrue(all(pk > id_floor(home) for pks in rows.values() for pk in pks))
+        self.assertFalse(any(self.rows_on('default', user).values()))
+
+    def test_reshard_moves_users_from_before_sharding(self):
+        with override_settings(DATABASE_SHARDS=[]):
+            user = User.objects.create_user(username='old@example.com', password='secret123')
+            summary = self.add_activity(user)
+            before = self.rows_on('default', user)
+            stamps = list(AuditLog.objects.filter(user=user).order_by('pk').values_list('timestamp', flat=True))
+        self.assertFalse(UserShard.objects.exists())
+        home = home_shard(user.pk)
+        # The target's snapshot job is past the user's activity; default's never ran.
+        JobWatermark.objects.using(home).create(name=snapshots.WATERMARK, through=date(2025, 3, 31))
+        out = io.StringIO()
+        call_command('reshard_users', '--batch-size', '2', '--settle', '0', stdout=out)
+        self.assertIn('moved 1 users', out.getvalue())
+        self.assertEqual(UserShard.objects.get(user=user).alias, home)
+        self.assertEqual(self.rows_on(home, user), before)
+        self.assertFalse(any(self.rows_on('default', user).values()))
+        self.assertEqual(list(AuditLog.objects.using(home).filter(user=user).order_by('pk')
+                              .values_list('timestamp', flat=True)), stamps)
+        self.assertEqual(self.client.get('/api/summary/').data, summary)
+        self.assertEqual(list(BalanceSnapshot.objects.using(home).filter(user=user).values_list('date', 'balance')),
+                         [(date(2025, 3, 1), Decimal('57.50'))])
+        call_command('reshard_users', '--settle', '0', stdout=out)
+        self.assertIn('moved 0 users', out.getvalue())
+
+    def test_adding_a_shard_moves_only_users_it_takes_over(self):
+        with override_settings(DATABASE_SHARDS=self.shards[:1]):
+            users = [User.objects.create_user(username=f'u{i}@example.com') for i in range(8)]
+            for user in users:
+                with use_user_shard(user.pk):  # objects.create() routes by the bound user, not the instance
+                    Account.objects.create(user=user, name='Main', type='checking')
+        moving = [u.pk for u in users if home_shard(u.pk) == self.shards[1]]
+        self.assertTrue(moving)
+        self.assertEqual([m[0] for m in pending_moves()], moving)
+        call_command('reshard_users', '--settle', '0', stdout=io.StringIO())
+        for user in users:
+            alias = home_shard(user.pk)
+            self.assertEqual(Account.objects.using(alias).filter(user=user).count(), 1, alias)
+        self.assertFalse(Account.objects.using(self.shards[0]).filter(user_id__in=moving).exists())
+        self.assertFalse(list(pending_moves()))
+
+    def test_writes_are_refused_while_a_user_moves(self):
+        user = User.objects.create_user(username='m@example.com')
+        UserShard.objects.filter(user=user).update(moving=True)
+        self.client.force_authenticate(user)
+        res = self.client.post('/api/categories/', {'name': 'Rent', 'type': 'expense'}, format='json')
+        self.assertEqual((res.status_code, res['Retry-After']), (503, '60'))
+        self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+
+    def test_idempotency_key_commits_with_the_shard_write(self):
+        user = User.objects.create_user(username='k@example.com', password='secret123')
+        home = home_shard(user.pk)
+        with use_user_shard(user.pk):
+            account = Account.objects.create(user=user, name='Main', type='checking')
+        self.client.force_authenticate(user)
+        payload = {'account': account.pk, 'direction': 'out', 'amount': '5.00', 'txn_time': '2025-03-01T10:00:00Z'}
+        save = IdempotencyKey.save
+
+        def fail_storing_response(record, *args, **kwargs):
+            if kwargs.get('update_fields'):
+                raise RuntimeError('lost')
+            return save(record, *args, **kwargs)
+
+        with mock.patch.object(IdempotencyKey, 'save', fail_storing_response):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/transactions/', payload, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertFalse(Transaction.objects.using(home).filter(user=user).exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.client.post('/api/transactions/', payload, format='json',
+                                          HTTP_IDEMPOTENCY_KEY='k').status_code, 201)
+        self.assertEqual(self.client.post('/api/transactions/', payload, format='json',
+                                          HTTP_IDEMPOTENCY_KEY='k')['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.using(home).filter(user=user).count(), 1)
+
+
+class LogRetentionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        now = timezone.now()
+        for days in (400, 200, 100, 1):
+            a = UserActivity.objects.create(path='/api/summary/', method='GET')
+            UserActivity.objects.filter(pk=a.pk).update(timestamp=now - timedelta(days=days))
+
+    def test_archives_and_purges_expired_rows(self):
+        with override_settings(FINANCE_ARCHIVE_DIR=Path(self.tmp.name)):
+            call_command('prune_logs', '--model', 'UserActivity', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(UserActivity.objects.count(), 1)
+        files = sorted(Path(self.tmp.name, 'finance_useractivity').glob('*.ndjson.gz'))
+        self.assertEqual(len(files), 3)
+        rows = [row for f in files for row in read_archive(f)]
+        self.assertEqual({row['path'] for row in rows}, {'/api/summary/'})
+
+    def test_dry_run_keeps_rows(self):
+        out = io.StringIO()
+        call_command('prune_logs', '--dry-run', stdout=out)
+        self.assertEqual(UserActivity.objects.count(), 4)
+        self.assertIn('would purge 3 rows', out.getvalue())
+
+    def test_restart_after_a_failed_delete_reads_each_row_once(self):
+        target = Path(self.tmp.name, 'activity.ndjson.gz')
+        start, end = timezone.now() - timedelta(days=500), timezone.now() - timedelta(days=50)
+        with mock.patch('django.db.models.query.QuerySet.delete', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                purge_range(UserActivity, start, end, archive_to=target)
+        self.assertEqual(UserActivity.objects.count(), 4)
+        self.assertEqual(purge_range(UserActivity, start, end, archive_to=target), (3, 3))
+        with gzip.open(target, 'rt', encoding='utf-8') as fh:
+            self.assertEqual(len(fh.readlines()), 6)
+        self.assertEqual(len(list(read_archive(target))), 3)
+
+
+class SyntheticDataTests(TransactionTestCase):
+    """TransactionTestCase because the benchmark also drives the threaded async views."""
+
+    def test_seed_keeps_balances_consistent(self):
+        seeded = seed_users(2, accounts=2, categories=5, budgets=4)
+        self.assertEqual(seed_transactions(seeded, 50), 50)
+        self.assertEqual(Budget.objects.count(), 8)
+        for account in Account.objects.all():
+            txns = Transaction.objects.filter(account=account)
+            income = txns.filter(direction='in').aggregate(t=Sum('amount'))['t'] or 0
+            expense = txns.filter(direction='out').aggregate(t=Sum('amount'))['t'] or 0
+            self.assertEqual(account.balance, income - expense)
+
+    def test_benchmark_covers_every_get_route(self):
+        seeded = seed_users(1, accounts=1, categories=3, budgets=1)
+        seed_transactions(seeded, 20)
+        results = benchmark_routes(User.objects.get(pk=seeded[0].user_id), iterations=2)
+        self.assertIn('summary', results)
+        self.assertIn('transaction-detail', results)
+        self.assertIn('skipped', results['register'])
+        self.assertIn('skipped', results['events'])
+        for name, stats in results.items():
+            if 'skipped' not in stats:
+                self.assertEqual(stats['status'], 200, name)
+
+    def test_cold_start_stays_lazy_and_within_budget(self):
+        result = measure_startup(runs=1)
+        self.assertEqual(result['status'], 200)
+        self.assertLessEqual(result['first_response_ms'], settings.STARTUP_BUDGET_MS, result['slowest_imports'])
+        # Loaded on first use only: the Firebase SDK and the batch jobs' process pools.
+        for name in ('firebase_admin', 'concurrent.futures.process', 'finance.statements', 'finance.reconciliation'):
+            self.assertNotIn(name, result['modules'])
+
+    def test_compare_flags_regressions(self):
+        old = {'scales': {'10': {'routes': {'summary': {'p95_ms': 1.0}}}}}
+        new = {'scales': {'10': {'routes': {'summary': {'p95_ms': 2.0}}}}}
+        self.assertEqual(compare_reports(old, new)[0][1], 'summary')
+        self.assertEqual(compare_reports(new, old), [])
+        slower = compare_reports({'startup': {'first_response_ms': 300.0}}, {'startup': {'first_response_ms': 400.0}})
+        self.assertEqual(slower[0][0], 'startup')
+
+
+@override_settings(METRICS_TOKEN='scrape-me', N_PLUS_ONE_THRESHOLD=3)
+class MetricsTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get('/api/summary/')
+        stats = metrics_registry.snapshot()[('summary', 'GET')]
+        self.assertEqual(stats.count, 1)
+        self.assertGreater(stats.queries, 0)
+
+    def test_metrics_endpoint_requires_token(self):
+        anon = APIClient()
+        self.assertEqual(anon.get('/api/metrics/').status_code, 401)
+        self.client.get('/api/summary/')
+        resp = anon.get('/api/metrics/', HTTP_X_METRICS_TOKEN='scrape-me')
+        self.assertEqual(resp.status_code, 200)
+        body = resp.content.decode()
+        self.assertIn('finance_request_duration_seconds_bucket{route="summary",method="GET",le="+Inf"} 1', body)
+        self.assertIn('finance_sql_queries_total{route="summary",method="GET"}', body)
+
+    def test_repeated_sql_shape_is_flagged(self):
+        category = Category.objects.create(user=self.user, name='Food', type='expense')
+        for month in range(1, 5):
+            Budget.objects.create(user=self.user, category=category, start_date=f'2025-{month:02d}-01',
+                                  end_date=f'2025-{month:02d}-28', limit_amount=100)
+        self.client.get('/api/reports/budget-progress/')
+        self.assertEqual(metrics_registry.snapshot()[('budget-progress', 'GET')].n_plus_one, 1)
+
+    def test_per_request_overhead_stays_within_budget(self):
+        result = measure_metrics_overhead(requests=1000)
+        self.assertLessEqual(result['overhead_us'], settings.METRICS_OVERHEAD_BUDGET_US, result)
+        self.assertEqual(metrics_registry.snapshot(), {})  # measured into its own registry
+
+
+class TokenBucketThrottleTests(FinanceAPITestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/min'), (120, 2.0))
+        self.assertIsNone(parse_rate(None))
+
+    def test_sqlite_store_is_shared_and_refills(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, 'buckets.sqlite3')
+            worker_a, worker_b = SQLiteBucketStore(path), SQLiteBucketStore(path)
+            self.assertTrue(worker_a.take('k', 2, 1.0, 100.0)[0])
+            self.assertTrue(worker_b.take('k', 2, 1.0, 100.0)[0])
+            self.assertFalse(worker_a.take('k', 2, 1.0, 100.5)[0])
+            self.assertTrue(worker_b.take('k', 2, 1.0, 101.6)[0])
+
+    def test_user_limit_returns_429_with_retry_after(self):
+        rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'user': '2/min', 'anon': '2/min'}}
+        with override_settings(REST_FRAMEWORK=rates):
+            codes = [self.client.get('/api/summary/').status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+            self.assertIn('Retry-After', self.client.get('/api/summary/'))
+
+    def test_throttle_scope_gets_its_own_bucket(self):
+        from .views import SummaryView
+        rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'user': '1/min', 'anon': '1/min', 'summary': '5/min'}}
+        with override_settings(REST_FRAMEWORK=rates), mock.patch.object(SummaryView, 'throttle_scope', 'summary', create=True):
+            codes = [self.client.get('/api/summary/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 200])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisioningTests(FinanceAPITestCase):
+    def test_register_seeds_defaults_and_returns_tokens(self):
+        anon = APIClient()
+        anon.credentials(HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY)
+        resp = anon.post('/api/auth/register/', {'email': 'New@Example.com', 'password': 'secret123',
+                                                 'monthly_income': 2500}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertTrue({'access', 'refresh', 'profile'} <= set(resp.data))
+        user = User.objects.get(username='new@example.com')
+        self.assertTrue(user.check_password('secret123'))
+        self.assertEqual(Account.objects.filter(user=user).count(), 1)
+        self.assertEqual(Category.objects.filter(user=user).count(), 3)
+        again = anon.post('/api/auth/register/', {'email': 'new@example.com', 'password': 'secret123'}, format='json')
+        self.assertEqual(again.status_code, 400)
+
+    def test_bulk_provision_hashes_in_pool(self):
+        signups = [parse_signup({'email': f'p{i}@example.com', 'password': 'secret123'})[0] for i in range(6)]
+        result = provision_users(signups, workers=2)
+        self.assertEqual(len(result.created), 6)
+        self.assertTrue(all(u.check_password('secret123') for u, _ in result.created))
+        self.assertEqual(Category.objects.filter(user__username__startswith='p').count(), 18)
+
+    def test_bulk_endpoint_reports_per_entry_errors(self):
+        self.user.is_staff = True
+        self.user.save()
+        resp = self.client.post('/api/auth/provision/', {'users': [
+            {'email': 'a@example.com', 'password': 'secret123'},
+            {'email': 'bad', 'password': 'secret123'},
+            {'email': 'u@example.com', 'password': 'secret123'},
+        ]}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([c['email'] for c in resp.data['created']], ['a@example.com'])
+        self.assertEqual(sorted(e['index'] for e in resp.data['errors']), [1, 2])
+
+    def test_bulk_endpoint_hashes_on_threads_and_survives_a_racing_signup(self):
+        self.user.is_staff = True
+        self.user.save()
+        real_hash = provisioning.hash_passwords
+
+        def hash_while_someone_registers(passwords, **kwargs):
+            User.objects.create_user(username='p2@example.com', password='secret123')
+            return real_hash(passwords, **kwargs)
+
+        entries = [{'email': f'p{i}@example.com', 'password': 'secret123'} for i in range(6)]
+        with mock.patch('concurrent.futures.ProcessPoolExecutor', side_effect=AssertionError('forked')), \
+                mock.patch.object(provisioning, 'hash_passwords', hash_while_someone_registers):
+            resp = self.client.post('/api/auth/provision/', {'users': entries}, format='json')
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(len(resp.data['created']), 5)
+        self.assertEqual(resp.data['errors'], [{'index': 2, 'email': 'p2@example.com', 'detail': 'User already exists.'}])
+        self.assertEqual(Account.objects.filter(user__username__startswith='p').count(), 5)
+
+    def test_malformed_income_is_a_400_on_both_endpoints(self):
+        bad = ['NaN', 'Infinity', '1e20', '1.234', '-1']
+        anon = APIClient()
+        anon.credentials(HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY)
+        for value in bad:
+            resp = anon.post('/api/auth/register/', {'email': 'n@example.com', 'password': 'secret123',
+                                                     'monthly_income': value}, format='json')
+            self.assertEqual(resp.status_code, 400, value)
+            self.assertTrue(resp.data['detail'].startswith('monthly_income: '), resp.data)
+        self.user.is_staff = True
+        self.user.save()
+        entries = [{'email': f'n{i}@example.com', 'password': 'secret123', 'monthly_income': v}
+                   for i, v in enumerate(bad + ['12.50'])]
+        resp = self.client.post('/api/auth/provision/', {'users': entries}, format='json')
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual([c['email'] for c in resp.data['created']], ['n5@example.com'])
+        self.assertEqual(sorted(e['index'] for e in resp.data['errors']), [0, 1, 2, 3, 4])
+        self.assertFalse(User.objects.filter(username='n@example.com').exists())
+
+    def test_bulk_endpoint_requires_staff(self):
+        resp = self.client.post('/api/auth/provision/', {'users': [{'email': 'a@example.com', 'password': 'x' * 8}]},
+                                format='json')
+        self.assertEqual(resp.status_code, 403)
+
+
+class AsyncReportViewTests(TransactionTestCase):
+    """TransactionTestCase: the async views query from separate threads/connections."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='a@example.com', password='secret123')
+        account = Account.objects.create(user=user, name='Checking', type='checking')
+        food = Category.objects.create(user=user, name='Food', type='expense')
+        pay = Category.objects.create(user=user, name='Pay', type='income')
+        now = timezone.now()
+        Transaction.objects.create(user=user, account=account, category=pay, direction='in', amount=1000, txn_time=now)
+        Transaction.objects.create(user=user, account=account, category=food, direction='out', amount=42, txn_time=now)
+        Budget.objects.create(user=user, category=food, start_date=now.date().replace(day=1),
+                              end_date=now.date() + timedelta(days=1), limit_amount=300)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}',
+                                HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY)
+
+    def test_async_views_match_sync_views(self):
+        for sync_url, async_url in (
+            ('/api/summary/', '/api/async/summary/'),
+            ('/api/reports/category-spending/', '/api/async/reports/category-spending/'),
+            ('/api/reports/budget-progress/', '/api/async/reports/budget-progress/'),
+        ):
+            sync_resp, async_resp = self.client.get(sync_url), self.client.get(async_url)
+            self.assertEqual(async_resp.status_code, 200, async_url)
+            self.assertEqual(json.loads(async_resp.content), json.loads(sync_resp.content), async_url)
+
+    def test_async_view_requires_auth_and_api_key(self):
+        self.assertEqual(APIClient().get('/api/async/summary/').status_code, 401)
+        no_key = APIClient()
+        no_key.credentials(HTTP_AUTHORIZATION=self.client._credentials['HTTP_AUTHORIZATION'])
+        self.assertEqual(no_key.get('/api/async/summary/').status_code, 403)
+
+
+class RendererTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        account = Account.objects.create(user=self.user, name='Checking', type='checking')
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        for i in range(3):
+            Transaction.objects.create(user=self.user, account=account, category=food, amount=Decimal(f'{i + 1}.50'),
+                                       merchant='Café  ', txn_time=timezone.now() - timedelta(days=i))
+
+    @skipUnless(orjson, 'orjson not installed')
+    def test_fast_json_matches_drf_json(self):
+        resp = self.client.get('/api/transactions/')
+        payload = {'page': resp.data, 'raw': {'amount': Decimal('1.50'), 'when': timezone.now(), 'day': date.today()}}
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+    @skipUnless(msgpack, 'msgpack not installed')
+    def test_msgpack_negotiation_round_trips(self):
+        resp = self.client.get('/api/transactions/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(resp['Content-Type'], 'application/msgpack')
+        as_json = json.loads(self.client.get('/api/transactions/').content)
+        self.assertEqual(msgpack.unpackb(resp.content), as_json)
+
+    def test_columnar_transaction_list(self):
+        rows = self.client.get('/api/transactions/').data['results']
+        resp = self.client.get('/api/transactions/?shape=columnar')
+        self.assertEqual(resp.data['count'], 3)
+        columns = resp.data['results']
+        self.assertEqual(list(columns), list(rows[0]))
+        self.assertEqual(columns['amount'], [row['amount'] for row in rows])
+
+
+class DashboardTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.account = Account.objects.create(user=self.user, name='Main', type='checking', balance=0)
+        Account.objects.create(user=self.user, name='Savings', type='savings', balance=500)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        rent = Category.objects.create(user=self.user, name='Rent', type='expense')
+        first = timezone.localdate().replace(day=1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        for category, limit in ((food, 100), (rent, 1000)):
+            Budget.objects.create(user=self.user, category=category, start_date=first, end_date=last,
+                                  limit_amount=limit)
+        for i, (direction, amount, category) in enumerate([
+            ('in', '2000', None), ('out', '80', food), ('out', '15.50', food), ('out', '300', rent),
+        ]):
+            Transaction.objects.create(user=self.user, account=self.account, direction=direction,
+                                       amount=Decimal(amount), category=category, txn_time=now - timedelta(seconds=i))
+
+    def get(self, query=''):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get('/api/dashboard/' + query)
+        self.assertEqual(res.status_code, 200, res.content)
+        return res, [q for q in ctx.captured_queries if 'finance_useractivity' not in q['sql']]
+
+    def test_all_sections_match_their_endpoints_within_six_queries(self):
+        res, queries = self.get()
+        self.assertLessEqual(len(queries), 6)
+        data = res.data
+        self.assertEqual(data['summary'], self.client.get('/api/summary/').data)
+        accounts = self.client.get('/api/accounts/').data
+        self.assertEqual(data['accounts'], accounts.get('results', accounts))
+        progress = {row['budget_id']: row for row in self.client.get('/api/reports/budget-progress/').data}
+        self.assertEqual([b['category'] for b in data['budgets']], ['Food', 'Rent'])  # 95.5% before 30%
+        for row in data['budgets']:
+            self.assertEqual(row, progress[row['budget_id']])
+        first = timezone.localdate().replace(day=1)
+        self.assertEqual(data['category_spending'], self.client.get(
+            f'/api/reports/category-spending/?start={first}&end={timezone.localdate()}').data)
+        recent = self.client.get('/api/transactions/?ordering=-txn_time').data
+        self.assertEqual(data['recent_transactions'], recent.get('results', recent))
+
+    def test_sections_and_limits_trim_the_response_and_queries(self):
+        res, queries = self.get('?sections=summary,budgets&budgets=1&recent=2')
+        self.assertEqual(set(res.data), {'summary', 'budgets'})
+        self.assertEqual(len(res.data['budgets']), 1)
+        self.assertEqual(len(queries), 3)
+        res, queries = self.get('?sections=recent_transactions&recent=2')
+        self.assertEqual(len(res.data['recent_transactions']), 2)
+        self.assertEqual(len(queries), 1)
+
+    def test_bad_parameters_are_rejected(self):
+        for query in ('?sections=summary,nope', '?recent=0', '?budgets=x'):
+            self.assertEqual(self.client.get('/api/dashboard/' + query).status_code, 400, query)
+
+
+class SparseFieldsetTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        account = Account.objects.create(user=self.user, name='Checking', type='checking')
+        self.txn = Transaction.objects.create(user=self.user, account=account, amount=Decimal('9.99'),
+                                              description='a long description', txn_time=timezone.now())
+
+    def test_fields_trims_payload_and_select_list(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/transactions/?fields=id,amount,txn_time,category')
+        self.assertEqual(set(resp.data['results'][0]), {'id', 'amount', 'txn_time', 'category'})
+        selects = [q['sql'] for q in ctx.captured_queries if 'FROM "finance_transaction"' in q['sql']
+                   and 'COUNT(' not in q['sql']]
+        self.assertTrue(selects)
+        self.assertNotIn('"description"', selects[0])
+
+    def test_exclude_on_retrieve(self):
+        resp = self.client.get(f'/api/transactions/{self.txn.pk}/?exclude=description,merchant')
+        self.assertNotIn('description', resp.data)
+        self.assertEqual(resp.data['amount'], '9.99')
+
+    def test_writes_use_full_serializer(self):
+        resp = self.client.patch(f'/api/transactions/{self.txn.pk}/?fields=id', {'description': 'x'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('description', resp.data)
+
+    def test_every_router_viewset_supports_fields(self):
+        for url in ('/api/accounts/', '/api/categories/', '/api/budgets/'):
+            resp = self.client.get(f'{url}?fields=id')
+            self.assertTrue(all(set(row) == {'id'} for row in resp.data['results']), url)
+
+
+class ValuesListTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        checking = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        savings = Account.objects.create(user=self.user, name='Savings', type='savings', balance=0)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        now = timezone.now().replace(microsecond=123456)
+        for i, (direction, amount, category, text) in enumerate([
+            ('in', '1200.00', None, 'Salary'), ('out', '3.10', food, 'caf\u00e9 \u2028 "quoted"'),
+            ('out', '0.01', food, ''), ('in', '99999.99', None, 'bonus'),
+        ] * 8):
+            Transaction.objects.create(user=self.user, account=checking, direction=direction, amount=Decimal(amount),
+                                       category=category, description=text, merchant=text,
+                                       is_pending=bool(i % 3), txn_time=now - timedelta(hours=i))
+        ledger.create_transfer(self.user, checking, savings, Decimal('12.34'), now - timedelta(minutes=5))
+
+    def test_responses_match_the_serializer_byte_for_byte(self):
+        queries = ('', '?page=2', '?ordering=amount', '?fields=id,amount,txn_time,transfer_peer',
+                   '?exclude=description', '?shape=columnar', '?direction=out&search=caf')
+        for tz in ('UTC', 'Asia/Kolkata'):
+            with timezone.override(tz):
+                for query in queries:
+                    with mock.patch.object(TransactionSerializer, 'to_representation', side_effect=AssertionError):
+                        fast = self.client.get('/api/transactions/' + query)
+                    with mock.patch.object(RowEncoder, 'for_serializer', return_value=None):
+                        slow = self.client.get('/api/transactions/' + query)
+                    self.assertEqual(fast.status_code, 200, query)
+                    self.assertEqual(fast.content, slow.content, f'{tz} {query}')
+        self.assertIn(b'"transfer_peer":', fast.content)
+
+    def test_unsupported_fields_fall_back(self):
+        self.assertIsNotNone(RowEncoder.for_serializer(TransactionSerializer()))
+        self.assertIsNone(RowEncoder.for_serializer(UserProfileSerializer()))  # JSONField
+
+    def test_benchmark_reports_both_paths(self):
+        results = benchmark_list_serialization(self.user, page_sizes=(25,), iterations=2)
+        self.assertEqual(results['25']['rows'], 25)
+        self.assertGreater(results['25']['speedup'], 0)
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        seeded = seed_users(3, accounts=2, categories=3, budgets=0)
+        seed_transactions(seeded, 60)
+        self.drifted = Account.objects.order_by('id').first()
+        Account.objects.filter(pk=self.drifted.pk).update(balance=F('balance') + 5)
+
+    def test_command_reports_without_writing_by_default(self):
+        out = io.StringIO()
+        call_command('reconcile_balances', '--workers', '0', '--shard-size', '2', stdout=out)
+        self.assertIn(f'account {self.drifted.pk} ', out.getvalue())
+        self.assertIn('1 drifted', out.getvalue())
+        self.assertEqual(Account.objects.get(pk=self.drifted.pk).balance, self.drifted.balance + 5)
+        call_command('reconcile_balances', '--repair', '--workers', '0', '--shard-size', '2', stdout=out)
+        self.assertIn('1 repaired', out.getvalue())
+        self.assertEqual(Account.objects.get(pk=self.drifted.pk).balance, self.drifted.balance)
+
+    def test_repair_restores_ledger_balance(self):
+        results = list(reconcile_all(shard_size=2, workers=0, repair=True))
+        self.assertEqual(sum(r.repaired for r in results), 1)
+        self.assertEqual(sum(r.transactions for r in results), 60)
+        self.assertEqual(Account.objects.get(pk=self.drifted.pk).balance, self.drifted.balance)
+        self.assertFalse(any(r.drifts for r in reconcile_all(shard_size=2, workers=0)))
+
+    def test_repair_keeps_write_landing_between_reads(self):
+        account = Account.objects.exclude(pk=self.drifted.pk).order_by('id').first()
+        before, real = account.balance, reconciliation.expected_balances
+
+        def totals_then_write(lo, hi):
+            totals = real(lo, hi)
+            if lo <= account.user_id < hi:
+                Transaction.objects.create(user_id=account.user_id, account=account, direction='in',
+                                           amount=Decimal('7.00'), txn_time=timezone.now())
+            return totals
+
+        with mock.patch.object(reconciliation, 'expected_balances', totals_then_write):
+            results = list(reconcile_all(shard_size=2, workers=0, repair=True))
+        self.assertIn(account.pk, [d.account_id for r in results for d in r.drifts])
+        self.assertEqual(sum(r.repaired for r in results), 1)
+        self.assertEqual(Account.objects.get(pk=account.pk).balance, before + Decimal('7.00'))
+        self.assertFalse(any(r.drifts for r in reconcile_all(shard_size=2, workers=0)))
+
+
+class StatementTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.month = date(2024, 3, 1)
+        at = lambda d, h=12: timezone.make_aware(datetime(2024, d[0], d[1], h))  # noqa: E731
+        self.checking = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        self.savings = Account.objects.create(user=self.user, name='Savings', type='savings', balance=0)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.budget = Budget.objects.create(user=self.user, category=food, period='custom',
+                                            start_date=date(2024, 3, 10), end_date=date(2024, 4, 9), limit_amount=100)
+        for day, direction, amount, category in [
+            ((2, 20), 'in', '500.00', None), ((3, 5), 'out', '40.00', food), ((3, 15), 'out', '25.00', food),
+            ((3, 20), 'in', '100.00', None), ((4, 2), 'out', '9.00', food),
+        ]:
+            Transaction.objects.create(user=self.user, account=self.checking, direction=direction,
+                                       amount=Decimal(amount), category=category, txn_time=at(day))
+        ledger.create_transfer(self.user, self.checking, self.savings, Decimal('50.00'), at((3, 25)))
+        goal = Goal.objects.create(user=self.user, name='Trip', target_amount=1000)
+        for day, amount in (((3, 1), '20.00'), ((3, 30), '30.00'), ((4, 1), '99.00')):
+            GoalContribution.objects.create(goal=goal, amount=Decimal(amount), contributed_at=at(day))
+        self.other = User.objects.create_user(username='o@example.com', password='secret123')
+        Account.objects.create(user=self.other, name='Other', type='checking', balance=0)
+
+    def test_statement_matches_the_ledger(self):
+        results = list(generate_statements(self.month, range_size=1, workers=0))
+        self.assertEqual(sum(r.built for r in results), 2)
+        data = MonthlyStatement.objects.get(user=self.user, month=self.month).data
+        start, end = day_start(self.month), day_start(date(2024, 4, 1)) - timedelta(microseconds=1)
+        for row in data['accounts']:
+            expected = ledger.statement(row['id'], start, end)
+            self.assertEqual(Decimal(row['opening_balance']), expected['opening_balance'])
+            self.assertEqual(Decimal(row['closing_balance']), expected['closing_balance'])
+            self.assertEqual(row['transactions'], len(expected['transactions']))
+        checking = data['accounts'][0]
+        self.assertEqual((checking['opening_balance'], checking['closing_balance']), ('500.00', '485.00'))
+        self.assertEqual((checking['inflow'], checking['outflow']), ('100.00', '115.00'))
+        self.assertEqual(data['totals'], {'income': '100.00', 'expense': '65.00', 'net': '35.00'})
+        self.assertEqual([(c['category'], c['expense']) for c in data['categories']],
+                         [('Food', '65.00'), (None, '0.00')])
+        budget, = data['budgets']
+        self.assertEqual((budget['budget_id'], budget['spent'], budget['remaining']), (self.budget.pk, '25.00', '75.00'))
+        self.assertEqual([(g['name'], g['contributed'], g['contributions']) for g in data['goals']],
+                         [('Trip', '50.00', 2)])
+
+    def test_endpoint_serves_the_stored_statement(self):
+        self.assertEqual(self.client.get('/api/statements/2024-03/').status_code, 404)
+        list(generate_statements(self.month, workers=0))
+        listing = self.client.get('/api/statements/').data
+        self.assertEqual([(r['month'], r['transaction_count']) for r in listing], [('2024-03', 5)])
+        res = self.client.get('/api/statements/2024-03/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['totals']['net'], '35.00')
+        self.assertEqual(self.client.get('/api/statements/2024-13/').status_code, 400)
+
+    def test_rerun_resumes_and_rebuild_replaces(self):
+        list(generate_statements(self.month, workers=0))
+        MonthlyStatement.objects.filter(user=self.other).delete()
+        Transaction.objects.filter(user=self.user, direction='in', amount=Decimal('100.00')).delete()
+        out = io.StringIO()
+        call_command('generate_statements', '--month', '2024-03', '--workers', '0', stdout=out)
+        self.assertIn('1 statements built, 1 already stored', out.getvalue())
+        stored = MonthlyStatement.objects.get(user=self.user, month=self.month)
+        self.assertEqual(stored.data['totals']['income'], '100.00')
+        list(generate_statements(self.month, workers=0, rebuild=True))
+        self.assertEqual(MonthlyStatement.objects.get(user=self.user, month=self.month).data['totals']['income'], '0.00')
+        self.assertEqual(MonthlyStatement.objects.count(), 2)
+
+
+class LedgerTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.checking = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        self.savings = Account.objects.create(user=self.user, name='Savings', type='savings', balance=0)
+        self.day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=10)
+
+    def post_txn(self, direction, amount, days, **extra):
+        payload = {'direction': direction, 'amount': amount, 'account': self.checking.pk,
+                   'txn_time': (self.day + timedelta(days=days)).isoformat(), **extra}
+        resp = self.client.post('/api/transactions/', payload, format='json')
+        self.assertEqual(resp.status_code, 201, resp.data)
+        return resp.data
+
+    def running(self, account):
+        return list(Transaction.objects.filter(account=account).order_by('txn_time', 'pk')
+                    .values_list('running_balance', flat=True))
+
+    def test_running_balance_follows_backdated_inserts_and_deletes(self):
+        self.post_txn('in', '100.00', 0)
+        late = self.post_txn('out', '30.00', 2)
+        self.assertEqual(late['running_balance'], '70.00')
+        early = self.post_txn('out', '10.00', 1)
+        self.assertEqual(self.running(self.checking), [Decimal('100.00'), Decimal('90.00'), Decimal('60.00')])
+        self.client.delete(f"/api/transactions/{early['id']}/")
+        self.assertEqual(self.running(self.checking), [Decimal('100.00'), Decimal('70.00')])
+        resp = self.client.patch(f"/api/transactions/{late['id']}/", {'amount': '50.00'}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(self.running(self.checking), [Decimal('100.00'), Decimal('50.00')])
+        self.checking.refresh_from_db()
+        self.assertEqual(self.checking.balance, Decimal('50.00'))
+
+    def test_transfer_creates_paired_legs(self):
+        self.post_txn('in', '200.00', 0)
+        data = self.post_txn('transfer', '75.00', 1, to_account=self.savings.pk)
+        out_leg = Transaction.objects.get(pk=data['id'])
+        in_leg = out_leg.transfer_peer
+        self.assertEqual((out_leg.transfer_side, in_leg.transfer_side), ('out', 'in'))
+        self.assertEqual(in_leg.transfer_peer_id, out_leg.pk)
+        self.assertEqual(in_leg.account_id, self.savings.pk)
+        balances = dict(Account.objects.filter(user=self.user).values_list('name', 'balance'))
+        self.assertEqual(balances, {'Checking': Decimal('125.00'), 'Savings': Decimal('75.00')})
+        self.assertFalse(any(r.drifts for r in reconcile_all(workers=0)))
+
+        resp = self.client.patch(f"/api/transactions/{out_leg.pk}/", {'amount': '1.00'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.client.delete(f'/api/transactions/{in_leg.pk}/')
+        self.assertFalse(Transaction.objects.filter(direction='transfer').exists())
+        balances = dict(Account.objects.filter(user=self.user).values_list('name', 'balance'))
+        self.assertEqual(balances, {'Checking': Decimal('200.00'), 'Savings': Decimal('0.00')})
+
+    def test_transfer_validation(self):
+        resp = self.client.post('/api/transactions/', {
+            'direction': 'transfer', 'amount': '5.00', 'account': self.checking.pk, 'txn_time': self.day.isoformat(),
+        }, format='json')
+        self.assertIn('to_account', resp.data)
+        resp = self.client.post('/api/transactions/', {
+            'direction': 'transfer', 'amount': '5.00', 'account': self.checking.pk,
+            'to_account': self.checking.pk, 'txn_time': self.day.isoformat(),
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        for name, value in (('category', food.pk), ('merchant', 'Bank'), ('external_id', 'B-7')):
+            resp = self.client.post('/api/transactions/', {
+                'direction': 'transfer', 'amount': '5.00', 'account': self.checking.pk,
+                'to_account': self.savings.pk, 'txn_time': self.day.isoformat(), name: value,
+            }, format='json')
+            self.assertEqual((resp.status_code, list(resp.data)), (400, [name]))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_balance_at_and_statement(self):
+        self.post_txn('in', '100.00', 0)
+        self.post_txn('out', '40.00', 3)
+        self.post_txn('out', '5.00', 6)
+        mid = (self.day + timedelta(days=4)).date().isoformat()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f'/api/accounts/{self.checking.pk}/balance/', {'at': mid})
+        self.assertEqual(resp.data['balance'], Decimal('60.00'))
+        self.assertEqual(sum('"finance_transaction"' in q['sql'] for q in ctx.captured_queries), 1)
+
+        start = (self.day + timedelta(days=1)).date().isoformat()
+        resp = self.client.get(f'/api/accounts/{self.checking.pk}/statement/', {'start': start, 'end': mid})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['opening_balance'], Decimal('100.00'))
+        self.assertEqual(resp.data['closing_balance'], Decimal('60.00'))
+        self.assertEqual([r['running_balance'] for r in resp.data['transactions']], [Decimal('60.00')])
+
+
+class BalanceSnapshotTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.checking = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        self.savings = Account.objects.create(user=self.user, name='Savings', type='savings', balance=0)
+        self.today = timezone.localdate()
+        self.add(self.checking, 'in', '100.00', 6)
+        self.add(self.checking, 'out', '20.00', 4)
+        self.add(self.savings, 'in', '50.00', 3)
+
+    def add(self, account, direction, amount, days_ago):
+        when = timezone.now() - timedelta(days=days_ago)
+        return Transaction.objects.create(user=self.user, account=account, direction=direction,
+                                          amount=Decimal(amount), txn_time=when)
+
+    def net_worth(self, days):
+        start = self.today - timedelta(days=days - 1)
+        resp = self.client.get('/api/reports/net-worth/', {'start': start.isoformat(), 'end': self.today.isoformat()})
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return resp.data
+
+    def test_forward_fill(self):
+        self.assertEqual(forward_fill([None, 1, None, None, 3, None], 0), [0, 1, 1, 1, 3, 3])
+
+    def test_append_is_incremental(self):
+        call_command('snapshot_balances', stdout=io.StringIO())
+        self.assertEqual(BalanceSnapshot.objects.count(), 3)
+        self.assertEqual(append_snapshots(), 0)
+        self.add(self.savings, 'in', '5.00', 0)
+        self.assertEqual(append_snapshots(until=self.today), 1)
+
+    def test_quiet_account_does_not_widen_the_next_run(self):
+        append_snapshots(until=self.today - timedelta(days=1))
+        self.add(self.checking, 'in', '5.00', 0)  # savings stays quiet since day -3
+        scanned = []
+        real = snapshots.daily_closings
+
+        def recording(queryset):
+            scanned.append(queryset)
+            return real(queryset)
+
+        with mock.patch.object(snapshots, 'daily_closings', recording):
+            self.assertEqual(append_snapshots(until=self.today), 1)
+        self.assertEqual(scanned[0].count(), 1)  # today's row only
+        self.assertEqual(snapshots.snapshotted_through(), self.today)
+
+    def test_backdated_change_on_a_quiet_account_is_patched(self):
+        append_snapshots()
+        self.add(self.savings, 'out', '5.00', 2)  # after savings' last snapshot, before the watermark
+        day = self.today - timedelta(days=2)
+        self.assertEqual(BalanceSnapshot.objects.get(account=self.savings, date=day).balance, Decimal('45.00'))
+        self.assertEqual(append_snapshots(), 0)
+
+    def test_series_reads_snapshots_and_unsnapshotted_tail(self):
+        append_snapshots(until=self.today - timedelta(days=4))
+        self.add(self.savings, 'out', '10.00', 1)  # after the snapshots: served from running balances
+        data = self.net_worth(7)
+        self.assertEqual(len(data['dates']), 7)
+        self.assertEqual(data['total'], [Decimal(v) for v in ('100', '100', '80', '130', '130', '120', '120')])
+        checking = next(a for a in data['accounts'] if a['id'] == self.checking.pk)
+        self.assertEqual(checking['balances'][-1], Decimal('80.00'))
+
+    def test_backdated_change_patches_snapshots(self):
+        append_snapshots()
+        before = self.net_worth(7)['total']
+        backdated = self.add(self.checking, 'out', '30.00', 5)
+        self.assertEqual(
+            BalanceSnapshot.objects.get(account=self.checking, date=timezone.localdate(backdated.txn_time)).balance,
+            Decimal('70.00'),
+        )
+        after = self.net_worth(7)['total']
+        self.assertEqual([a - b for a, b in zip(after, before)], [Decimal('0')] + [Decimal('-30')] * 6)
+        backdated.delete()
+        self.assertEqual(self.net_worth(7)['total'], before)
+
+    def test_unsnapshotted_account_reads_only_from_the_range_start(self):
+        card = Account.objects.create(user=self.user, name='Card', type='credit', balance=0)
+        for days_ago in range(30, 0, -1):
+            self.add(card, 'out', '1.00', days_ago)
+        tails = []
+        real = snapshots.daily_closings
+
+        def recording(queryset):
+            tails.append(queryset)
+            return real(queryset)
+
+        with mock.patch.object(snapshots, 'daily_closings', recording):
+            data = self.net_worth(7)
+        self.assertEqual(tails[0].filter(account=card).count(), 6)  # not its 30-day history
+        balances = next(a['balances'] for a in data['accounts'] if a['id'] == card.pk)
+        self.assertEqual(balances, [Decimal(v) for v in ('-25', '-26', '-27', '-28', '-29', '-30', '-30')])
+        self.assertEqual(data['total'][-1], Decimal('100'))
+
+    def test_totals_are_kept_per_currency(self):
+        euro = Account.objects.create(user=self.user, name='Euro', type='checking', balance=0, currency='EUR')
+        Transaction.objects.create(user=self.user, account=euro, direction='in', amount=Decimal('40.00'),
+                                   currency='EUR', txn_time=timezone.now() - timedelta(days=2))
+        data = self.net_worth(7)
+        self.assertIsNone(data['total'])
+        self.assertEqual((data['totals']['USD'][-1], data['totals']['EUR'][-1]), (Decimal('130'), Decimal('40')))
+
+    def test_invalid_range(self):
+        resp = self.client.get('/api/reports/net-worth/', {'start': '2025-02-01', 'end': '2025-01-01'})
+        self.assertEqual(resp.status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secret123')
+        self.client.force_login(self.admin_user)
+        owner = User.objects.create_user('o@example.com', 'o@example.com', 'secret123')
+        account = Account.objects.create(user=owner, name='Checking', type='checking', balance=0)
+        start = timezone.now() - timedelta(days=400)
+        for i in range(25):
+            Transaction.objects.create(user=owner, account=account, direction='in', amount=Decimal('1.00'),
+                                       txn_time=start + timedelta(days=i * 16))
+
+    def test_keyset_pages_cover_every_row_once(self):
+        seen = []
+        query = ''
+        with mock.patch.object(TransactionAdmin, 'list_per_page', 10):
+            while query is not None:
+                resp = self.client.get('/admin/finance/transaction/' + query)
+                self.assertEqual(resp.status_code, 200)
+                cl = resp.context['cl']
+                seen.extend(t.pk for t in cl.result_list)
+                query = cl.next_page_url
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, list(Transaction.objects.order_by('-txn_time', '-pk').values_list('pk', flat=True)))
+
+    def test_changelist_avoids_counts_distinct_dates_and_n_plus_one(self):
+        with mock.patch.object(EstimatedCountPaginator, 'exact_below', 0), \
+                CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/admin/finance/transaction/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.context['cl'].paginator.estimated)
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse([q for q in sql if 'COUNT(' in q.upper()], sql)
+        self.assertFalse([q for q in sql if 'DISTINCT' in q.upper()], sql)
+        self.assertFalse([q for q in sql if 'FROM "finance_account"' in q], sql)
+
+    def test_date_hierarchy_drilldown(self):
+        year = Transaction.objects.order_by('txn_time').first().txn_time.year
+        resp = self.client.get('/admin/finance/transaction/', {'txn_time__year': year})
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, f'txn_time__year={year}">')
+        self.assertContains(resp, 'txn_time__month=')
+
+    def test_log_changelists(self):
+        for url in ('/admin/finance/auditlog/', '/admin/finance/useractivity/', '/admin/finance/balancesnapshot/'):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+
+class MerchantTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+
+    def spend(self, merchant, amount, when):
+        return Transaction.objects.create(user=self.user, account=self.account, direction='out', merchant=merchant,
+                                          amount=Decimal(amount), txn_time=when)
+
+    def test_normalization_merges_variants(self):
+        for raw in ('AMZN Mktp US*2K4LM93', 'Amazon.com', 'AMAZON MARKETPLACE #123'):
+            self.assertEqual(normalize_merchant(raw), 'amazon', raw)
+        self.assertEqual(normalize_merchant('SQ *BLUE BOTTLE COFFEE'), 'blue bottle coffee')
+        self.assertEqual(normalize_merchant('PAYPAL *SPOTIFY'), 'spotify')
+        self.assertEqual(normalize_merchant('POS 4412'), '')
+
+    def test_aggregates_follow_writes(self):
+        when = timezone.now() - timedelta(days=1)
+        self.spend('AMZN Mktp US*1', '10.00', when)
+        doomed = self.spend('Amazon.com', '5.00', when)
+        self.assertEqual(Merchant.objects.count(), 1)
+        row = MerchantSpend.objects.get()
+        self.assertEqual((row.spent, row.txn_count), (Decimal('15.00'), 2))
+        doomed.delete()
+        row.refresh_from_db()
+        self.assertEqual((row.spent, row.txn_count), (Decimal('10.00'), 1))
+
+    def test_report_matches_raw_rows_across_partial_months(self):
+        base = timezone.make_aware(datetime(2025, 1, 20, 12))
+        for i, (name, amount) in enumerate([('Amazon.com', '40'), ('Starbucks #12', '6'), ('AMZN', '15'),
+                                            ('SBUX 0001', '4'), ('Netflix', '15'), ('Amazon', '7')] * 4):
+            self.spend(name, amount, base + timedelta(days=9 * i))
+        start, end = date(2025, 2, 10), date(2025, 6, 15)
+        got = top_merchants(self.user, start, end, limit=2)
+        expected = {}
+        for t in Transaction.objects.filter(txn_time__date__gte=start, txn_time__date__lte=end):
+            key = normalize_merchant(t.merchant)
+            expected[key] = expected.get(key, Decimal('0')) + t.amount
+        ranked = sorted(expected.items(), key=lambda kv: -kv[1])[:2]
+        self.assertEqual([(r['name'].lower(), r['spent']) for r in got], ranked)
+
+        resp = self.client.get('/api/reports/merchants/', {'start': start.isoformat(), 'end': end.isoformat(), 'limit': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([r['merchant_id'] for r in resp.data], [r['merchant_id'] for r in got])
+
+    def test_edits_and_repeat_merchants_skip_the_lookup(self):
+        self.addCleanup(merchant_ids.clear)  # the test's rollback undoes the merchants it remembers
+        with self.captureOnCommitCallbacks(execute=True):
+            txn = self.spend('Amazon.com', '3.00', timezone.now())
+        txn = Transaction.objects.get(pk=txn.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            txn.amount = Decimal('4.00')
+            txn.save()
+            self.spend('AMZN Mktp US*1', '5.00', timezone.now())
+        self.assertFalse(any('finance_merchant"' in q['sql'] for q in ctx.captured_queries))
+        txn.merchant = 'Starbucks #12'
+        txn.save()
+        self.assertEqual(Transaction.objects.get(pk=txn.pk).canonical_merchant.key, 'starbucks')
+
+    def test_backfill_command(self):
+        self.spend('Amazon.com', '3.00', timezone.now())
+        Transaction.objects.update(canonical_merchant=None)
+        MerchantSpend.objects.all().delete()
+        call_command('rebuild_merchants', stdout=io.StringIO())
+        self.assertEqual(Transaction.objects.get().canonical_merchant.key, 'amazon')
+        self.assertEqual(MerchantSpend.objects.get().spent, Decimal('3.00'))
+
+
+
+class DuplicateDetectionTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        self.when = timezone.now() - timedelta(days=3)
+
+    def spend(self, merchant, amount, when, **extra):
+        return Transaction.objects.create(user=self.user, account=self.account, direction='out', merchant=merchant,
+                                          amount=Decimal(amount), txn_time=when, **extra)
+
+    def row(self, merchant, amount, when, **extra):
+        return {'direction': 'out', 'amount': amount, 'merchant': merchant, 'txn_time': when.isoformat(), **extra}
+
+    def import_rows(self, *rows):
+        return self.client.post('/api/transactions/import/', {'account': self.account.pk, 'transactions': list(rows)},
+                                format='json')
+
+    def test_create_reports_matches_within_window(self):
+        first = self.spend('STARBUCKS #12', '5.40', self.when)
+        self.spend('Starbucks', '5.41', self.when)
+        self.spend('Starbucks', '5.40', self.when + timedelta(days=3))
+        resp = self.client.post('/api/transactions/', {
+            'account': self.account.pk, 'direction': 'out', 'amount': '5.40', 'merchant': 'SBUX 0001',
+            'txn_time': (self.when + timedelta(days=1)).isoformat(),
+        }, format='json')
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['possible_duplicates'], [first.pk])
+        self.assertEqual(Transaction.objects.count(), 4)
+
+    def test_probe_uses_fingerprint_index(self):
+        txn = self.spend('Netflix', '15.00', self.when)
+        self.assertEqual(len(txn.fingerprint), 32)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(duplicates.find_duplicates(Transaction(user=self.user, account=self.account,
+                                                                    direction='out', amount=Decimal('15.00'),
+                                                                    txn_time=self.when, merchant='NETFLIX.COM')),
+                             [txn.pk])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql, params = (Transaction.objects.filter(user_id=self.user.pk, fingerprint__in=['a', 'b'])
+                       .values_list('pk').query.sql_with_params())
+        # Enough of one user's history that only the fingerprint column narrows the search.
+        seeded = [Transaction(user=self.user, account=self.account, direction='out', amount=Decimal(i + 1),
+                              txn_time=self.when, merchant='Shop') for i in range(300)]
+        for row in seeded:
+            row.fingerprint = duplicates.fingerprint(row)
+        Transaction.objects.bulk_create(seeded)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        plan = explain(sql, params)
+        self.assertEqual(full_scans(sql, plan), [])
+        if connection.vendor == 'sqlite':
+            self.assertTrue(any('fingerprint=?' in line for line in plan), plan)
+
+    def test_import_skips_known_rows_in_one_probe_per_batch(self):
+        known = self.spend('Amazon.com', '40.00', self.when)
+        banked = self.spend('Rent', '1200.00', self.when - timedelta(days=10), external_id='B-1')
+        rows = [
+            self.row('AMZN Mktp US*2K4', '40.00', self.when + timedelta(hours=20)),
+            self.row('Landlord LLC', '1200.00', self.when - timedelta(days=9), external_id='B-1'),
+            self.row('Blue Bottle', '4.50', self.when),
+            self.row('Blue Bottle', '4.50', self.when),
+            self.row('Shell', '45.00', self.when, direction='in'),
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.import_rows(*rows)
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['duplicates'], [{'index': 0, 'existing': [known.pk]},
+                                                   {'index': 1, 'existing': [banked.pk]}])
+        self.assertEqual(len(resp.data['created']), 3)
+        probes = [q for q in ctx.captured_queries
+                  if 'finance_transaction' in q['sql'] and '"fingerprint" IN' in q['sql']]
+        self.assertEqual(len(probes), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('-1240.00') - Decimal('9.00') + Decimal('45.00'))
+        self.assertEqual(self.account.balance, Transaction.objects.filter(account=self.account).aggregate(
+            net=Sum('amount', filter=Q(direction='in')) - Sum('amount', filter=Q(direction='out')))['net'])
+
+        again = self.import_rows(*rows)
+        self.assertEqual(again.status_code, 200, again.data)
+        self.assertEqual((again.data['created'], [d['index'] for d in again.data['duplicates']]), ([], [0, 1, 2, 3, 4]))
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_import_validates_rows(self):
+        other = get_user_model().objects.create_user(username='other', password='x')
+        foreign = Category.objects.create(user=other, name='Food', type='expense')
+        self.assertEqual(self.import_rows(self.row('X', '1.00', self.when, category=foreign.pk)).status_code, 400)
+        self.assertEqual(self.import_rows(self.row('X', '-1.00', self.when)).status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_backfill_command(self):
+        txn = self.spend('Spotify', '9.99', self.when)
+        expected = txn.fingerprint
+        Transaction.objects.update(fingerprint='')
+        call_command('backfill_fingerprints', stdout=io.StringIO())
+        txn.refresh_from_db()
+        self.assertEqual(txn.fingerprint, expected)
+
+@override_settings(CATEGORIZER_REFRESH_SECONDS=0)
+class CategorizerTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        self.dining = Category.objects.create(user=self.user, name='Dining', type='expense')
+        self.transport = Category.objects.create(user=self.user, name='Transport', type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', type='income')
+        when = timezone.now() - timedelta(days=3)
+        for i in range(6):
+            self.txn('STARBUCKS STORE #%d' % i, '5.40', self.dining, when=when)
+            self.txn('SHELL OIL %d' % i, '45.00', self.transport, when=when)
+        self.txn('ACME PAYROLL', '3000.00', self.salary, direction='in', when=when)
+
+    def txn(self, merchant, amount, category=None, direction='out', when=None):
+        return Transaction.objects.create(user=self.user, account=self.account, direction=direction,
+                                          merchant=merchant, amount=Decimal(amount), category=category,
+                                          txn_time=when or timezone.now())
+
+    def post(self, **payload):
+        payload = {'direction': 'out', 'account': self.account.pk, 'txn_time': timezone.now().isoformat(), **payload}
+        resp = self.client.post('/api/transactions/', payload, format='json')
+        self.assertEqual(resp.status_code, 201, resp.data)
+        return resp.data
+
+    def test_quick_add_is_categorized_and_flagged(self):
+        data = self.post(amount='4.95', merchant='Starbucks #88')
+        self.assertEqual((data['category'], data['auto_categorized']), (self.dining.pk, True))
+        self.assertEqual(self.post(amount='50.00', merchant='SHELL 77')['category'], self.transport.pk)
+        self.assertEqual(self.post(amount='3000.00', direction='in', merchant='Acme payroll')['category'],
+                         self.salary.pk)
+        resp = self.client.patch(f"/api/transactions/{data['id']}/", {'category': self.transport.pk}, format='json')
+        self.assertFalse(resp.data['auto_categorized'])
+
+    def test_predicted_rows_are_not_training_data(self):
+        self.post(amount='4.95', merchant='Starbucks')
+        model = get_categorizer().model_for(self.user.pk)
+        self.assertEqual(len(model.labels), 13)
+
+    def test_incremental_refresh_unlearns_deletes_without_retraining(self):
+        engine = get_categorizer()
+        model = engine.model_for(self.user.pk)
+        self.assertEqual(len(model.labels), 13)
+        extra = self.txn('BLUE BOTTLE', '6.00', self.dining)
+        self.assertEqual(len(engine.model_for(self.user.pk).labels), 14)
+        pk = extra.pk
+        extra.delete()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIs(engine.model_for(self.user.pk), model)
+        self.assertNotIn(pk, model.labels)
+        self.assertEqual(len(model.labels), 13)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+
+    @override_settings(CATEGORIZER_MAX_EXAMPLES=4)
+    def test_training_is_bounded_to_the_newest_examples(self):
+        newest = list(Transaction.objects.order_by('-pk').values_list('pk', flat=True)[:4])
+        self.assertEqual(sorted(get_categorizer().model_for(self.user.pk).labels), sorted(newest))
+
+    @override_settings(CATEGORIZER_MAX_EXAMPLES=4)
+    def test_refresh_keeps_the_bound(self):
+        engine = get_categorizer()
+        engine.model_for(self.user.pk)
+        added = [self.txn('BLUE BOTTLE %d' % i, '6.00', self.dining).pk for i in range(3)]
+        newest = list(Transaction.objects.order_by('-pk').values_list('pk', flat=True)[:4])
+        self.assertEqual(sorted(engine.model_for(self.user.pk).labels), sorted(newest))
+        self.assertTrue(set(added) <= set(newest))
+
+    def test_scoring_waits_for_a_refresh_in_progress(self):
+        engine = Categorizer(refresh_seconds=60)
+        entry = engine._entry_for(self.user.pk)
+        types = {c.pk: c.type for c in (self.dining, self.transport, self.salary)}
+        pending = Transaction(merchant='Starbucks', description='', amount=Decimal('5.00'), direction='out')
+        results = []
+        with mock.patch('finance.categorizer._category_types', return_value=types):
+            with entry.lock:  # as a refresh holds it
+                worker = threading.Thread(target=lambda: results.append(engine.categorize(self.user.pk, [pending])))
+                worker.start()
+                worker.join(0.2)
+                self.assertTrue(worker.is_alive())
+            worker.join(5)
+        self.assertEqual(results, [[self.dining.pk]])
+
+    def test_lru_is_bounded(self):
+        engine = Categorizer(max_models=2, refresh_seconds=60)
+        for user_id in (self.user.pk, self.user.pk + 1000, self.user.pk + 2000):
+            engine.model_for(user_id)
+        self.assertEqual(list(engine._models), [self.user.pk + 1000, self.user.pk + 2000])
+
+    def test_batch_command_fills_uncategorized_rows(self):
+        pending = [self.txn('Starbucks Reserve', '7.00'), self.txn('Shell', '30.00'), self.txn('Mystery', '1.00')]
+        call_command('categorize_transactions', stdout=io.StringIO())
+        got = {t.pk: (t.category_id, t.auto_categorized) for t in Transaction.objects.filter(pk__in=[p.pk for p in pending])}
+        self.assertEqual(got[pending[0].pk], (self.dining.pk, True))
+        self.assertGreater(Transaction.objects.get(pk=pending[0].pk).updated_at, pending[0].updated_at)
+        self.assertEqual(got[pending[1].pk], (self.transport.pk, True))
+
+    def test_prediction_cost_is_tens_of_microseconds(self):
+        model = get_categorizer().model_for(self.user.pk)
+        samples = [('Starbucks #%d' % i, 'coffee', Decimal('5.10')) for i in range(2000)]
+        t0 = time.perf_counter()
+        for merchant, description, amount in samples:
+            model.predict(features(merchant, description, amount), 'out')
+        per_txn = (time.perf_counter() - t0) / len(samples)
+        self.assertLess(per_txn, 200e-6)
+
+
+_task_calls = []
+
+
+@taskqueue.task(name='tests.record', max_attempts=3, backoff=10)
+def _record_task(value, fail=False):
+    _task_calls.append(value)
+    if fail:
+        raise RuntimeError('boom')
+
+
+class TaskQueueTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        _task_calls.clear()
+
+    def run_worker(self, *args):
+        out = io.StringIO()
+        call_command('run_worker', '--once', '--no-schedule', *args, stdout=out)
+        return out.getvalue()
+
+    def test_worker_runs_due_tasks_and_records_timing(self):
+        done = _record_task.delay(value=1)
+        later = taskqueue.enqueue('tests.record', value=2, run_at=timezone.now() + timedelta(hours=1))
+        self.assertIn('ran 1 tasks', self.run_worker())
+        self.assertEqual(_task_calls, [1])
+        done.refresh_from_db()
+        self.assertEqual((done.status, done.attempts, done.locked_by), ('done', 1, ''))
+        self.assertIsNotNone(done.duration)
+        self.assertEqual(Task.objects.get(pk=later.pk).status, 'queued')
+
+    def test_failures_back_off_then_give_up(self):
+        job = _record_task.delay(value='x', fail=True)
+        for attempt in range(1, 4):
+            self.run_worker()
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            if attempt < 3:
+                self.assertEqual(job.status, 'queued')
+                delay = (job.run_at - timezone.now()).total_seconds()
+                self.assertAlmostEqual(delay, 10 * 2 ** (attempt - 1), delta=10 * 2 ** (attempt - 1) * 0.25)
+                Task.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertEqual(len(_task_calls), 3)
+
+    def test_claims_are_exclusive_and_expired_leases_are_reclaimed(self):
+        job = _record_task.delay(value=1)
+        self.assertEqual([t.pk for t in taskqueue.claim('a', 5)], [job.pk])
+        self.assertEqual(taskqueue.claim('b', 5), [])
+        later = timezone.now() + timedelta(seconds=301)
+        reclaimed = taskqueue.claim('b', 5, now=later)
+        self.assertEqual([(t.pk, t.locked_by, t.attempts) for t in reclaimed], [(job.pk, 'b', 2)])
+        taskqueue.execute(reclaimed[0])
+        self.assertEqual(Task.objects.get(pk=job.pk).status, 'done')
+
+    @override_settings(FINANCE_TASK_SCHEDULES={'finance.reconcile_balances': None})
+    def test_periodic_tasks_are_enqueued_once_per_slot(self):
+        now = timezone.now()
+        created = taskqueue.enqueue_due_schedules(now)
+        self.assertEqual(created, len(taskqueue.schedules()))
+        self.assertEqual(taskqueue.enqueue_due_schedules(now), 0)
+        self.assertFalse(Task.objects.filter(name='finance.reconcile_balances').exists())
+        self.assertTrue(Task.objects.filter(name='finance.snapshot_balances').exists())
+
+    def test_delete_account_purges_in_background(self):
+        acc = Account.objects.create(user=self.user, name='Main', type='checking', balance=0)
+        Transaction.objects.create(user=self.user, account=acc, direction='out', amount=Decimal('5.00'),
+                                   currency='USD', txn_time=timezone.now())
+        res = self.client.delete('/api/delete-account/')
+        self.assertEqual(res.status_code, 202)
+        self.assertTrue(Account.objects.filter(user=self.user).exists())
+        self.run_worker()
+        self.assertEqual(Task.objects.get(pk=res.data['task']).status, 'done')
+        self.assertFalse(Account.objects.filter(user=self.user).exists())
+        self.assertFalse(Transaction.objects.filter(user=self.user).exists())
+
+    @override_settings(FINANCE_TASKS_EAGER=True)
+    def test_eager_mode_runs_inline(self):
+        job = _record_task.delay(value=7)
+        self.assertEqual((job.status, _task_calls), ('done', [7]))
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_metrics_include_task_stats(self):
+        _record_task.delay(value=1)
+        self.run_worker()
+        body = APIClient().get('/api/metrics/', HTTP_X_METRICS_TOKEN='scrape-me').content.decode()
+        self.assertIn('finance_tasks{name="tests.record",status="done"} 1', body)
+        self.assertIn('finance_task_duration_seconds_count{name="tests.record"} 1', body)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every endpoint/filter combination over a seeded database; fail on scans or weak index use."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_users(4, accounts=2, categories=6, budgets=4, prefix='plans')
+        seed_transactions(seeded, 8000)
+        cls.user = User.objects.get(pk=seeded[0].user_id)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_endpoints_use_indexes(self):
+        report = audit_plans(self.user)
+        self.assertGreater(report.statements, 40)
+        self.assertEqual([(f.case, f.kind, f.detail) for f in report.findings], [])
+
+    def test_advisor_flags_scans_and_weak_searches(self):
+        qs = Transaction.objects.filter(amount__gte=Decimal('1.00'))
+        sql, params = qs.query.sql_with_params()
+        self.assertEqual(full_scans(sql, explain(sql, params))[0][0], 'finance_transaction')
+        plan = ['SEARCH finance_transaction USING INDEX finance_tra_user_id_b058b8_idx (user_id=?)']
+        self.assertEqual(weak_searches('', plan, ('user_id', 'direction')), plan)
+        self.assertEqual(weak_searches('', plan, ('user_id',)), [])
+
+    def test_date_filters_keep_local_date_semantics(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.credentials(HTTP_X_MOBILE_API_KEY=settings.MOBILE_API_KEY)
+        day = timezone.localdate(Transaction.objects.filter(user=self.user).latest('txn_time').txn_time)
+        start = day - timedelta(days=20)
+        with timezone.override('America/New_York'):
+            res = client.get('/api/transactions/', {
+                'txn_time__date__gte': start.isoformat(), 'txn_time__date__lte': day.isoformat(), 'page_size': 1,
+            })
+            expected = Transaction.objects.filter(
+                user=self.user, txn_time__date__gte=start, txn_time__date__lte=day,
+            ).count()
+            self.assertEqual(res.data['count'], expected)
+            res = client.get('/api/transactions/', {'txn_time__date': day.isoformat()})
+            self.assertEqual(res.data['count'], Transaction.objects.filter(user=self.user, txn_time__date=day).count())
+
+
+class IdempotencyKeyTests(FinanceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = Account.objects.create(user=self.user, name='Main', type='checking', balance=0)
+        self.payload = {'account': self.account.pk, 'direction': 'out', 'amount': '12.50',
+                        'txn_time': '2025-03-01T10:00:00Z', 'description': 'Lunch'}
+
+    def post(self, key, payload=None):
+        return self.client.post('/api/transactions/', payload or self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed_without_running_the_write_again(self):
+        first = self.post('k-1')
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.post('k-1')
+        self.assertEqual((again.status_code, again['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(json.loads(again.content), json.loads(first.content))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(AuditLog.objects.filter(model_name='Transaction').count(), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('-12.50'))
+        touched = [q['sql'] for q in ctx.captured_queries if 'finance_useractivity' not in q['sql']]
+        self.assertEqual(len(touched), 1)
+        self.assertIn('finance_idempotencykey', touched[0])
+
+    def test_replay_keeps_possible_duplicates(self):
+        self.client.post('/api/transactions/', self.payload, format='json')
+        first = self.post('k-dup')
+        self.assertEqual(len(first.data['possible_duplicates']), 1)
+        again = self.post('k-dup')
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.data['possible_duplicates'], first.data['possible_duplicates'])
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.post('k-2')
+        res = self.post('k-2', {**self.payload, 'amount': '99.00'})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+
+    def test_failed_requests_are_not_stored(self):
+        res = self.post('k-3', {**self.payload, 'amount': '-1'})
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post('k-3').status_code, 201)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post('/api/transactions/', self.payload, format='json')
+        self.client.post('/api/transactions/', self.payload, format='json')
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL_SECONDS=60)
+    def test_expired_keys_run_again_and_are_pruned(self):
+        self.post('k-4')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.post('k-4'))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('run_worker', '--once', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_are_scoped_per_user_and_cover_deletes(self):
+        txn = self.post('shared').data
+        other = User.objects.create_user(username='o@example.com', password='secret123')
+        self.client.force_authenticate(other)
+        acc = Account.objects.create(user=other, name='Other', type='checking', balance=0)
+        self.assertEqual(self.post('shared', {**self.payload, 'account': acc.pk}).status_code, 201)
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            res = self.client.delete(f"/api/transactions/{txn['id']}/", HTTP_IDEMPOTENCY_KEY='del-1')
+            self.assertEqual(res.status_code, 204)
+
+
+@override_settings(EVENTS_BACKEND={'BACKEND': 'local'})
+class EventStreamTests(TransactionTestCase):
+    """TransactionTestCase: events are published on commit, and the stream runs on the test's event loop."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='s@example.com', password='secret123')
+        self.account = Account.objects.create(user=self.user, name='Checking', type='checking', balance=0)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        today = timezone.localdate()
+        self.budget = Budget.objects.create(user=self.user, category=self.food, start_date=today.replace(day=1),
+                                            end_date=today + timedelta(days=1), limit_amount=300)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}',
+                        'X-Mobile-API-Key': settings.MOBILE_API_KEY}
+
+    def spend(self, amount):
+        return Transaction.objects.create(user=self.user, account=self.account, category=self.food, direction='out',
+                                          amount=Decimal(amount), txn_time=timezone.now())
+
+    @staticmethod
+    def parse(frame):
+        fields = dict(line.split(': ', 1) for line in frame.decode().strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+    async def test_stream_pushes_balance_transaction_and_budget_events(self):
+        response = await self.async_client.get('/api/events/', headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        txn = await sync_to_async(self.spend)('12.50')
+        got = [self.parse(await asyncio.wait_for(anext(stream), 2)) for _ in range(3)]
+        self.assertEqual(got, [
+            ('balance', {'type': 'balance', 'account': self.account.pk, 'delta': '-12.50'}),
+            ('transaction', {'type': 'transaction', 'action': 'created', 'id': txn.pk, 'account': self.account.pk,
+                             'direction': 'out', 'amount': '12.50', 'txn_time': txn.txn_time.isoformat()}),
+            ('budget', {'type': 'budget', 'budget': self.budget.pk, 'spent_delta': '12.50'}),
+        ])
+        await stream.aclose()
+
+    async def test_stream_requires_auth(self):
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = self.client.get('/api/events/', headers=self.headers)
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(events.hub.has_subscribers(self.user.pk))
+
+    def test_no_work_without_streams_and_overflow_resyncs(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.spend('1.00')
+        self.assertFalse(any('finance_budget' in q['sql'] for q in ctx.captured_queries))
+
+        async def overflow():
+            sub = events.hub.subscribe(self.user.pk)
+            try:
+                for i in range(sub.queue.maxsize + 1):
+                    sub.deliver({'type': 'balance', 'n': i})
+                return [sub.queue.get_nowait() for _ in range(sub.queue.qsize())]
+            finally:
+                events.hub.unsubscribe(sub)
+
+        self.assertEqual(asyncio.run(overflow()), [events.RESYNC])
+        self.assertFalse(events.hub.has_subscribers(self.user.pk))
+
+    def test_sqlite_backend_fans_out_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = events.SQLiteBackend({'PATH': Path(tmp) / 'events.sqlite3'})
+            backend.poll_interval = 0.01
+
+            async def roundtrip():
+                sub = events.hub.subscribe(self.user.pk)
+                try:
+                    backend.start()
+                    await asyncio.sleep(0.05)  # poller has taken its starting position
+                    await sync_to_async(backend.publish)(self.user.pk, {'type': 'account', 'id': 1})
+                    return await asyncio.wait_for(sub.queue.get(), 2)
+                finally:
+                    events.hub.unsubscribe(sub)
+
+            self.assertEqual(asyncio.run(roundtrip()), {'type': 'account', 'id': 1})
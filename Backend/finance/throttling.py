@@ -0,0 +1,180 @@
+"""Token-bucket throttles whose state is shared by every worker process.
+
+DRF's ``SimpleRateThrottle`` keeps a timestamp list per client in the (usually
+per-process) cache and rewrites it on every request. Here each client has one
+bucket ``(tokens, updated)`` held in a shared store, and a check is a single
+atomic refill-and-take.
+
+Stores (``THROTTLE_STORE`` setting):
+
+* ``{'BACKEND': 'sqlite', 'PATH': ...}`` - a small SQLite file in WAL mode that all
+  workers on the host open; each check is one ``INSERT .. ON CONFLICT DO UPDATE ..
+  RETURNING`` statement, so it is atomic without application-level locking.
+* ``{'BACKEND': 'cache', 'ALIAS': 'default'}`` - any Django cache. Only as shared as
+  the cache backend, and read-modify-write, so concurrent checks may over-admit slightly.
+
+Per-endpoint rates use DRF's own convention: set ``throttle_scope`` on the view and
+add the scope to ``DEFAULT_THROTTLE_RATES``.
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'100/min'`` -> ``(capacity, tokens_per_second)``; ``None`` disables the throttle."""
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / _PERIODS[period[0]]
+
+
+class SQLiteBucketStore:
+    _SQL = (
+        "INSERT INTO throttle_bucket (key, tokens, updated, allowed) VALUES (?1, ?2 - 1, ?4, 1) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "tokens = min(?2, tokens + (?4 - updated) * ?3) - (min(?2, tokens + (?4 - updated) * ?3) >= 1), "
+        "allowed = (min(?2, tokens + (?4 - updated) * ?3) >= 1), "
+        "updated = ?4 "
+        "RETURNING tokens, allowed"
+    )
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS throttle_bucket '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL)'
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, now):
+        tokens, allowed = self._conn().execute(self._SQL, (key, capacity, rate, now)).fetchone()
+        return bool(allowed), tokens
+
+    def clear(self):
+        self._conn().execute('DELETE FROM throttle_bucket')
+
+
+class CacheBucketStore:
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, rate, now):
+        tokens, updated = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Keep the bucket around only as long as it takes to refill completely.
+        self.cache.set(key, (tokens, now), timeout=int(capacity / rate) + 1)
+        return allowed, tokens
+
+    def clear(self):
+        self.cache.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                conf = getattr(settings, 'THROTTLE_STORE', {'BACKEND': 'cache'})
+                backend = conf.get('BACKEND', 'cache')
+                if backend == 'sqlite':
+                    _store = SQLiteBucketStore(conf['PATH'])
+                elif backend == 'cache':
+                    _store = CacheBucketStore(conf.get('ALIAS', 'default'))
+                else:
+                    raise ImproperlyConfigured(f'Unknown THROTTLE_STORE backend {backend!r}')
+    return _store
+
+
+@receiver(setting_changed)
+def reset_bucket_store(*, setting=None, **kwargs):
+    """Drop the cached store when THROTTLE_STORE changes (override_settings in tests)."""
+    global _store
+    if setting in (None, 'THROTTLE_STORE'):
+        with _store_lock:
+            _store = None
+
+
+class TokenBucketThrottle(BaseThrottle, metaclass=ABCMeta):
+    """Base class; subclasses provide ``scope`` and ``get_ident_key``."""
+
+    scope = None
+    timer = time.time
+
+    @abstractmethod
+    def get_ident_key(self, request, view):
+        """Bucket identity for this request (user id, client IP); ``None`` leaves it unthrottled."""
+
+    def get_scope(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        return scope if scope and scope in rates else self.scope
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        parsed = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+        if parsed is None:
+            return True
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        self.capacity, self.rate = parsed
+        allowed, self.tokens = get_bucket_store().take(f'tb:{scope}:{ident}', self.capacity, self.rate, self.timer())
+        return allowed
+
+    def wait(self):
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Authenticated users by id; anonymous requests fall back to client IP."""
+
+    scope = 'user'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    """Anonymous requests by client IP; authenticated users are not limited here."""
+
+    scope = 'anon'
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
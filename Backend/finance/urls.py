@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import (
+    AsyncBudgetProgressView, AsyncCategorySpendingReportView, AsyncSummaryView, EventStreamView,
+)
 from .views import (
-    HealthView, ProfileView, PreferencesView, ExportDataView, DeleteAccountView,
-    TokenPairView, TokenRefresh, RegisterView,
+    HealthView, MetricsView, ProfileView, PreferencesView, ExportDataView, DeleteAccountView,
+    TokenPairView, TokenRefresh, RegisterView, BulkProvisionView,
     AccountViewSet, TransactionViewSet, CategoryViewSet, BudgetViewSet,
-    SummaryView, CategorySpendingReportView, BudgetProgressView,
+    SummaryView, DashboardView, CategorySpendingReportView, BudgetProgressView, NetWorthReportView,
+    MerchantReportView, StatementListView, StatementDetailView,
 )
 
 router = DefaultRouter()
@@ -16,9 +20,11 @@ router.register(r'budgets', BudgetViewSet, basename='budget')
 
 urlpatterns = [
     path("health/", HealthView.as_view(), name="finance-health"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     path("auth/token/", TokenPairView.as_view(), name="token_obtain_pair"),
     path("auth/token/refresh/", TokenRefresh.as_view(), name="token_refresh"),
     path("auth/register/", RegisterView.as_view(), name="register"),
+    path("auth/provision/", BulkProvisionView.as_view(), name="bulk-provision"),
 
     path("profile/", ProfileView.as_view(), name="profile"),
     path("preferences/", PreferencesView.as_view(), name="preferences"),
@@ -26,6 +32,19 @@ urlpatterns = [
     path("delete-account/", DeleteAccountView.as_view(), name="delete-account"),
     path('', include(router.urls)),
     path('summary/', SummaryView.as_view(), name='summary'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('reports/category-spending/', CategorySpendingReportView.as_view(), name='category-spending'),
     path('reports/budget-progress/', BudgetProgressView.as_view(), name='budget-progress'),
+    path('reports/net-worth/', NetWorthReportView.as_view(), name='net-worth'),
+    path('reports/merchants/', MerchantReportView.as_view(), name='merchant-report'),
+    path('statements/', StatementListView.as_view(), name='statement-list'),
+    path('statements/<str:month>/', StatementDetailView.as_view(), name='statement-detail'),
+
+    # Async variants of the dashboard reads, for ASGI deployments.
+    path('async/summary/', AsyncSummaryView.as_view(), name='async-summary'),
+    path('async/reports/category-spending/', AsyncCategorySpendingReportView.as_view(), name='async-category-spending'),
+    path('async/reports/budget-progress/', AsyncBudgetProgressView.as_view(), name='async-budget-progress'),
+
+    # Server-Sent Events stream of live changes; serve through ASGI.
+    path('events/', EventStreamView.as_view(), name='events'),
 ]
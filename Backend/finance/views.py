@@ -1,13 +1,21 @@
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from datetime import datetime, time, timedelta
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import generics, permissions, status, viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import UserProfile, UserActivity, Account, Category, Transaction, Budget, Goal, GoalContribution, Insight
+from .models import (
+    UserProfile, UserActivity, Account, Category, Transaction, Budget, Goal, GoalContribution, Insight, MonthlyStatement,
+)
 from .serializers import (
     UserProfileSerializer,
     PreferencesSerializer,
@@ -15,9 +23,24 @@ from .serializers import (
     CategorySerializer,
     TransactionSerializer,
     BudgetSerializer,
+    RowEncoder,
+    TransactionImportSerializer,
+)
+from .filters import TransactionFilter
+from .idempotency import IdempotentWriteMixin
+from .permissions import HasMobileApiKey, HasMetricsToken, IsOwnerOnly, IsAuthenticatedOrOptions
+from .metrics import registry as metrics_registry
+from .renderers import to_columnar
+from . import duplicates, events, ledger, merchants, taskqueue
+from .categorizer import get_categorizer
+from .snapshots import net_worth_series
+from .tasks import purge_user_data
+from .routers import PRIMARY_DB, ReplicaReadMixin, UserShardMixin, db_for_user, use_primary
+from .reports import (
+    DASHBOARD_SECTIONS, budget_progress_row, budget_spent, budgets_queryset, category_spending_queryset,
+    dashboard_parts, summary_parts, summary_payload,
 )
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .permissions import HasMobileApiKey, IsOwnerOnly, IsAuthenticatedOrOptions
+from .provisioning import DEFAULT_ACCOUNT, DEFAULT_CATEGORIES, parse_signup, provision_users, register_user, token_pair
 import json
 
 
@@ -32,6 +55,16 @@ class HealthView(APIView):
         return Response({"status": "ok"})
 
 
+class MetricsView(APIView):
+    """Prometheus text exposition of this worker's request and SQL metrics, plus background task stats."""
+    permission_classes = [HasMetricsToken]
+    throttle_classes = []
+
+    def get(self, request):
+        body = metrics_registry.render_prometheus() + taskqueue.render_prometheus()
+        return HttpResponse(body, content_type='text/plain; version=0.0.4')
+
+
 class ProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
@@ -57,7 +90,7 @@ class PreferencesView(APIView):
         return Response({"preferences": profile.preferences})
 
 
-class ExportDataView(APIView):
+class ExportDataView(UserShardMixin, ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
 
     def get(self, request):
@@ -81,19 +114,11 @@ class ExportDataView(APIView):
 class DeleteAccountView(APIView):
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
 
-    @transaction.atomic
     def delete(self, request):
-        # Hard-delete all user data (app data); you may want to anonymize instead
-        user = request.user
-        UserProfile.objects.filter(user=user).delete()
-        Account.objects.filter(user=user).delete()
-        Category.objects.filter(user=user).delete()
-        Budget.objects.filter(user=user).delete()
-        Transaction.objects.filter(user=user).delete()
-        Goal.objects.filter(user=user).delete()
-        Insight.objects.filter(user=user).delete()
-        # User record remains (Firebase auth) — adjust as needed
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        # Hard-deletes all app data in the background (finance.tasks.purge_user_data);
+        # the user record remains (Firebase auth).
+        job = purge_user_data.delay(user_id=request.user.pk)
+        return Response({'task': job.pk, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
 
 
 class TokenPairView(TokenObtainPairView):
@@ -113,48 +138,64 @@ class RegisterView(APIView):
     permission_classes = [HasMobileApiKey]
 
     def post(self, request):
-        email = request.data.get('email', '').strip().lower()
-        password = request.data.get('password', '')
-        monthly_income = request.data.get('monthly_income', 0)
-        preferences = request.data.get('preferences', {})
-        if not email or '@' not in email:
-            return Response({'detail': 'Valid email required.'}, status=400)
-        if not password or len(password) < 6:
-            return Response({'detail': 'Password must be at least 6 chars.'}, status=400)
-        username = email  # using email as username
-        if User.objects.filter(username=username).exists():
+        signup, error = parse_signup(request.data)
+        if error:
+            return Response({'detail': error}, status=400)
+        try:
+            user, profile = register_user(signup)
+        except IntegrityError:
             return Response({'detail': 'User already exists.'}, status=400)
-        user = User.objects.create_user(username=username, email=email, password=password)
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        if monthly_income:
-            profile.monthly_income = monthly_income or 0
-        if isinstance(preferences, dict):
-            profile.preferences = preferences
-        profile.save()
-        # Seed default account & categories if none
-        if not Account.objects.filter(user=user).exists():
-            Account.objects.create(user=user, name='Checking', type='checking', balance=0)
-        if not Category.objects.filter(user=user).exists():
-            defaults = [
-                ('Groceries', 'expense'),
-                ('Transport', 'expense'),
-                ('Salary', 'income'),
-            ]
-            for name, ctype in defaults:
-                Category.objects.create(user=user, name=name, type=ctype, is_custom=False)
-        token_serializer = TokenObtainPairSerializer(data={'username': username, 'password': password})
-        token_serializer.is_valid(raise_exception=True)
-        data = token_serializer.validated_data
+        data = token_pair(user)
         data['profile'] = UserProfileSerializer(profile).data
         return Response(data, status=201)
 
 
+class BulkProvisionView(APIView):
+    """Create many users at once for partner onboarding (staff only).
+
+    Body: {"users": [{"email", "password", "monthly_income"?, "preferences"?}, ...]}
+    Returns created users with token pairs and per-entry errors.
+    """
+    permission_classes = [permissions.IsAdminUser, HasMobileApiKey]
+    max_batch = 1000
+
+    def post(self, request):
+        entries = request.data.get('users')
+        if not isinstance(entries, list) or not entries:
+            return Response({'detail': 'users must be a non-empty list.'}, status=400)
+        if len(entries) > self.max_batch:
+            return Response({'detail': f'At most {self.max_batch} users per request.'}, status=400)
+        signups, positions, errors = [], [], []
+        for i, entry in enumerate(entries):
+            entry = entry if isinstance(entry, dict) else {}
+            signup, error = parse_signup(entry)
+            if error:
+                errors.append({'index': i, 'email': entry.get('email'), 'detail': error})
+            else:
+                signups.append(signup)
+                positions.append(i)
+        try:
+            # Threads, not the process pool: a web worker must not fork.
+            result = provision_users(signups, threads=True)
+        except IntegrityError:
+            return Response({'detail': 'Could not create users; retry the request.'}, status=status.HTTP_409_CONFLICT)
+        for err in result.errors:
+            err['index'] = positions[err['index']]
+        created = [
+            {'id': user.id, 'email': user.email, **token_pair(user)}
+            for user, _ in result.created
+        ]
+        return Response({'created': created, 'errors': errors + result.errors}, status=201 if created else 400)
+
+
 def log_activity(get_response):
     def middleware(request):
         response = get_response(request)
+        user = request.user if getattr(request, 'user', None) and request.user.is_authenticated else None
         try:
-            UserActivity.objects.create(
-                user=request.user if getattr(request, 'user', None) and request.user.is_authenticated else None,
+            # The view has unbound its shard by now, so route to the user's explicitly.
+            UserActivity.objects.using(db_for_user(user.pk) if user else PRIMARY_DB).create(
+                user=user,
                 path=request.path[:255],
                 method=request.method,
                 ip=request.META.get('REMOTE_ADDR'),
@@ -164,7 +205,93 @@ def log_activity(get_response):
             pass
         return response
     return middleware
-class AccountViewSet(viewsets.ModelViewSet):
+class SparseFieldsetMixin:
+    """``?fields=a,b`` / ``?exclude=c`` on reads.
+
+    Trims the serializer (see ``SparseFieldsMixin``) and pushes the matching column
+    list into the queryset with ``.only()`` so dropped columns are never fetched.
+    Writes always use the full serializer.
+    """
+
+    def sparse_params(self):
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return None, None
+        params = self.request.query_params
+        fields = [f for f in params.get('fields', '').split(',') if f] or None
+        exclude = [f for f in params.get('exclude', '').split(',') if f] or None
+        return fields, exclude
+
+    def get_serializer(self, *args, **kwargs):
+        fields, exclude = self.sparse_params()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if exclude is not None:
+            kwargs.setdefault('exclude', exclude)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, exclude = self.sparse_params()
+        if fields is None and exclude is None:
+            return queryset
+        columns = self._sparse_columns(queryset.model, self.get_serializer().fields.values())
+        return queryset.only(*columns)
+
+    @staticmethod
+    def _sparse_columns(model, serializer_fields):
+        concrete = {f.name for f in model._meta.concrete_fields}
+        columns = {model._meta.pk.name}
+        for field in serializer_fields:
+            source = field.source.split('.')[0]
+            if source in concrete:
+                columns.add(source)
+        return columns
+
+
+class ColumnarListMixin:
+    """Opt-in ``?shape=columnar`` list responses: one array per field instead of one object per row.
+
+    Pagination keys are unchanged; only ``results`` switches shape.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('shape') != 'columnar':
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page if page is not None else queryset, many=True)
+        columns = to_columnar(serializer.data, [f.field_name for f in serializer.child._readable_fields])
+        if page is not None:
+            return self.get_paginated_response(columns)
+        return Response(columns)
+
+
+class ValuesListMixin:
+    """List reads straight from ``values_list()`` rows, encoded by ``RowEncoder``.
+
+    Skips model instantiation and DRF's field-by-field ``to_representation``;
+    the response is the same document (``shape=columnar`` included). Serializers
+    the encoder cannot mirror take the regular path.
+    """
+
+    def list(self, request, *args, **kwargs):
+        encoder = RowEncoder.for_serializer(self.get_serializer())
+        if encoder is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*encoder.columns)
+        page = self.paginate_queryset(queryset)
+        rows = encoder.encode(page if page is not None else queryset)
+        if request.query_params.get('shape') == 'columnar':
+            rows = to_columnar(rows, encoder.names)
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
+
+class AccountViewSet(
+    IdempotentWriteMixin, UserShardMixin, ReplicaReadMixin, SparseFieldsetMixin, viewsets.ModelViewSet,
+):
+    replica_actions = ('list', 'retrieve')
     serializer_class = AccountSerializer
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -177,30 +304,80 @@ class AccountViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         # Auto-seed a default account for legacy users that pre-date seeding or who deleted all accounts.
-        if not Account.objects.filter(user=request.user).exists():
-            Account.objects.create(user=request.user, name='Checking', type='checking', balance=0)
+        with use_primary():
+            if not Account.objects.filter(user=request.user).exists():
+                name, acc_type = DEFAULT_ACCOUNT
+                Account.objects.create(user=request.user, name=name, type=acc_type, balance=0)
         return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        events.account_changed(serializer.save(user=self.request.user), 'created')
+
+    def perform_update(self, serializer):
+        events.account_changed(serializer.save(), 'updated')
 
     def perform_destroy(self, instance):
         # deleting an account cascades transactions; ensure integrity already handled by models
+        events.account_changed(instance, 'deleted')
         instance.delete()
 
+    @action(detail=True, methods=['get'])
+    def balance(self, request, pk=None):
+        """Balance as of ``?at=`` (date or datetime, default now) from the stored running balance."""
+        account = self.get_object()
+        at = _parse_bound(request.query_params.get('at'), end_of_day=True) or timezone.now()
+        return Response({'account': account.pk, 'at': at, 'balance': ledger.balance_at(account.pk, at)})
+
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Opening/closing balance and rows with running balances for ``?start=`` .. ``?end=`` (inclusive)."""
+        account = self.get_object()
+        end = _parse_bound(request.query_params.get('end'), end_of_day=True) or timezone.now()
+        start = _parse_bound(request.query_params.get('start')) or end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if start >= end:
+            raise ValidationError({'start': 'start must be before end.'})
+        return Response({'account': account.pk, 'start': start, 'end': end, **ledger.statement(account.pk, start, end)})
+
+
+def _parse_bound(value, end_of_day=False):
+    """Parse an ISO date or datetime query parameter; a bare date covers the whole day."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({'detail': f'Invalid date: {value!r}'})
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class PossibleDuplicatesMixin:
+    """Create responses also carry ``possible_duplicates``: ids of stored transactions the new one looks like.
+
+    ``perform_create`` fills ``self.possible_duplicates`` (one probe, see
+    ``finance.duplicates``). Listed after ``IdempotentWriteMixin`` so the stored
+    response, and therefore a replay, includes them.
+    """
+
+    def create(self, request, *args, **kwargs):
+        self.possible_duplicates = []
+        response = super().create(request, *args, **kwargs)
+        response.data['possible_duplicates'] = self.possible_duplicates
+        return response
+
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(
+    IdempotentWriteMixin, PossibleDuplicatesMixin, UserShardMixin, ReplicaReadMixin, SparseFieldsetMixin, ValuesListMixin, ColumnarListMixin,
+    viewsets.ModelViewSet,
+):
+    replica_actions = ('list', 'retrieve')
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = {
-        'direction': ['exact'],
-        'txn_time': ['date', 'date__gte', 'date__lte'],
-        'amount': ['gte', 'lte','exact'],
-        'account': ['exact'],
-        'category': ['exact'],
-        'is_pending': ['exact'],
-    }
+    filterset_class = TransactionFilter
     search_fields = ['description', 'merchant', 'external_id']
     ordering_fields = ['txn_time', 'amount', 'created_at']
 
@@ -222,20 +399,80 @@ class TransactionViewSet(viewsets.ModelViewSet):
                     type='checking',
                     balance=0,
                 )
-        serializer.save(user=self.request.user, account=account)
+        data = serializer.validated_data
+        if data.get('direction') == 'transfer':
+            try:
+                out_leg, _ = ledger.create_transfer(
+                    self.request.user, account, data['to_account'], data['amount'], data['txn_time'],
+                    description=data.get('description', ''), is_pending=data.get('is_pending', False),
+                )
+            except DjangoValidationError as exc:
+                raise ValidationError(exc.message_dict)
+            serializer.instance = out_leg
+            return
+        extra = {}
+        draft = Transaction(user=self.request.user, account=account, direction=data.get('direction', 'out'),
+                            amount=data.get('amount'), txn_time=data.get('txn_time'),
+                            merchant=data.get('merchant', ''), description=data.get('description', ''))
+        self.possible_duplicates = duplicates.find_duplicates(draft)
+        if data.get('category') is None and draft.direction in ('in', 'out'):
+            category_id = get_categorizer().categorize(self.request.user.pk, [draft])[0]
+            if category_id is not None:
+                extra = {'category_id': category_id, 'auto_categorized': True}
+        serializer.save(user=self.request.user, account=account, **extra)
 
     def perform_update(self, serializer):
         # Reconcile balances: remove old txn effect then apply new
         old = Transaction.objects.get(pk=self.get_object().pk)
-        updated = serializer.save(user=self.request.user)
-        from .signals import _apply_transaction_to_account
-        if old.account_id:
-            _apply_transaction_to_account(old.account, old, sign=-1)
-        if updated.account_id:
-            _apply_transaction_to_account(updated.account, updated, sign=1)
+        # Any category the user sends is theirs, and becomes training data.
+        extra = {'auto_categorized': False} if 'category' in serializer.validated_data else {}
+        with transaction.atomic(using=old._state.db):
+            updated = serializer.save(user=self.request.user, **extra)
+            from .signals import _apply_transaction_to_account
+            if old.account_id:
+                _apply_transaction_to_account(old.account, old, sign=-1)
+            if updated.account_id:
+                _apply_transaction_to_account(updated.account, updated, sign=1)
+            ledger.record_update(old, updated)
+            merchants.record_spend(old, sign=-1)
+            merchants.record_spend(updated, sign=1)
+            events.transaction_changed(updated, 'updated')
+            events.budget_spent_changed(old, sign=-1)
+            events.budget_spent_changed(updated, sign=1)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_rows(self, request):
+        """Import statement rows into one account; likely duplicates are reported, not inserted.
+
+        Body: ``{"account": id, "transactions": [{direction, amount, txn_time, ...}, ...]}``,
+        at most 500 rows. Returns ``created`` ids and ``duplicates`` as ``{"index", "existing"}`` pairs.
+        Each inserted row takes the full save path (later rows' running balances,
+        merchant spend, audit log, events) inside one transaction, so a request
+        costs a few queries per row; split large statements into several requests.
+        """
+        serializer = TransactionImportSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        account = serializer.validated_data['account']
+        rows = []
+        for row in serializer.validated_data['transactions']:
+            category_id = row.pop('category', None)
+            rows.append(Transaction(currency=account.currency, category_id=category_id, **row))
+        uncategorized = [t for t in rows if t.category_id is None]
+        if uncategorized:
+            for txn, category_id in zip(uncategorized, get_categorizer().categorize(request.user.pk, uncategorized)):
+                if category_id is not None:
+                    txn.category_id, txn.auto_categorized = category_id, True
+        result = duplicates.import_transactions(request.user, account, rows)
+        return Response({
+            'created': [t.pk for t in result.created],
+            'duplicates': [{'index': i, 'existing': ids} for i, ids in result.duplicates],
+        }, status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    IdempotentWriteMixin, UserShardMixin, ReplicaReadMixin, SparseFieldsetMixin, viewsets.ModelViewSet,
+):
+    replica_actions = ('list', 'retrieve')
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -248,21 +485,22 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         # Auto-seed a basic set of categories for legacy users if none exist.
-        if not Category.objects.filter(user=request.user).exists():
-            defaults = [
-                ('Groceries', 'expense'),
-                ('Transport', 'expense'),
-                ('Salary', 'income'),
-            ]
-            for name, ctype in defaults:
-                Category.objects.create(user=request.user, name=name, type=ctype, is_custom=False)
+        with use_primary():
+            if not Category.objects.filter(user=request.user).exists():
+                Category.objects.bulk_create([
+                    Category(user=request.user, name=name, type=ctype, is_custom=False)
+                    for name, ctype in DEFAULT_CATEGORIES
+                ])
         return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class BudgetViewSet(viewsets.ModelViewSet):
+class BudgetViewSet(
+    IdempotentWriteMixin, UserShardMixin, ReplicaReadMixin, SparseFieldsetMixin, viewsets.ModelViewSet,
+):
+    replica_actions = ('list', 'retrieve')
     serializer_class = BudgetSerializer
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -277,67 +515,156 @@ class BudgetViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
-class SummaryView(APIView):
+class SummaryView(UserShardMixin, ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
 
     def get(self, request):
-        user = request.user
-        accounts = Account.objects.filter(user=user)
-        balances = accounts.values_list('balance', flat=True)
-        total_balance = sum(balances) if balances else 0
-        income = Transaction.objects.filter(user=user, direction='in').aggregate(total=models.Sum('amount'))['total'] or 0
-        expense = Transaction.objects.filter(user=user, direction='out').aggregate(total=models.Sum('amount'))['total'] or 0
-        net = (income - expense)
-        return Response({
-            'total_balance': total_balance,
-            'income_total': income,
-            'expense_total': expense,
-            'net_cashflow': net,
-        })
+        parts = summary_parts(request.user)
+        return Response(summary_payload(**{name: query() for name, query in parts.items()}))
 
 
-class CategorySpendingReportView(APIView):
+class CategorySpendingReportView(UserShardMixin, ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
 
     def get(self, request):
-        user = request.user
         start = request.query_params.get('start')
         end = request.query_params.get('end')
-        qs = Transaction.objects.filter(user=user, direction='out')
-        if start:
-            qs = qs.filter(txn_time__date__gte=start)
-        if end:
-            qs = qs.filter(txn_time__date__lte=end)
-        data = qs.values('category__id','category__name').annotate(total=models.Sum('amount')).order_by('-total')
-        return Response(list(data))
+        try:
+            qs = category_spending_queryset(request.user, start, end)
+        except ValueError:
+            raise ValidationError({'detail': 'Dates must be YYYY-MM-DD.'})
+        return Response(list(qs))
 
 
-class BudgetProgressView(APIView):
+class BudgetProgressView(UserShardMixin, ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
 
     def get(self, request):
         user = request.user
         start = request.query_params.get('start')
         end = request.query_params.get('end')
-        budgets = Budget.objects.filter(user=user)
-        if start and end:
-            budgets = budgets.filter(start_date__lte=end, end_date__gte=start)
         results = []
-        for b in budgets.select_related('category'):
-            spent = Transaction.objects.filter(user=user, direction='out', category=b.category, txn_time__date__gte=b.start_date, txn_time__date__lte=b.end_date).aggregate(total=models.Sum('amount'))['total'] or 0
-            results.append({
-                'budget_id': b.id,
-                'category_id': b.category_id,
-                'category': b.category.name,
-                'period': b.period,
-                'start_date': b.start_date,
-                'end_date': b.end_date,
-                'limit_amount': b.limit_amount,
-                'spent': spent,
-                'remaining': b.limit_amount - spent,
-                'variance': b.limit_amount - spent,
-            })
+        for b in budgets_queryset(user, start, end):
+            results.append(budget_progress_row(b, budget_spent(user, b)))
         return Response(results)
+
+
+class DashboardView(UserShardMixin, ReplicaReadMixin, APIView):
+    """Home screen in one request: summary, accounts, top budgets, this month's spending, recent transactions.
+
+    ``?sections=`` picks a comma-separated subset; ``?recent=`` and ``?budgets=`` cap the lists.
+    Each part of ``dashboard_parts`` is one query, five with every section.
+    """
+    permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
+    max_rows = 50
+
+    def _limit(self, name, default):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: 'Must be an integer.'})
+        if not 1 <= value <= self.max_rows:
+            raise ValidationError({name: f'Must be between 1 and {self.max_rows}.'})
+        return value
+
+    def get(self, request):
+        raw = request.query_params.get('sections')
+        sections = [s for s in raw.split(',') if s] if raw else list(DASHBOARD_SECTIONS)
+        unknown = sorted(set(sections) - set(DASHBOARD_SECTIONS))
+        if unknown:
+            raise ValidationError({'sections': f"Unknown: {', '.join(unknown)}. Choose from {', '.join(DASHBOARD_SECTIONS)}."})
+        parts = dashboard_parts(request.user, sections, timezone.localdate(),
+                                recent=self._limit('recent', 10), top_budgets=self._limit('budgets', 5))
+        data = {name: query() for name, query in parts.items()}
+        payload = {}
+        if 'summary' in sections:
+            totals = data['totals']
+            payload['summary'] = summary_payload(
+                [a.balance for a in data['accounts']], totals['income'] or 0, totals['expense'] or 0,
+            )
+        if 'accounts' in sections:
+            payload['accounts'] = AccountSerializer(data['accounts'], many=True).data
+        if 'budgets' in sections:
+            payload['budgets'] = [budget_progress_row(b, b.spent) for b in data['budgets']]
+        if 'category_spending' in sections:
+            payload['category_spending'] = data['category_spending']
+        if 'recent_transactions' in sections:
+            payload['recent_transactions'] = TransactionSerializer(
+                data['recent_transactions'], many=True, context={'request': request},
+            ).data
+        return Response(payload)
+
+
+class NetWorthReportView(UserShardMixin, ReplicaReadMixin, APIView):
+    """Daily per-account balances and per-currency ``totals`` over ``?start=``..``?end=`` (dates), from snapshots.
+
+    ``total`` is the single currency's series, or null when the accounts hold several.
+    """
+    permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
+    max_days = 3660
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+            start = parse_date(params['start']) if params.get('start') else end - timedelta(days=29)
+            account_ids = [int(v) for v in params['accounts'].split(',') if v] if params.get('accounts') else None
+        except (TypeError, ValueError):
+            raise ValidationError({'detail': 'Invalid start, end or accounts parameter.'})
+        if start is None or end is None:
+            raise ValidationError({'detail': 'Dates must be YYYY-MM-DD.'})
+        if start > end or (end - start).days >= self.max_days:
+            raise ValidationError({'detail': f'Range must be 1..{self.max_days} days with start <= end.'})
+        return Response(net_worth_series(request.user, start, end, account_ids))
+
+
+class MerchantReportView(UserShardMixin, ReplicaReadMixin, APIView):
+    """Top expense merchants over ``?start=``..``?end=`` (dates, default last 30 days), ``?limit=`` rows."""
+    permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
+    max_limit = 100
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+            start = parse_date(params['start']) if params.get('start') else end - timedelta(days=29)
+            limit = int(params.get('limit', 10))
+        except (TypeError, ValueError):
+            raise ValidationError({'detail': 'Invalid start, end or limit parameter.'})
+        if start is None or end is None or start > end:
+            raise ValidationError({'detail': 'Dates must be YYYY-MM-DD with start <= end.'})
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({'limit': f'Must be between 1 and {self.max_limit}.'})
+        return Response(merchants.top_merchants(request.user, start, end, limit))
+
+
+class StatementListView(UserShardMixin, ReplicaReadMixin, APIView):
+    """Months with a stored statement (built nightly by ``finance.monthly_statements``), newest first."""
+    permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
+
+    def get(self, request):
+        rows = MonthlyStatement.objects.filter(user=request.user).values('month', 'transaction_count', 'created_at')
+        return Response([
+            {'month': f"{r['month']:%Y-%m}", 'transaction_count': r['transaction_count'], 'generated_at': r['created_at']}
+            for r in rows
+        ])
+
+
+class StatementDetailView(UserShardMixin, ReplicaReadMixin, APIView):
+    """The stored statement for ``<month>`` (``YYYY-MM``): accounts, categories, budgets, goals and totals."""
+    permission_classes = [IsAuthenticatedOrOptions, HasMobileApiKey]
+
+    def get(self, request, month):
+        from .statements import parse_month  # the batch builder stays out of worker startup
+        try:
+            first = parse_month(month)
+        except ValueError:
+            raise ValidationError({'month': 'Must be YYYY-MM.'})
+        row = MonthlyStatement.objects.filter(user=request.user, month=first).first()
+        if row is None:
+            raise NotFound('No statement for this month.')
+        return Response({'month': month, 'generated_at': row.created_at,
+                         'transaction_count': row.transaction_count, **row.data})
 from django.shortcuts import render
 
 # Create your views here.